@@ -1,9 +1,17 @@
 import streamlit as st
 from datetime import datetime
 import hh_api_integration_v2 as hh
-from bs4 import BeautifulSoup
+import metrics
+import resume_index
+import search_planner
+from vacancy_index import VacancyIndex
+from vacancy_snapshot import VacancyRefresher
+from hh_cache import get_watermark_store
 import math
-import streamlit.components.v1 as components
+import html
+import os
+import time
+import functools
 
 # --- Конфигурация страницы и Стили (сохранены из вашей версии) ---
 st.set_page_config(
@@ -63,14 +71,96 @@ def init_session_state():
 init_session_state()
 
 # --- Функции-помощники ---
+@st.cache_resource
+def get_vacancy_refresher():
+    """Один фоновый загрузчик вакансий на сервер, общий для всех сессий."""
+    return VacancyRefresher().start()
+
 def fetch_initial_data():
     if st.session_state.current_user is None:
         st.session_state.current_user = hh.get_current_user_info()
-    if not st.session_state.hh_active_vacancies and hh.get_access_token():
+    refresher = get_vacancy_refresher()
+    snapshot = refresher.snapshot
+    if snapshot.fetched_at is None and hh.get_access_token():
         with st.spinner("Загрузка активных вакансий..."):
-            managers = hh.get_managers()
-            if managers:
-                st.session_state.hh_active_vacancies = hh.get_active_vacancies([m['id'] for m in managers])
+            snapshot = refresher.wait_ready(timeout=120)
+        if refresher.last_error: st.error(f"Не удалось загрузить активные вакансии: {refresher.last_error}")
+    # Сессия всегда видит последнюю версию общего снимка
+    st.session_state.hh_active_vacancies = snapshot.vacancies
+
+RENDER_TIMINGS = os.getenv("HH_RENDER_TIMINGS") == "1"
+
+def timed(section):
+    """
+    Серверное время выполнения секции страницы: печатается при HH_RENDER_TIMINGS=1
+    и попадает в гистограмму render_duration_seconds при включённых метриках.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not RENDER_TIMINGS and not metrics.ENABLED: return func(*args, **kwargs)
+            started = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                elapsed = time.perf_counter() - started
+                metrics.observe("render_duration_seconds", elapsed, section=section)
+                if RENDER_TIMINGS: print(f"[render] {section}: {elapsed * 1000:.1f} ms")
+        return wrapper
+    return decorator
+
+@st.cache_resource
+def start_metrics_endpoint():
+    """Один эндпоинт /metrics на сервер (HH_METRICS=1, порт HH_METRICS_PORT)."""
+    return metrics.start_http_server()
+
+def _format_seconds(value):
+    if value is None: return "—"
+    return "> 30 с" if value == float("inf") else f"≤ {value * 1000:.0f} мс" if value < 1 else f"≤ {value:g} с"
+
+def render_metrics_panel():
+    """Отладочная панель в сайдбаре: задержки по эндпоинтам hh.ru, кэши и токены OpenAI."""
+    with st.sidebar.expander("🔧 Метрики", expanded=False):
+        statuses = metrics.REGISTRY.counters("hh_requests_total")
+        rows = []
+        for labels, histogram in sorted(metrics.REGISTRY.histograms("hh_request_duration_seconds").items()):
+            endpoint = dict(labels)["endpoint"]
+            errors = sum(count for status_labels, count in statuses.items()
+                         if dict(status_labels)["endpoint"] == endpoint and not dict(status_labels)["status"].startswith(("2", "3")))
+            rows.append({"эндпоинт": endpoint, "запросов": histogram.count, "p50": _format_seconds(histogram.quantile(0.5)),
+                         "p95": _format_seconds(histogram.quantile(0.95)), "не 2xx/3xx": errors})
+        if rows: st.table(rows)
+        else: st.caption("Запросов к hh.ru ещё не было.")
+
+        caches = {}
+        for labels, count in metrics.REGISTRY.counters("cache_requests_total").items():
+            labels = dict(labels)
+            caches.setdefault(labels["cache"], {})[labels["result"]] = count
+        for cache, results in sorted(caches.items()):
+            total = sum(results.values())
+            if not total: continue
+            st.caption(f"Кэш {cache}: {', '.join(f'{k} {v}' for k, v in sorted(results.items()))} (попаданий {results.get('hit', 0) / total:.0%})")
+
+        tokens = {dict(labels)["kind"]: count for labels, count in metrics.REGISTRY.counters("openai_tokens_total").items()}
+        if tokens: st.caption(f"Токены OpenAI: prompt {tokens.get('prompt', 0)}, completion {tokens.get('completion', 0)}")
+        st.download_button("Prometheus", metrics.render(), file_name="metrics.txt", mime="text/plain", use_container_width=True)
+
+VACANCY_PAGE_SIZE = 12  # карточек за один шаг "Показать ещё" (кратно трём колонкам)
+VACANCY_SORT_OPTIONS = {
+    "Дате публикации (новые сначала)": "published_at",
+    "Названию (А-Я)": "name",
+    "Количеству откликов": "responses",
+    "Непрочитанным откликам": "unread_responses",
+}
+
+def get_vacancy_index():
+    """Индекс вакансий строится один раз на список (после загрузки или обновления)."""
+    snapshot = get_vacancy_refresher().snapshot
+    if snapshot.vacancies is st.session_state.hh_active_vacancies: return snapshot.index
+    index = st.session_state.get('hh_vacancy_index')
+    if index is None or not index.built_from(st.session_state.hh_active_vacancies):
+        index = st.session_state.hh_vacancy_index = VacancyIndex(st.session_state.hh_active_vacancies)
+    return index
 
 def highlight_snippet(text):
     if not text: return ""
@@ -79,14 +169,16 @@ def highlight_snippet(text):
 
 
 # --- UI Компоненты ---
-def display_vacancy_card(vacancy):
+def display_vacancy_card(vacancy, new_candidates=0):
     with st.container(border=True):
         city = vacancy.get('area', {}).get('name', 'Город не указан')
         responses_count = vacancy.get('counters', {}).get('responses', 0)
+        # Новые кандидаты — по последнему дельта-поиску (search_batch.py --delta или кнопка на странице вакансии)
+        new_badge = f'<br><span style="color: #778DA9; font-size: 0.9em;">🆕 Новых кандидатов: {new_candidates}</span>' if new_candidates else ''
         st.markdown(f'<div class="vacancy-card"><div>'
                     f'<p class="vacancy-title">{vacancy["name"]}</p>'
                     f'<span style="color: #778DA9; font-size: 0.9em;">📍 {city}</span><br>'
-                    f'<span style="color: #778DA9; font-size: 0.9em;">📥 Отклики: {responses_count}</span>'
+                    f'<span style="color: #778DA9; font-size: 0.9em;">📥 Отклики: {responses_count}</span>{new_badge}'
                     f'</div>', unsafe_allow_html=True)
         if st.button("Перейти к вакансии", key=f"process_hh_{vacancy['id']}", use_container_width=True):
             st.session_state.hh_selected_vacancy_id = vacancy['id']
@@ -95,6 +187,26 @@ def display_vacancy_card(vacancy):
             st.rerun()
         st.markdown('</div>', unsafe_allow_html=True)
 
+def _show_more_vacancies(visible_key):
+    st.session_state[visible_key] = st.session_state.get(visible_key, VACANCY_PAGE_SIZE) + VACANCY_PAGE_SIZE
+
+def render_vacancy_grid(vacancy_index, positions, section, watermarks):
+    """
+    Показывает первые карточки секции и кнопку "Показать ещё": виджеты строятся
+    только для видимых вакансий. Ключи кнопок карточек зависят лишь от id вакансии.
+    `watermarks` — {id вакансии: Watermark}, читается один раз на отрисовку страницы.
+    """
+    visible_key = f"home_visible_{section}"
+    visible = st.session_state.get(visible_key, VACANCY_PAGE_SIZE)
+    cols = st.columns(3)
+    for i, vacancy in enumerate(vacancy_index.vacancies(positions[:visible])):
+        watermark = watermarks.get(str(vacancy['id']))
+        with cols[i % 3]: display_vacancy_card(vacancy, watermark.new_count if watermark else 0)
+    hidden = len(positions) - visible
+    if hidden > 0:
+        st.button(f"Показать ещё ({min(hidden, VACANCY_PAGE_SIZE)} из {hidden})", key=f"show_more_{section}",
+                  on_click=_show_more_vacancies, args=(visible_key,), use_container_width=True)
+
 def render_home_page_old():
     if st.session_state.current_user:
         user = st.session_state.current_user
@@ -146,10 +258,18 @@ def render_home_page():
         #st.markdown(f"### Добро пожаловать, {user.get('first_name', '')} {user.get('last_name', '')}!")
         st.markdown(f"### Добро пожаловать!")
     st.markdown('<div class="sub-header">Активные вакансии</div>', unsafe_allow_html=True)
+    refresher = get_vacancy_refresher()
     if st.button("🔄 Обновить список"):
-        st.session_state.hh_active_vacancies = []
-        fetch_initial_data()
-        st.rerun()
+        # Обновление общего снимка: если его уже обновляет другая сессия, дожидаемся её результата
+        with st.spinner("Обновление списка вакансий..."):
+            refresher.refresh()
+        if refresher.last_error: st.error(f"Не удалось обновить список: {refresher.last_error}")
+        st.session_state.hh_active_vacancies = refresher.snapshot.vacancies
+    snapshot = refresher.snapshot
+    if snapshot.fetched_at:
+        st.caption(f"Версия списка {snapshot.version}, обновлено {snapshot.fetched_at.astimezone():%H:%M:%S}")
+
+    vacancy_index = get_vacancy_index()
 
     # --- ИЗМЕНЕНИЕ: Панель фильтров и сортировки ---
     st.markdown("#### Поиск и фильтрация")
@@ -158,55 +278,35 @@ def render_home_page():
         
         filter_cols = st.columns(2)
         with filter_cols[0]:
-            cities = sorted(list(set(v.get('area', {}).get('name') for v in st.session_state.hh_active_vacancies if v.get('area', {}).get('name'))))
-            selected_cities = st.multiselect("Фильтр по городам:", options=cities)
+            selected_cities = st.multiselect("Фильтр по городам:", options=vacancy_index.cities)
         with filter_cols[1]:
-            sort_option = st.selectbox("Сортировать по:", options=["Дате публикации (новые сначала)", "Названию (А-Я)", "Количеству откликов", "Непрочитанным откликам"])
-
-    # Логика фильтрации и сортировки
-    vacancies_to_display = st.session_state.hh_active_vacancies
-    if search_query:
-        vacancies_to_display = [v for v in vacancies_to_display if search_query.lower() in v['name'].lower()]
-    if selected_cities:
-        vacancies_to_display = [v for v in vacancies_to_display if v.get('area', {}).get('name') in selected_cities]
-
-    # Логика сортировки
-    if sort_option == "Дате публикации (новые сначала)":
-        vacancies_to_display.sort(key=lambda v: v.get('published_at', ''), reverse=True)
-    elif sort_option == "Названию (А-Я)":
-        vacancies_to_display.sort(key=lambda v: v.get('name', ''))
-    elif sort_option == "Количеству откликов":
-        vacancies_to_display.sort(key=lambda v: v.get('counters', {}).get('responses', 0), reverse=True)
-    elif sort_option == "Непрочитанным откликам":
-        vacancies_to_display.sort(key=lambda v: v.get('counters', {}).get('unread_responses', 0), reverse=True)
+            sort_option = st.selectbox("Сортировать по:", options=list(VACANCY_SORT_OPTIONS))
+
+    # Фильтрация и сортировка по предрасчитанному индексу; исходный список не меняется
+    vacancies_to_display = vacancy_index.sort(vacancy_index.filter(search_query, selected_cities), VACANCY_SORT_OPTIONS[sort_option])
 
     # Разделение вакансий на "мои" и "все остальные" ПОСЛЕ фильтрации и сортировки
-    my_vacancies = []
-    other_vacancies = []
     user_id = st.session_state.current_user.get('id') if st.session_state.current_user else None
-    
-    if user_id:
-        for v in vacancies_to_display:
-            if v.get('manager', {}).get('id') == user_id: my_vacancies.append(v)
-            else: other_vacancies.append(v)
-    else: other_vacancies = vacancies_to_display
+    my_positions, other_positions = vacancy_index.split_by_manager(vacancies_to_display, user_id)
+
+    # При смене фильтров окна карточек начинаются заново
+    filter_signature = (search_query, tuple(selected_cities), sort_option, len(vacancy_index))
+    if st.session_state.get('home_filter_signature') != filter_signature:
+        st.session_state.home_filter_signature = filter_signature
+        for section in ("my", "other"): st.session_state.pop(f"home_visible_{section}", None)
 
     # --- ИЗМЕНЕНИЕ: Динамический счетчик ---
     st.markdown(f"**Отображено вакансий: {len(vacancies_to_display)}**")
 
+    # Счётчики новых кандидатов для обеих секций — одним чтением хранилища
+    watermarks = get_watermark_store().all() if len(vacancies_to_display) else {}
     st.markdown('<div class="section-header">Мои вакансии</div>', unsafe_allow_html=True)
-    if my_vacancies:
-        cols = st.columns(3)
-        for i, vacancy in enumerate(my_vacancies):
-            with cols[i % 3]: display_vacancy_card(vacancy)
+    if len(my_positions): render_vacancy_grid(vacancy_index, my_positions, "my", watermarks)
     else: st.info("Нет ваших вакансий, соответствующих фильтрам.")
 
     st.markdown('<div class="section-header">Все остальные вакансии</div>', unsafe_allow_html=True)
-    if other_vacancies:
-        cols = st.columns(3)
-        for i, vacancy in enumerate(other_vacancies):
-            with cols[i % 3]: display_vacancy_card(vacancy)
-    elif not my_vacancies: st.warning("Не найдено вакансий, соответствующих фильтрам.")
+    if len(other_positions): render_vacancy_grid(vacancy_index, other_positions, "other", watermarks)
+    elif not len(my_positions): st.warning("Не найдено вакансий, соответствующих фильтрам.")
 
 def render_keyword_extraction_page_old():
     vacancy_id = st.session_state.hh_selected_vacancy_id
@@ -225,6 +325,7 @@ def render_keyword_extraction_page_old():
     st.caption(f"Требуемый опыт: **{vacancy_details.get('experience', {}).get('name', 'Не указан')}**")
 
     with st.expander("Показать/скрыть описание вакансии"):
+        from bs4 import BeautifulSoup
         soup = BeautifulSoup(vacancy_details.get('description', ''), 'html.parser')
         st.markdown(soup.prettify(), unsafe_allow_html=True)
 
@@ -302,114 +403,185 @@ def render_keyword_extraction_page_old():
                     #st.markdown(f"<div style='text-align:right;'><span class='stBadge'>Балл: {score}</span></div>", unsafe_allow_html=True)
                     st.link_button("🔗 на HH.ru", resume.get('alternate_url', '#'), use_container_width=True)
 
-def render_keyword_extraction_page():
-    vacancy_id = st.session_state.hh_selected_vacancy_id
-    vacancy_details = hh.get_vacancy_details(vacancy_id)
-    if not vacancy_details: st.error("Не удалось загрузить детали вакансии."); st.stop()
-
-    st.markdown('<div class="sub-header">Поиск по вакансии</div>', unsafe_allow_html=True)
-    if st.button("⬅️ Вернуться к списку вакансий"):
-        st.session_state.hh_selected_vacancy_id = None
-        st.session_state.search_page_number = 0
-        st.rerun()
-
-    description_html = vacancy_details.get('description', '')
-    cleaned_text, cleaned_html_for_display = hh.clean_vacancy_description(description_html)
-
-    col_keywords, col_description = st.columns([6, 5]) # Левая колонка чуть шире
-
-    with col_keywords:
-        st.markdown('<div class="sub-header">Параметры поиска</div>', unsafe_allow_html=True)
-        st.markdown(f"### {vacancy_details.get('name')}")
-        st.caption(f"Требуемый опыт: **{vacancy_details.get('experience', {}).get('name', 'Не указан')}**")
-        if st.session_state.structured_keywords is None:
-            st.session_state.structured_keywords = hh.generate_keywords_with_openai(
-                vacancy_details.get("name", ""), cleaned_text)
-        keywords = st.session_state.structured_keywords or {}
-
-        st.markdown("#### Шаг 1: Ключевые слова")
-        with st.container(border=True):
-            st.info("Вы можете отредактировать список слов (разделяйте запятой)")
-            keywords['must_have'] = st.text_input("Обязательно", ", ".join(keywords.get('must_have', [])), key=f"must_{vacancy_id}").split(',')
-            keywords['optional'] = st.text_input("Дополнительно", ", ".join(keywords.get('optional', [])), key=f"tech_{vacancy_id}").split(',')
-            for k in keywords: keywords[k] = [item.strip() for item in keywords[k] if item.strip()]
-            st.session_state.structured_keywords = keywords
-        
-        
-    with col_description:
-        #st.markdown('<div class="sub-header">Описание вакансии</div>', unsafe_allow_html=True)
-        st.markdown("<br><br><br><br><br><br><br><br><br>", unsafe_allow_html=True)
-        # ИЗМЕНЕНИЕ: Контейнер с фиксированной высотой и скроллом
-        
-        st.markdown(
-            f'<div class="scrollable-container compact-text">{cleaned_html_for_display}</div>',
-            unsafe_allow_html=True
-        )
+def _filter_key(name):
+    """Ключ виджета фильтра: значения живут в session_state и доступны другим фрагментам."""
+    return f"filter_{name}_{st.session_state.hh_selected_vacancy_id}"
 
+@st.fragment
+@timed("keyword_editor")
+def render_keyword_editor(vacancy_id):
+    """Шаг 1. Правка ключевых слов перезапускает только этот фрагмент."""
+    keywords = st.session_state.structured_keywords or {}
+    st.markdown("#### Шаг 1: Ключевые слова")
+    with st.container(border=True):
+        st.info("Вы можете отредактировать список слов (разделяйте запятой)")
+        keywords['must_have'] = st.text_input("Обязательно", ", ".join(keywords.get('must_have', [])), key=f"must_{vacancy_id}").split(',')
+        keywords['optional'] = st.text_input("Дополнительно", ", ".join(keywords.get('optional', [])), key=f"tech_{vacancy_id}").split(',')
+        for k in keywords: keywords[k] = [item.strip() for item in keywords[k] if item.strip()]
+        st.session_state.structured_keywords = keywords
 
-    if st.session_state.structured_keywords is None:
-        st.session_state.structured_keywords = hh.generate_keywords_with_openai(
-            vacancy_details.get("name", ""), vacancy_details.get("description", ""))
-    
-    keywords = st.session_state.structured_keywords
-    if not keywords: st.error("Не удалось сгенерировать ключевые слова."); return
-    
+@st.fragment
+@timed("filter_panel")
+def render_filter_panel(vacancy_details):
+    """Шаг 2. Фильтры сохраняются в session_state по ключам виджетов; их изменение не перезапускает страницу."""
     col1, col2 = st.columns([6,5])
     with col1:
         st.markdown("#### Шаг 2: Основные фильтры и режим поиска")
         #search_mode = st.radio("Режим поиска AI-ключевых слов:", ["Строгий", "Средний"], index=1, horizontal=True)
 
         st.markdown("##### **Точные критерии**")
-        user_job_title = st.text_input("Название должности:", placeholder="Например: Java-разработчик")
-        bank_only = st.checkbox("Искать только с опытом работы в банке")
+        st.text_input("Название должности:", placeholder="Например: Java-разработчик", key=_filter_key("user_job_title"))
+        st.checkbox("Искать только с опытом работы в банке", key=_filter_key("bank_only"))
+        st.checkbox("Только новые с прошлого поиска", help="Резюме, обновлённые после прошлого такого поиска по этой вакансии и ещё не показанные по ней", key=_filter_key("delta"))
+        st.checkbox("Искать в локальном индексе", help="Если запрос покрыт проиндексированными резюме, ответ мгновенный и без hh.ru, но поиск идёт только по заголовку, должностям, компаниям и сниппетам, а не по полному тексту резюме — кандидатов может быть меньше. По умолчанию выключено: ищем полнотекстово на hh.ru", key=_filter_key("local_index"))
+        st.checkbox("Комбинированный поиск", help="Несколько стратегий (все критерии, только обязательные, любое слово, должность, опыт в банке) выполняются параллельно, выдачи объединяются по рейтингу", key=_filter_key("combined_search"))
 
         st.markdown("##### **Квалификация**")
         experience_options = ["noExperience", "between1And3", "between3And6", "moreThan6"]
         default_exp_id = vacancy_details.get('experience', {}).get('id')
         default_exp = [default_exp_id] if default_exp_id in experience_options else []
-        experience = st.multiselect("Опыт работы:", experience_options, default=default_exp, format_func=lambda x: {"noExperience": "Нет", "between1And3": "1-3", "between3And6": "3-6", "moreThan6": "6+"}.get(x, x))
+        st.multiselect("Опыт работы:", experience_options, default=default_exp, format_func=lambda x: {"noExperience": "Нет", "between1And3": "1-3", "between3And6": "3-6", "moreThan6": "6+"}.get(x, x), key=_filter_key("experience"))
 
-        education_levels = st.multiselect("Образование:",
+        st.multiselect("Образование:",
             options=['higher', 'bachelor', 'master', 'special_secondary', 'secondary', 'unfinished_higher', 'candidate', 'doctor'], default=['higher', 'bachelor','master','candidate', 'doctor'],
             format_func=lambda x: {'higher': 'Высшее', 'bachelor': 'Бакалавр', 'master': 'Магистр', 'special_secondary': 'Среднее спец.', 'secondary' : 'Среднее',
-                                   'unfinished_higher':'Неоконченное высшее','candidate':'Кандидат наук','doctor':'Доктор наук'}.get(x,x))
+                                   'unfinished_higher':'Неоконченное высшее','candidate':'Кандидат наук','doctor':'Доктор наук'}.get(x,x), key=_filter_key("education_levels"))
     with col2:
         st.markdown("<br><br><br><br><br>", unsafe_allow_html=True)
         st.markdown("##### **Локация и Языки**")
         # --- ИЗМЕНЕНИЕ: Мультиселект для регионов ---
-        kz_areas_dict = hh.get_area_dictionary()
-        area_options = list(kz_areas_dict.keys())
-        default_area_name = vacancy_details.get('area', {}).get('name', 'Астана')
-        default_selection = [default_area_name] if default_area_name in area_options else []
-        selected_area_names = st.multiselect("Регионы поиска:", options=area_options, default=default_selection)
+        # Значения — id регионов; регион вакансии доступен, даже если его нет в снимке справочника
+        area_names = {area_id: name for name, area_id in hh.get_area_dictionary().items()}
+        vacancy_area = vacancy_details.get('area') or {}
+        if vacancy_area.get('id'): area_names.setdefault(vacancy_area['id'], vacancy_area.get('name', vacancy_area['id']))
+        default_selection = [vacancy_area['id']] if vacancy_area.get('id') else []
+        st.multiselect("Регионы поиска:", options=list(area_names), default=default_selection, format_func=lambda x: area_names.get(x, x), key=_filter_key("areas"))
         
-        languages = st.multiselect("Знание языков:", ['rus', 'kaz', 'eng'], default = ['rus','kaz'],format_func=lambda x: {'rus': 'Русский', 'kaz': 'Казахский', 'eng': 'Английский'}.get(x,x))
+        st.multiselect("Знание языков:", ['rus', 'kaz', 'eng'], default = ['rus','kaz'],format_func=lambda x: {'rus': 'Русский', 'kaz': 'Казахский', 'eng': 'Английский'}.get(x,x), key=_filter_key("language"))
 
         st.markdown("##### **Статус**")
-        job_search_status = st.multiselect("Статус поиска:", ['active_search', 'looking_for_offers', 'has_job_offer'], default=['active_search', 'looking_for_offers'], format_func=lambda x: {'active_search': 'Активный', 'looking_for_offers': 'Рассматривает', 'has_job_offer': 'Есть оффер'}.get(x, x))
-
-    def trigger_search(page_num):
-        selected_area_ids = [kz_areas_dict[name] for name in selected_area_names if name in kz_areas_dict]
-        search_filters = {
-            "area": selected_area_ids, "employment": ["full"], "experience": experience,
-            "host": "hh.kz",
-            "job_search_status": job_search_status, "education_levels": education_levels,
-            "language": languages, "per_page": 20,
-            "user_job_title": user_job_title, "bank_only": bank_only,
-            "page": page_num # Pass the current page number to the API
-        }
-        with st.spinner(f"Searching for candidates on page {page_num + 1}..."):
-            st.session_state.hh_search_results = hh.advanced_search_resumes(keywords, search_filters)
+        st.multiselect("Статус поиска:", ['active_search', 'looking_for_offers', 'has_job_offer'], default=['active_search', 'looking_for_offers'], format_func=lambda x: {'active_search': 'Активный', 'looking_for_offers': 'Рассматривает', 'has_job_offer': 'Есть оффер'}.get(x, x), key=_filter_key("job_search_status"))
+
+def build_search_filters(page_num):
+    value = lambda name, default=None: st.session_state.get(_filter_key(name), default)
+    return {
+        "area": list(value("areas", [])), "employment": ["full"], "experience": value("experience", []),
+        "host": "hh.kz",
+        "job_search_status": value("job_search_status", []), "education_levels": value("education_levels", []),
+        "language": value("language", []), "per_page": 20,
+        "user_job_title": value("user_job_title", ""), "bank_only": value("bank_only", False),
+        "page": page_num # Pass the current page number to the API
+    }
 
+def trigger_search(page_num):
+    keywords = st.session_state.structured_keywords
+    search_filters = build_search_filters(page_num)
+    # При изменении ключевых слов или фильтров сбрасываем кэш страниц прежнего поиска
+    # Сравниваем по смыслу запроса: перестановка или смена регистра ключевых слов кэш не сбрасывает
+    signature = ({k: list(v) for k, v in keywords.items()}, {k: v for k, v in search_filters.items() if k != "page"})
+    previous_signature = st.session_state.get('search_signature')
+    if previous_signature and hh.search_signature(*previous_signature) != hh.search_signature(*signature):
+        hh.invalidate_search_cache(*previous_signature)
+    st.session_state.search_signature = signature
+    vacancy_id = st.session_state.hh_selected_vacancy_id
+    if st.session_state.get(_filter_key("delta")):
+        with st.spinner("Поиск новых кандидатов..."):
+            st.session_state.hh_search_results = hh.advanced_search_resumes(keywords, search_filters, vacancy_id, delta=True)
+        return
+    if st.session_state.get(_filter_key("combined_search")):
+        with st.spinner(f"Комбинированный поиск, страница {page_num + 1}..."):
+            try:
+                results = search_planner.multi_strategy_search(keywords, search_filters)
+            except hh.HHAPIError as e:
+                st.warning(f"Ошибка при поиске: {e}")
+                results = {"found": 0, "items": []}
+        for strategy in results.get("strategies", []):
+            if strategy["error"]: st.warning(f"Стратегия '{strategy['label']}' не выполнена: {strategy['error']}")
+        st.session_state.hh_search_results = results
+        return
+    # Локальный индекс включается явно: он хранит только поля списка резюме, и выдача может быть
+    # меньше полнотекстовой. Пустую локальную выдачу перепроверяем на hh.ru
+    local_results = resume_index.local_search(keywords, search_filters) if st.session_state.get(_filter_key("local_index"), False) else None
+    if local_results is not None and local_results["found"]:
+        st.info(f"Найдено {local_results['found']} кандидатов в локальном индексе (без полного текста резюме).")
+        st.session_state.hh_search_results = local_results
+        return
+    with st.spinner(f"Searching for candidates on page {page_num + 1}..."):
+        # При листании передаём, какой запрос дал первую страницу, — не угадываем по кэшу
+        fallback = (st.session_state.get('hh_search_results') or {}).get('used_fallback') if page_num > 0 else None
+        st.session_state.hh_search_results = hh.advanced_search_resumes(keywords, search_filters, vacancy_id, fallback=fallback)
+
+def render_index_controls(keywords, search_filters):
+    """Наполнение локального индекса идёт в фоновом потоке; здесь только кнопка и состояние."""
+    job = resume_index.refresh_job(search_filters)
+    if job is not None and not job.done():
+        st.caption("⏳ Резюме выгружаются в локальный индекс в фоне — поиск на hh.ru доступен как обычно.")
+        return
+    if job is not None and job.exception() is not None:
+        st.warning(f"Локальный индекс не обновлён: {job.exception()}")
+    elif job is not None:
+        st.caption(f"⚡ Локальный индекс обновлён: {job.result()} резюме.")
+    if st.button("⚡ Проиндексировать для мгновенного поиска", help=f"Выгрузить в фоне до {resume_index.RESUME_INDEX_MAX_RESUMES} резюме по всем ключевым словам в локальный индекс: после этого изменения ключевых слов не требуют запросов к hh.ru"):
+        resume_index.start_refresh(keywords, search_filters)
+        st.caption("⏳ Выгрузка запущена в фоне.")
+
+def _change_search_page(delta):
+    # Колбэк выполняется до перезапуска фрагмента, поиск — уже внутри него
+    st.session_state.search_page_number += delta
+    st.session_state.search_page_changed = True
+
+def render_enrichment_controls(resumes):
+    """Загрузка полных резюме для отмеченных карточек в пределах суточного лимита просмотров."""
+    selected = [r for r in resumes if st.session_state.get(f"enrich_{r.get('id')}") and r.get('id') not in st.session_state.get('hh_resume_details', {})]
+    if st.button(f"📄 Загрузить полные резюме ({len(selected)})", disabled=not selected):
+        with st.spinner("Загрузка полных резюме..."):
+            enriched = hh.enrich_resumes(selected)
+        st.session_state.setdefault('hh_resume_details', {}).update(enriched["records"])
+        st.success(f"Загружено: {enriched['fetched']}, из кэша: {enriched['cached']}.")
+        if enriched["over_budget"]: st.warning(f"Не загружено из-за лимита просмотров: {len(enriched['over_budget'])}.")
+        for resume_id, error in enriched["errors"].items(): st.warning(f"Резюме {resume_id}: {error}")
+    used, limit = hh.get_resume_cache().views_used(), hh.RESUME_VIEW_DAILY_LIMIT
+    st.caption(f"Просмотров резюме сегодня: {used}" + (f" из {limit}" if limit else ""))
+
+def render_resume_details(record):
+    with st.expander("Полное резюме", expanded=True):
+        months = (record.get('total_experience') or {}).get('months')
+        if months: st.markdown(f"**Общий опыт:** {months // 12} г. {months % 12} мес.")
+        salary = record.get('salary') or {}
+        if salary.get('amount'): st.markdown(f"**Зарплата:** {salary['amount']:,} {salary.get('currency', '')}".replace(",", " "))
+        skills = [skill for skill in record.get('skill_set') or [] if skill]
+        if skills: st.markdown(f"**Навыки:** {', '.join(skills)}")
+        for job in record.get('experience') or []:
+            period = f"{job.get('start', '')[:7]} – {(job.get('end') or 'н.в.')[:7]}"
+            st.markdown(f"- **{job.get('position', 'Должность не указана')}**, {job.get('company', 'компания не указана')} ({period})")
+
+@st.fragment
+@timed("search_results")
+def render_search_results():
+    """Кнопка поиска, выдача и пагинация. Листание перезапускает только этот фрагмент."""
+    keywords = st.session_state.structured_keywords
     if st.button("🚀 Найти кандидатов", use_container_width=True, type="primary"):
         st.session_state.search_page_number = 0 # Reset to first page on a new search
         trigger_search(st.session_state.search_page_number)
+    elif st.session_state.pop('search_page_changed', False):
+        trigger_search(st.session_state.search_page_number)
     
     if 'hh_search_results' in st.session_state and st.session_state.hh_search_results:
         results = st.session_state.hh_search_results
         total_found = results.get("found", 0)
         per_page = 20
         st.markdown(f'<div class="section-header">Найдено резюме: {results.get("found", 0)}</div>', unsafe_allow_html=True)
+        if results.get("source") == "local":
+            st.caption("⚡ Результаты из локального индекса: поиск только по заголовку, должностям, компаниям и сниппетам, "
+                       "поэтому кандидатов может быть меньше, чем на hh.ru. Для полнотекстового поиска снимите «Искать в локальном индексе».")
+        elif results.get("source") == "delta":
+            st.caption(f"🆕 Только новые резюме, обновлено с прошлого поиска: {results.get('updated', 0)}")
+        elif results.get("source") == "planner":
+            st.caption(" · ".join(f"{s['label']}: {s['found']}" for s in results.get("strategies", []) if not s["error"]))
+        else:
+            render_index_controls(keywords, build_search_filters(0))
+        render_enrichment_controls([item.get("data", {}) for item in results.get('items', [])])
+        resume_details = st.session_state.get('hh_resume_details', {})
         for item in results.get('items', []):
             resume, score = item.get("data", {}), item.get("score", 0)
             with st.container(border=True):
@@ -421,10 +593,13 @@ def render_keyword_extraction_page():
                     st.caption(f"Возраст: {resume.get('age', 'N/A')}")
                     snippet_html = resume.get('snippet', {}).get('requirement', '') or resume.get('snippet', {}).get('responsibility', '')
                     if snippet_html: st.markdown(f"<div style='font-size:0.9em;margin-top:8px;'>{highlight_snippet(snippet_html)}</div>", unsafe_allow_html=True)
+                    if resume.get('id') in resume_details: render_resume_details(resume_details[resume['id']])
                 with col_r2:
-                    st.markdown(f"<div style='text-align:right;'><span class='stBadge'>Балл: {score}</span></div>", unsafe_allow_html=True)
+                    details = ", ".join(f"{kw}: {value}" for kw, value in item.get("score_details", {}).items()) or "нет совпадений"
+                    st.markdown(f"<div style='text-align:right;'><span class='stBadge' title='{html.escape(details, quote=True)}'>Балл: {score}</span></div>", unsafe_allow_html=True)
                     st.link_button("🔗 на HH.ru", resume.get('alternate_url', '#'), use_container_width=True)
-        if total_found > per_page:
+                    if resume.get('id') not in resume_details: st.checkbox("Подробнее", key=f"enrich_{resume.get('id')}")
+        if total_found > per_page and results.get("source") != "delta":
             st.markdown("---")
             total_pages = math.ceil(total_found / per_page)
             
@@ -434,19 +609,64 @@ def render_keyword_extraction_page():
             p_col1, p_col2, p_col3 = st.columns([1, 2, 1])
 
             with p_col1:
-                if st.button("⬅️ Пред.", use_container_width=True, disabled=(st.session_state.search_page_number <= 0)):
-                    st.session_state.search_page_number -= 1
-                    trigger_search(st.session_state.search_page_number)
-                    st.rerun()
+                st.button("⬅️ Пред.", use_container_width=True, disabled=(st.session_state.search_page_number <= 0),
+                          on_click=_change_search_page, args=(-1,))
 
             with p_col2:
                 st.markdown(f"<div style='text-align: center; margin-top: 0.5rem;'>Страница {st.session_state.search_page_number + 1} из {total_pages}</div>", unsafe_allow_html=True)
 
             with p_col3:
-                if st.button("След. ➡️", use_container_width=True, disabled=(st.session_state.search_page_number >= total_pages - 1)):
-                    st.session_state.search_page_number += 1
-                    trigger_search(st.session_state.search_page_number)
-                    st.rerun()
+                st.button("След. ➡️", use_container_width=True, disabled=(st.session_state.search_page_number >= total_pages - 1),
+                          on_click=_change_search_page, args=(1,))
+
+@timed("keyword_page")
+def render_keyword_extraction_page():
+    """
+    Страница вакансии из независимых фрагментов: заголовок и описание
+    выполняются только при полном перезапуске, а правка ключевых слов, фильтры
+    и выдача с пагинацией перезапускают лишь свой фрагмент.
+    """
+    vacancy_id = st.session_state.hh_selected_vacancy_id
+    vacancy_details = hh.get_vacancy_details(vacancy_id)
+    if not vacancy_details: st.error("Не удалось загрузить детали вакансии."); st.stop()
+
+    st.markdown('<div class="sub-header">Поиск по вакансии</div>', unsafe_allow_html=True)
+    if st.button("⬅️ Вернуться к списку вакансий"):
+        st.session_state.hh_selected_vacancy_id = None
+        st.session_state.search_page_number = 0
+        st.rerun()
+
+    description_html = vacancy_details.get('description', '')
+    cleaned_text, cleaned_html_for_display = hh.clean_vacancy_description(description_html)
+
+    col_keywords, col_description = st.columns([6, 5]) # Левая колонка чуть шире
+
+    with col_keywords:
+        st.markdown('<div class="sub-header">Параметры поиска</div>', unsafe_allow_html=True)
+        st.markdown(f"### {vacancy_details.get('name')}")
+        st.caption(f"Требуемый опыт: **{vacancy_details.get('experience', {}).get('name', 'Не указан')}**")
+        if st.session_state.structured_keywords is None:
+            st.session_state.structured_keywords = hh.generate_keywords_with_openai(
+                vacancy_details.get("name", ""), cleaned_text)
+        render_keyword_editor(vacancy_id)
+        
+    with col_description:
+        #st.markdown('<div class="sub-header">Описание вакансии</div>', unsafe_allow_html=True)
+        st.markdown("<br><br><br><br><br><br><br><br><br>", unsafe_allow_html=True)
+        # ИЗМЕНЕНИЕ: Контейнер с фиксированной высотой и скроллом
+        
+        st.markdown(
+            f'<div class="scrollable-container compact-text">{cleaned_html_for_display}</div>',
+            unsafe_allow_html=True
+        )
+
+    if st.session_state.structured_keywords is None:
+        st.session_state.structured_keywords = hh.generate_keywords_with_openai(
+            vacancy_details.get("name", ""), vacancy_details.get("description", ""))
+    if not st.session_state.structured_keywords: st.error("Не удалось сгенерировать ключевые слова."); return
+
+    render_filter_panel(vacancy_details)
+    render_search_results()
 
 
 
@@ -459,6 +679,9 @@ def main():
        
     #   st.session_state.app_page = st.radio("Навигация:", page_options)
     #   st.markdown("---")
+    if metrics.ENABLED:
+        start_metrics_endpoint()
+        render_metrics_panel()
     fetch_initial_data()
     
     if st.session_state.hh_selected_vacancy_id:
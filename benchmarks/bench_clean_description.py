@@ -0,0 +1,135 @@
+"""
+Бенчмарк очистки описаний вакансий: текущая clean_vacancy_description против
+прежней реализации на BeautifulSoup (сохранена ниже как эталон).
+
+Проверяет, что результат совпадает байт в байт, и печатает латентность на
+описание (медиана, p95) и аллокации (пиковая память, число блоков) по tracemalloc.
+
+Корпус в benchmarks/corpus — синтетические описания (разметка в духе hh.ru),
+годятся только для проверки совпадения с эталоном. Замеры печатаются только
+на реальных описаниях из кэша вакансий (--from-cache, после работы приложения
+или search_batch); цифры на синтетике — с явным --timings и не для сравнения.
+
+    python benchmarks/bench_clean_description.py                # только совпадение с эталоном
+    python benchmarks/bench_clean_description.py --from-cache   # реальные описания из кэша вакансий
+"""
+import argparse
+import json
+import os
+import re
+import statistics
+import sys
+import time
+import tracemalloc
+
+from bs4 import BeautifulSoup
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import hh_api_integration_v2 as hh
+
+CORPUS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "corpus", "vacancy_descriptions.jsonl")
+
+
+def legacy_clean_vacancy_description(html_description):
+    """Прежняя реализация clean_vacancy_description — эталон для сравнения."""
+    if not html_description: return "", ""
+    soup = BeautifulSoup(html_description, 'html.parser')
+    text_content = soup.get_text(separator='\n', strip=True)
+
+    russian_start_keywords = ['Обязанности', 'Требования']
+    start_pos = -1
+    for keyword in russian_start_keywords:
+        match = re.search(r'\b' + re.escape(keyword) + r'\b', text_content, re.IGNORECASE)
+        if match:
+            pos = match.start()
+            if start_pos == -1 or pos < start_pos: start_pos = pos
+    if start_pos != -1: text_content = text_content[start_pos:]
+
+    kazakh_start_keywords = ['Міндеттері', 'Талаптар']
+    end_pos = -1
+    for keyword in kazakh_start_keywords:
+        match = re.search(r'\b' + re.escape(keyword) + r'\b', text_content, re.IGNORECASE)
+        if match:
+            pos = match.start()
+            if end_pos == -1 or pos < end_pos: end_pos = pos
+    if end_pos != -1: text_content = text_content[:end_pos]
+
+    pattern_about = re.compile(r"(Что такое ForteBank\?).*?(?=(Обязанности|Требования))", re.DOTALL | re.IGNORECASE)
+    pattern_perks = re.compile(r"(Став частью команды Forte).*$", re.DOTALL | re.IGNORECASE)
+    cleaned_text = re.sub(pattern_about, '', text_content)
+    cleaned_text = re.sub(pattern_perks, '', cleaned_text)
+    cleaned_text = re.sub(r'\n\s*\n', '\n', cleaned_text).strip()
+
+    html_version = cleaned_text
+    headers_to_format = ['Обязанности', 'Требования', 'Что мы предлагаем', 'Условия', 'Наш стэк']
+    for header in headers_to_format:
+        pattern = re.compile(f'({re.escape(header)})\\s*:', re.IGNORECASE)
+        replacement = f'<br><strong>{header}:</strong>'
+        html_version = pattern.sub(replacement, html_version)
+    html_version = html_version.replace('\n', '<br>')
+    html_version = re.sub(r'(<br>\s*){2,}', '<br>', html_version)
+    return cleaned_text, html_version
+
+
+def load_corpus(from_cache=False):
+    if from_cache:
+        rows = hh.get_vacancy_cache()._execute("SELECT body FROM vacancies")
+        return [json.loads(body).get("description", "") for (body,) in rows]
+    with open(CORPUS_PATH, encoding="utf-8") as f:
+        return [json.loads(line)["description"] for line in f if line.strip()]
+
+
+def measure_latency(func, corpus, repeat):
+    timings = []
+    for _ in range(repeat):
+        for description in corpus:
+            started = time.perf_counter()
+            func(description)
+            timings.append(time.perf_counter() - started)
+    timings.sort()
+    return statistics.median(timings), timings[int(len(timings) * 0.95) - 1]
+
+
+def measure_allocations(func, corpus):
+    """Средняя пиковая память и прирост числа блоков памяти на одно описание."""
+    peaks, blocks = [], []
+    for description in corpus:
+        tracemalloc.start()
+        before = tracemalloc.take_snapshot()
+        func(description)
+        after = tracemalloc.take_snapshot()
+        peaks.append(tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+        blocks.append(sum(stat.count_diff for stat in after.compare_to(before, "filename") if stat.count_diff > 0))
+    return statistics.mean(peaks), statistics.mean(blocks)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Бенчмарк clean_vacancy_description")
+    parser.add_argument("--repeat", type=int, default=50)
+    parser.add_argument("--from-cache", action="store_true", help="Взять описания из персистентного кэша вакансий")
+    parser.add_argument("--timings", action="store_true", help="Замеры и на синтетическом корпусе (не для сравнения)")
+    args = parser.parse_args(argv)
+
+    corpus = [d for d in load_corpus(args.from_cache) if d]
+    if not corpus:
+        print("[!] Корпус пуст: в кэше вакансий нет описаний")
+        return 1
+    mismatches = sum(hh.clean_vacancy_description(d) != legacy_clean_vacancy_description(d) for d in corpus)
+    print(f"Описаний в корпусе: {len(corpus)}, расхождений с эталоном: {mismatches}")
+    if not args.from_cache and not args.timings:
+        print("[*] Синтетический корпус: замеры пропущены, для цифр запустите с --from-cache")
+        return 1 if mismatches else 0
+
+    for label, func in (("legacy (BeautifulSoup)", legacy_clean_vacancy_description),
+                        ("current", hh.clean_vacancy_description)):
+        func(corpus[0])  # прогрев
+        median, p95 = measure_latency(func, corpus, args.repeat)
+        peak, blocks = measure_allocations(func, corpus)
+        print(f"{label:<24} median {median * 1e6:8.1f} µs   p95 {p95 * 1e6:8.1f} µs   "
+              f"peak {peak / 1024:7.1f} KiB   net blocks {blocks:6.0f}")
+    return 1 if mismatches else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
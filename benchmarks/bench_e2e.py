@@ -0,0 +1,202 @@
+"""
+Сквозной бенчмарк против локальной заглушки hh.ru и OpenAI (stub_server.py).
+
+Измеряет основные пользовательские сценарии без обращения к внешним сервисам:
+загрузку стартовых данных (пользователь и снимок вакансий, как fetch_initial_data),
+открытие страницы вакансии (детали + ключевые слова), двухступенчатый поиск
+(advanced_search_resumes, как в приложении; пустая выдача — ошибка),
+переход на следующую страницу выдачи (после паузы "чтения" — с предзагрузкой)
+и возврат на первую. С --ui дополнительно замеряются страницы целиком через
+streamlit AppTest. Печатает p50/p95 по сценариям; --json сохраняет результат,
+чтобы сравнивать релизы.
+
+    python benchmarks/bench_e2e.py
+    python benchmarks/bench_e2e.py --latency 0.08 --jitter 0.03 --burst-every 200 --burst-length 3
+    python benchmarks/bench_e2e.py --iterations 30 --ui --json bench_e2e.json
+"""
+import argparse
+import json
+import logging
+import math
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, ROOT_DIR)
+import stub_server
+
+APP_PATH = os.path.join(ROOT_DIR, "app_mvp_v2.py")
+
+
+def percentile(timings, q):
+    ordered = sorted(timings)
+    return ordered[max(0, math.ceil(q * len(ordered)) - 1)]
+
+
+def configure_environment(base_url, cache_dir):
+    """Направляет приложение на заглушку. Вызывается до импорта модулей приложения: адреса читаются при импорте."""
+    os.environ.update({
+        "HH_API_URL": base_url, "ACCESS_TOKEN": "stub",
+        "OPENAI_BASE_URL": f"{base_url}/v1", "OPENAI_API_KEY": "stub",
+        "HH_CACHE_DIR": cache_dir, "HH_METRICS": "1",
+    })
+
+
+class Scenarios:
+    """Сценарии без Streamlit; каждая итерация берёт следующую вакансию, поэтому кэши деталей и LLM холодные."""
+
+    def __init__(self, vacancies, think_time):
+        import hh_api_integration_v2 as hh
+        self.hh = hh
+        self.vacancies = vacancies
+        self.think_time = think_time
+        self.filters = {"per_page": 20, "area": [], "employment": ["full"], "host": "hh.kz"}
+        self.keywords = None
+        self.used_fallback = None
+
+    def fetch_initial_data(self, iteration):
+        from vacancy_snapshot import VacancyRefresher
+        self.hh.get_current_user_info()
+        refresher = VacancyRefresher(interval=0)
+        refresher.refresh()
+        if refresher.last_error: raise refresher.last_error
+
+    def keyword_page(self, iteration):
+        vacancy = self.vacancies[iteration % len(self.vacancies)]
+        details = self.hh.fetch_vacancy_details(vacancy["id"])
+        cleaned_text, _ = self.hh.clean_vacancy_description(details.get("description", ""))
+        keywords, _ = self.hh.extract_keywords(details.get("name", ""), cleaned_text)
+        self.keywords = {"must_have": keywords.get("must_have", []), "optional": keywords.get("optional", [])}
+        self.filters = {**self.filters, "area": [details["area"]["id"]]}
+
+    def _search_page(self, page):
+        """Поиск через точку входа приложения (trigger_search); пустая выдача считается ошибкой."""
+        fallback = self.used_fallback if page > 0 else None
+        results = self.hh.advanced_search_resumes(self.keywords, {**self.filters, "page": page}, fallback=fallback)
+        if not results or not results.get("items"): raise RuntimeError(f"пустая выдача на странице {page}")
+        if page == 0: self.used_fallback = results["used_fallback"]
+
+    def search(self, iteration):
+        self.hh.get_search_cache().clear()
+        self._search_page(0)
+
+    def read_first_page(self, iteration):
+        # Рекрутер читает первую страницу, пока следующая загружается в фоне
+        time.sleep(self.think_time)
+
+    def page_next(self, iteration):
+        self._search_page(1)
+
+    def page_back(self, iteration):
+        self._search_page(0)
+
+    def all(self):
+        """[(название, замеряемая функция, подготовка вне замера или None), ...]"""
+        return [("fetch_initial_data", self.fetch_initial_data, None), ("keyword_page", self.keyword_page, None),
+                ("search", self.search, None), ("page_next", self.page_next, self.read_first_page),
+                ("page_back", self.page_back, None)]
+
+
+class UIScenarios:
+    """Страницы целиком: новый сеанс AppTest на каждую итерацию (общие кэши сервера сохраняются)."""
+
+    def __init__(self, vacancies):
+        self.vacancies = vacancies
+
+    def _run(self, **session_state):
+        from streamlit.testing.v1 import AppTest
+        at = AppTest.from_file(APP_PATH, default_timeout=120)
+        for key, value in session_state.items(): at.session_state[key] = value
+        at.run()
+        if at.exception: raise RuntimeError(at.exception[0].message)
+
+    def home_page(self, iteration):
+        self._run()
+
+    def keyword_page_ui(self, iteration):
+        self._run(hh_selected_vacancy_id=self.vacancies[iteration % len(self.vacancies)]["id"])
+
+    def all(self):
+        return [("ui_home_page", self.home_page, None), ("ui_keyword_page", self.keyword_page_ui, None)]
+
+
+def run(scenarios, iterations, warmup, log=print):
+    """Выполняет сценарии по кругу; возвращает {сценарий: {"timings": [...], "errors": n}}."""
+    results = {name: {"timings": [], "errors": 0} for name, _, _ in scenarios}
+    for iteration in range(warmup + iterations):
+        for name, scenario, prepare in scenarios:
+            if prepare: prepare(iteration)
+            started = time.perf_counter()
+            try:
+                scenario(iteration)
+            except Exception as e:
+                if iteration >= warmup: results[name]["errors"] += 1
+                log(f"[!] {name} #{iteration}: {e}")
+                continue
+            if iteration >= warmup: results[name]["timings"].append(time.perf_counter() - started)
+    return results
+
+
+def summarize(results):
+    summary = {}
+    for name, result in results.items():
+        timings = result["timings"]
+        summary[name] = {"n": len(timings), "errors": result["errors"]}
+        if timings:
+            summary[name].update({"p50_ms": round(percentile(timings, 0.5) * 1000, 1),
+                                  "p95_ms": round(percentile(timings, 0.95) * 1000, 1),
+                                  "mean_ms": round(statistics.mean(timings) * 1000, 1),
+                                  "max_ms": round(max(timings) * 1000, 1)})
+    return summary
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Сквозной бенчмарк против локальной заглушки hh.ru и OpenAI")
+    stub_server.add_config_arguments(parser)
+    parser.add_argument("--iterations", type=int, default=20)
+    parser.add_argument("--warmup", type=int, default=1, help="Итераций прогрева (не входят в статистику)")
+    parser.add_argument("--think-time", type=float, default=0.3, help="Пауза перед переходом на следующую страницу, сек")
+    parser.add_argument("--ui", action="store_true", help="Также замерить страницы целиком через streamlit AppTest")
+    parser.add_argument("--json", help="Сохранить результаты в JSON")
+    args = parser.parse_args(argv)
+    # Каждой итерации — своя вакансия, иначе страница вакансии берётся из кэша
+    args.vacancies = max(args.vacancies, args.warmup + args.iterations)
+
+    server, base_url = stub_server.start_server(0, stub_server.config_from_args(args))
+    configure_environment(base_url, tempfile.mkdtemp(prefix="hh-bench-"))
+    # st.* в advanced_search_resumes вне `streamlit run` пишут предупреждения "bare mode" на каждый вызов
+    logging.disable(logging.WARNING)
+    import metrics
+    from vacancy_snapshot import fetch_active_vacancies
+
+    vacancies = fetch_active_vacancies()
+    print(f"[*] Заглушка: {base_url}, вакансий: {len(vacancies)}, итераций: {args.iterations}")
+    scenarios = Scenarios(vacancies, args.think_time).all()
+    if args.ui: scenarios += UIScenarios(vacancies).all()
+    results = run(scenarios, args.iterations, args.warmup)
+    server.shutdown()
+
+    summary = summarize(results)
+    print(f"{'сценарий':<20} {'n':>4} {'p50, мс':>9} {'p95, мс':>9} {'среднее':>9} {'макс':>9} {'ошибки':>7}")
+    for name, row in summary.items():
+        print(f"{name:<20} {row['n']:>4} {row.get('p50_ms', '—'):>9} {row.get('p95_ms', '—'):>9} "
+              f"{row.get('mean_ms', '—'):>9} {row.get('max_ms', '—'):>9} {row['errors']:>7}")
+    requests_total = sum(metrics.REGISTRY.counters("hh_requests_total").values())
+    retries = sum(metrics.REGISTRY.counters("hh_request_retries_total").values())
+    print(f"[*] Запросов к hh.ru: {requests_total}, повторов: {retries}")
+
+    if args.json:
+        config = {k: v for k, v in vars(args).items() if k != "json"}
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"), "config": config, "results": summary,
+                       "hh_requests": requests_total, "hh_retries": retries}, f, ensure_ascii=False, indent=2)
+        print(f"[*] Результаты сохранены: {args.json}")
+    return 1 if any(row["errors"] for row in summary.values()) else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
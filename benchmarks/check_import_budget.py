@@ -0,0 +1,130 @@
+"""
+Проверка бюджета холодного старта: время импорта модулей приложения и
+отсутствие тяжёлых зависимостей, которые должны загружаться лениво.
+
+Каждый замер — отдельный процесс `python -X importtime -c "import <модуль>"`,
+берётся медиана суммарного времени импорта. Если модуль не укладывается в
+бюджет или при импорте подтянул запрещённый модуль (openai, bs4, aiohttp —
+нужны только при генерации ключевых слов и разборе редкой разметки), скрипт
+завершается с кодом 1. С --render дополнительно замеряется первая отрисовка
+главной страницы (streamlit AppTest в новом процессе против stub_server.py).
+
+    python benchmarks/check_import_budget.py
+    python benchmarks/check_import_budget.py --runs 7 --render
+    python benchmarks/check_import_budget.py --budget app_mvp_v2=700 --json import_budget.json
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(BENCH_DIR)
+
+# Бюджеты в миллисекундах с запасом ~1.5 раза от текущих значений. Модуль интеграции
+# импортирует streamlit (декоратор st.cache_data), поэтому он и CLI близки к приложению
+DEFAULT_BUDGETS = {"app_mvp_v2": 1000, "hh_api_integration_v2": 800, "search_batch": 800}
+FORBIDDEN_MODULES = ("openai", "bs4", "aiohttp")
+DEFAULT_RENDER_BUDGET = 3000
+
+RENDER_SCRIPT = """
+import os, sys, tempfile, time
+sys.path[:0] = [{root!r}, {bench!r}]
+import stub_server, bench_e2e
+server, base_url = stub_server.start_server(0, stub_server.StubConfig())
+bench_e2e.configure_environment(base_url, tempfile.mkdtemp(prefix="hh-import-budget-"))
+started = time.perf_counter()
+from streamlit.testing.v1 import AppTest
+at = AppTest.from_file(bench_e2e.APP_PATH, default_timeout=120)
+at.run()
+elapsed = time.perf_counter() - started
+server.shutdown()
+if at.exception: raise SystemExit("[!] " + at.exception[0].message)
+print(elapsed * 1000)
+"""
+
+
+def parse_importtime(stderr):
+    """{модуль верхнего уровня: суммарное время импорта, мкс} из вывода -X importtime."""
+    modules = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line: continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        if not cumulative.strip().isdigit(): continue  # заголовок
+        modules[name.strip()] = int(cumulative)
+    return modules
+
+
+def measure_import(module):
+    """(время импорта `module` в мс, все загруженные модули) в новом процессе."""
+    completed = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                               cwd=ROOT_DIR, capture_output=True, text=True)
+    if completed.returncode != 0:
+        raise RuntimeError(f"импорт {module} завершился ошибкой:\n{completed.stderr[-2000:]}")
+    modules = parse_importtime(completed.stderr)
+    return modules.get(module, 0) / 1000, modules
+
+
+def measure_render():
+    """Время первой отрисовки главной страницы в новом процессе (импорт streamlit и приложения включён), мс."""
+    script = RENDER_SCRIPT.format(root=ROOT_DIR, bench=BENCH_DIR)
+    completed = subprocess.run([sys.executable, "-c", script], cwd=ROOT_DIR, capture_output=True, text=True)
+    if completed.returncode != 0:
+        raise RuntimeError(f"отрисовка главной страницы завершилась ошибкой:\n{completed.stderr[-2000:]}")
+    return float(completed.stdout.strip().splitlines()[-1])
+
+
+def parse_budget(value):
+    module, _, budget = value.partition("=")
+    if not module or not budget: raise argparse.ArgumentTypeError("ожидается модуль=мс")
+    return module, float(budget)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Бюджет холодного старта приложения и модуля интеграции")
+    parser.add_argument("--runs", type=int, default=5, help="Замеров на модуль (берётся медиана)")
+    parser.add_argument("--budget", type=parse_budget, action="append", default=[],
+                        help="Бюджет импорта модуль=мс (можно несколько раз)")
+    parser.add_argument("--render", action="store_true", help="Также замерить первую отрисовку главной страницы")
+    parser.add_argument("--render-budget", type=float, default=DEFAULT_RENDER_BUDGET, help="Бюджет первой отрисовки, мс")
+    parser.add_argument("--json", help="Сохранить результаты в JSON")
+    args = parser.parse_args(argv)
+    budgets = {**DEFAULT_BUDGETS, **dict(args.budget)}
+
+    results, failed = {}, False
+    for module, budget in budgets.items():
+        timings, loaded = [], {}
+        for _ in range(args.runs):
+            elapsed, loaded = measure_import(module)
+            timings.append(elapsed)
+        median = statistics.median(timings)
+        forbidden = sorted(name for name in FORBIDDEN_MODULES if name in loaded)
+        ok = median <= budget and not forbidden
+        failed |= not ok
+        results[module] = {"median_ms": round(median, 1), "max_ms": round(max(timings), 1),
+                           "budget_ms": budget, "forbidden": forbidden, "ok": ok}
+        print(f"[{'*' if ok else '!'}] {module}: {median:.0f} мс (макс. {max(timings):.0f}), бюджет {budget:.0f} мс")
+        if forbidden: print(f"[!] {module}: при импорте загружены {', '.join(forbidden)} — они должны импортироваться лениво")
+
+    if args.render:
+        started = time.perf_counter()
+        render_ms = measure_render()
+        ok = render_ms <= args.render_budget
+        failed |= not ok
+        results["home_page_render"] = {"ms": round(render_ms, 1), "budget_ms": args.render_budget, "ok": ok}
+        print(f"[{'*' if ok else '!'}] Первая отрисовка главной страницы: {render_ms:.0f} мс, бюджет {args.render_budget:.0f} мс "
+              f"(процесс целиком: {time.perf_counter() - started:.1f} с)")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"), "runs": args.runs, "results": results},
+                      f, ensure_ascii=False, indent=2)
+        print(f"[*] Результаты сохранены: {args.json}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,327 @@
+"""
+Локальная заглушка внешних API для тестов и бенчмарков.
+
+Имитирует OpenAI Chat Completions (POST /v1/chat/completions) — JSON с
+must_have/optional и usage — и используемую приложением часть api.hh.ru:
+/me, /employers/{id}/managers, /employers/{id}/vacancies/active,
+/vacancies/{id} (с ETag и 304), /areas[/{id}], /resumes и /resumes/{id}.
+Данные генерируются детерминированно из seed и корпуса описаний вакансий
+(benchmarks/corpus), выдача /resumes зависит только от запроса и фильтров.
+Задержка, доля ответов 429/500 и серии 429 подряд настраиваются.
+
+    python benchmarks/stub_server.py --port 8010 --latency 0.5 --rate-limit-ratio 0.05
+    OPENAI_BASE_URL=http://127.0.0.1:8010/v1 OPENAI_API_KEY=stub python keyword_batch.py ...
+    HH_API_URL=http://127.0.0.1:8010 ACCESS_TOKEN=stub streamlit run app_mvp_v2.py
+"""
+import argparse
+import hashlib
+import json
+import os
+import random
+import re
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CORPUS_PATH = os.path.join(ROOT_DIR, "benchmarks", "corpus", "vacancy_descriptions.jsonl")
+AREAS_PATH = os.path.join(ROOT_DIR, "data", "areas_kz.json")
+EMPLOYER_ID = "24761"
+# Глубина выдачи /resumes на hh.ru ограничена 2000 резюме
+MAX_RESUMES_DEPTH = 2000
+RESUME_SKILLS = ["Python", "Java", "SQL", "PostgreSQL", "Kafka", "Docker", "Kubernetes", "Spring", "Django",
+                 "FastAPI", "Linux", "Git", "Oracle", "1С", "Excel", "аналитика", "кредитование", "риски"]
+RESUME_TITLES = ["Разработчик", "Ведущий разработчик", "Аналитик", "Специалист", "Инженер", "Тестировщик"]
+
+
+class StubConfig:
+    def __init__(self, latency=0.0, jitter=0.0, rate_limit_ratio=0.0, error_ratio=0.0,
+                 burst_every=0, burst_length=0, retry_after=1.0, managers=3, vacancies=40,
+                 empty_ideal_ratio=0.25, seed=0):
+        self.latency = latency
+        self.jitter = jitter
+        self.rate_limit_ratio = rate_limit_ratio
+        self.error_ratio = error_ratio
+        # Серии 429: каждые burst_every запросов следующие burst_length получают 429
+        self.burst_every = burst_every
+        self.burst_length = burst_length
+        self.retry_after = retry_after
+        self.managers = managers
+        self.vacancies = vacancies
+        # Доля "идеальных" запросов (с блоком дополнительных слов), которые ничего не находят
+        self.empty_ideal_ratio = empty_ideal_ratio
+        self.seed = seed
+        self.requests = 0
+        self.lock = threading.Lock()
+
+    def delay(self):
+        return max(0.0, self.latency + random.uniform(-self.jitter, self.jitter))
+
+
+def _stable_random(*parts):
+    """Генератор, зависящий только от аргументов (а не от PYTHONHASHSEED)."""
+    digest = hashlib.sha1(json.dumps(parts, ensure_ascii=False, sort_keys=True).encode("utf-8")).hexdigest()
+    return random.Random(int(digest[:16], 16))
+
+
+class HHFixtures:
+    """Детерминированные менеджеры, вакансии, регионы и резюме для заглушки hh.ru."""
+
+    def __init__(self, config):
+        self.config = config
+        rng = random.Random(config.seed)
+        with open(CORPUS_PATH, encoding="utf-8") as f:
+            corpus = [json.loads(line) for line in f if line.strip()]
+        with open(AREAS_PATH, encoding="utf-8") as f:
+            area_rows = json.load(f)["areas"]
+        self.areas = self._area_tree(area_rows)
+        cities = [{"id": area_id, "name": name} for area_id, name, parent_id in area_rows if parent_id]
+
+        self.managers = [{"id": f"m{i + 1}", "name": f"Менеджер {i + 1}"} for i in range(config.managers)]
+        now = datetime.now(timezone.utc)
+        self.vacancies, self.details = [], {}
+        for i in range(config.vacancies):
+            source = corpus[i % len(corpus)]
+            vacancy_id = str(90000000 + i)
+            manager = self.managers[i % len(self.managers)]
+            area = cities[i % len(cities)]
+            published_at = (now - timedelta(hours=rng.randint(1, 24 * 60))).strftime("%Y-%m-%dT%H:%M:%S%z")
+            vacancy = {"id": vacancy_id, "name": source["name"], "area": area, "manager": manager,
+                       "published_at": published_at, "alternate_url": f"https://hh.kz/vacancy/{vacancy_id}",
+                       "counters": {"responses": rng.randint(0, 300), "unread_responses": rng.randint(0, 30)}}
+            self.vacancies.append(vacancy)
+            # Номер в описании делает тексты разными — ключ кэша LLM у каждой вакансии свой
+            self.details[vacancy_id] = {**vacancy, "description": f"{source['description']}<p>Вакансия №{i + 1}</p>",
+                                        "experience": {"id": "between1And3", "name": "От 1 года до 3 лет"}}
+
+    @staticmethod
+    def _area_tree(rows):
+        nodes = {area_id: {"id": area_id, "name": name, "parent_id": parent_id, "areas": []} for area_id, name, parent_id in rows}
+        roots = []
+        for node in nodes.values():
+            (nodes[node["parent_id"]]["areas"] if node["parent_id"] in nodes else roots).append(node)
+        return roots
+
+    def resumes_page(self, params):
+        """Выдача /resumes: число найденных и состав страницы зависят только от запроса и фильтров."""
+        text = params.get("text", [""])[0]
+        page = int(params.get("page", ["0"])[0])
+        per_page = int(params.get("per_page", ["20"])[0])
+        filters = {k: sorted(v) for k, v in params.items() if k not in ("page", "per_page")}
+        rng = _stable_random("resumes", self.config.seed, filters)
+        # "Идеальный" запрос — обязательные AND (группа дополнительных через OR), в любом порядке
+        if " AND " in text and "(" in text and rng.random() < self.config.empty_ideal_ratio:
+            found = 0
+        else:
+            found = rng.randint(40, 1500)
+        if "date_from" in params: found //= 20
+        pages = min(-(-found // per_page), MAX_RESUMES_DEPTH // per_page)
+        terms = [t.strip('"()') for t in re.split(r"\s+(?:AND|OR|NOT)\s+|\s+", text) if t.strip('"()') and t not in ("AND", "OR", "NOT")]
+        items = []
+        if page < pages:
+            first = page * per_page
+            for position in range(first, min(first + per_page, found)):
+                items.append(self.resume(str(_stable_random("resume-id", filters, position).randint(1, 50000)), terms))
+        return {"found": found, "pages": pages, "page": page, "per_page": per_page, "items": items}
+
+    def resume(self, resume_id, terms=(), full=False):
+        rng = _stable_random("resume", self.config.seed, resume_id)
+        skills = rng.sample(RESUME_SKILLS, 5)
+        term = terms[0] if terms else skills[0]
+        updated_at = (datetime(2026, 1, 1, tzinfo=timezone.utc) + timedelta(minutes=rng.randint(0, 400000))).strftime("%Y-%m-%dT%H:%M:%S%z")
+        experience = [{"company": f"Компания {rng.randint(1, 500)}", "position": f"{rng.choice(RESUME_TITLES)} {skill}",
+                       "start": f"{2024 - n * 2}-0{rng.randint(1, 9)}-01", "end": None if n == 0 else f"{2026 - n * 2}-01-01"}
+                      for n, skill in enumerate(skills[:3])]
+        resume = {"id": resume_id, "title": f"{rng.choice(RESUME_TITLES)} {term}", "age": rng.randint(21, 55),
+                  "area": {"id": "160", "name": "Алматы"}, "updated_at": updated_at, "experience": experience[:1],
+                  "alternate_url": f"https://hh.kz/resume/{resume_id}",
+                  "snippet": {"requirement": " ".join(f"<highlighttext>{t}</highlighttext>" for t in terms[:3]) or None}}
+        if full:
+            resume.update({"experience": experience, "skill_set": skills,
+                           "total_experience": {"months": rng.randint(6, 240)},
+                           "salary": {"amount": rng.randint(300, 1500) * 1000, "currency": "KZT"}})
+        return resume
+
+    def paginate(self, items, params, default_per_page):
+        page = int(params.get("page", ["0"])[0])
+        per_page = int(params.get("per_page", [str(default_per_page)])[0])
+        return {"found": len(items), "pages": -(-len(items) // per_page), "page": page, "per_page": per_page,
+                "items": items[page * per_page:(page + 1) * per_page]}
+
+
+def fake_keywords(text):
+    """Детерминированно «извлекает» ключевые слова: латинские термины и длинные русские слова."""
+    latin = list(dict.fromkeys(re.findall(r"\b[A-Za-z][A-Za-z0-9+#.]{1,20}\b", text)))
+    russian = list(dict.fromkeys(w.lower() for w in re.findall(r"\b[А-Яа-яЁё]{9,}\b", text)))
+    return {"must_have": latin[:4] or russian[:2], "optional": (latin[4:10] + russian[:4])[:8]}
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    config = StubConfig()
+    fixtures = None
+
+    def log_message(self, *args):
+        pass
+
+    def _send_json(self, status, payload, headers=None):
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_list_page(self, page):
+        """Страница списка с ETag по содержимому; на совпавший If-None-Match — 304 без тела."""
+        etag = '"%s"' % hashlib.sha1(json.dumps(page, sort_keys=True).encode("utf-8")).hexdigest()[:16]
+        if self.headers.get("If-None-Match") == etag:
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        self._send_json(200, page, {"ETag": etag})
+
+    def _read_json(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        return json.loads(self.rfile.read(length) or b"{}")
+
+    def _maybe_fail(self, hh_style=False):
+        """Имитирует 429/500 (случайно и сериями). Возвращает True, если ответ уже отправлен."""
+        config = self.config
+        with config.lock:
+            config.requests += 1
+            in_burst = config.burst_every and config.requests % config.burst_every < config.burst_length
+        roll = random.random()
+        if in_burst or roll < config.rate_limit_ratio:
+            payload = {"errors": [{"type": "too_many_requests"}]} if hh_style else {"error": {"message": "Rate limit reached", "type": "rate_limit"}}
+            self._send_json(429, payload, {"Retry-After": f"{config.retry_after:g}"})
+            return True
+        if roll < config.rate_limit_ratio + config.error_ratio:
+            payload = {"errors": [{"type": "server_error"}]} if hh_style else {"error": {"message": "Internal error", "type": "server_error"}}
+            self._send_json(500, payload)
+            return True
+        return False
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        params = parse_qs(url.query)
+        fixtures = self.fixtures
+        time.sleep(self.config.delay())
+        if self._maybe_fail(hh_style=True): return
+
+        path = url.path.rstrip("/")
+        if path == "/me":
+            self._send_json(200, {"id": fixtures.managers[0]["id"], "first_name": "Stub", "last_name": "User",
+                                  "employer": {"id": EMPLOYER_ID}, "manager": {"id": fixtures.managers[0]["id"]}})
+        elif re.fullmatch(r"/employers/\w+/managers", path):
+            self._send_list_page(fixtures.paginate(fixtures.managers, params, 20))
+        elif re.fullmatch(r"/employers/\w+/vacancies/active", path):
+            manager_id = params.get("manager_id", [None])[0]
+            vacancies = [v for v in fixtures.vacancies if manager_id is None or v["manager"]["id"] == manager_id]
+            self._send_list_page(fixtures.paginate(vacancies, params, 20))
+        elif (match := re.fullmatch(r"/vacancies/(\w+)", path)):
+            details = fixtures.details.get(match.group(1))
+            if details is None:
+                self._send_json(404, {"errors": [{"type": "not_found"}]})
+                return
+            etag = f'"{details["id"]}-1"'
+            if self.headers.get("If-None-Match") == etag:
+                self.send_response(304)
+                self.send_header("ETag", etag)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            self._send_json(200, details, {"ETag": etag})
+        elif path == "/areas":
+            self._send_json(200, fixtures.areas)
+        elif (match := re.fullmatch(r"/areas/(\w+)", path)):
+            stack = list(fixtures.areas)
+            while stack:
+                node = stack.pop()
+                if node["id"] == match.group(1): break
+                stack.extend(node["areas"])
+            else:
+                node = None
+            if node is None: self._send_json(404, {"errors": [{"type": "not_found"}]})
+            else: self._send_json(200, node)
+        elif path == "/resumes":
+            self._send_json(200, fixtures.resumes_page(params))
+        elif (match := re.fullmatch(r"/resumes/(\w+)", path)):
+            self._send_json(200, fixtures.resume(match.group(1), full=True))
+        else:
+            self._send_json(404, {"errors": [{"type": "not_found", "value": self.path}]})
+
+    def do_POST(self):
+        if self.path.rstrip("/") != "/v1/chat/completions":
+            self._send_json(404, {"error": {"message": f"Unknown path {self.path}"}})
+            return
+        request = self._read_json()
+        time.sleep(self.config.delay())
+        if self._maybe_fail(): return
+        user_text = " ".join(m.get("content", "") for m in request.get("messages", []) if m.get("role") == "user")
+        content = json.dumps(fake_keywords(user_text), ensure_ascii=False)
+        prompt_tokens = sum(len(m.get("content", "")) for m in request.get("messages", [])) // 4
+        completion_tokens = len(content) // 4
+        self._send_json(200, {
+            "id": f"chatcmpl-stub-{self.config.requests}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": request.get("model", "stub"),
+            "choices": [{"index": 0, "finish_reason": "stop",
+                         "message": {"role": "assistant", "content": content}}],
+            "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                      "total_tokens": prompt_tokens + completion_tokens},
+        })
+
+
+def start_server(port=0, config=None):
+    """
+    Запускает заглушку в фоновом потоке. Возвращает (server, base_url):
+    base_url — адрес для HH_API_URL, f"{base_url}/v1" — для OPENAI_BASE_URL.
+    """
+    config = config or StubConfig()
+    handler = type("ConfiguredStubHandler", (StubHandler,), {"config": config, "fixtures": HHFixtures(config)})
+    server = ThreadingHTTPServer(("127.0.0.1", port), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_port}"
+
+
+def add_config_arguments(parser):
+    parser.add_argument("--latency", type=float, default=0.0, help="Задержка ответа, сек")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Разброс задержки, сек")
+    parser.add_argument("--rate-limit-ratio", type=float, default=0.0, help="Доля ответов 429")
+    parser.add_argument("--error-ratio", type=float, default=0.0, help="Доля ответов 500")
+    parser.add_argument("--burst-every", type=int, default=0, help="Серия 429 каждые N запросов (0 — без серий)")
+    parser.add_argument("--burst-length", type=int, default=0, help="Длина серии 429, запросов")
+    parser.add_argument("--retry-after", type=float, default=1.0, help="Retry-After в ответах 429, сек")
+    parser.add_argument("--managers", type=int, default=3, help="Менеджеров у работодателя")
+    parser.add_argument("--vacancies", type=int, default=40, help="Активных вакансий")
+    parser.add_argument("--seed", type=int, default=0)
+
+
+def config_from_args(args):
+    return StubConfig(args.latency, args.jitter, args.rate_limit_ratio, args.error_ratio, args.burst_every,
+                      args.burst_length, args.retry_after, args.managers, args.vacancies, seed=args.seed)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Локальная заглушка OpenAI API и api.hh.ru")
+    add_config_arguments(parser)
+    parser.add_argument("--port", type=int, default=8010)
+    args = parser.parse_args(argv)
+    server, base_url = start_server(args.port, config_from_args(args))
+    print(f"Заглушка запущена: HH_API_URL={base_url} OPENAI_BASE_URL={base_url}/v1")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
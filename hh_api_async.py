@@ -0,0 +1,213 @@
+"""
+Асинхронный слой для api.hh.ru на asyncio/aiohttp.
+
+Все функции возвращают awaitable и используют один пул соединений на event loop,
+поэтому пакетные задачи и UI могут выполнять много запросов одновременно без
+отдельного потока на каждый. Функции не обращаются к Streamlit: ошибки
+сообщаются исключением `HHAPIError`.
+"""
+import asyncio
+import random
+import weakref
+
+import aiohttp
+
+import hh_api_integration_v2 as hh
+from hh_api_integration_v2 import HHAPIError
+from hh_areas import COUNTRY_ID, AreaIndex
+from ranking import rank_resumes
+
+
+def _flatten_params(params):
+    """aiohttp не принимает списки в params — разворачиваем их в пары (ключ, значение)."""
+    flat = []
+    for key, value in (params or {}).items():
+        values = value if isinstance(value, (list, tuple)) else [value]
+        for item in values:
+            if item is None: continue
+            if isinstance(item, bool): item = str(item).lower()
+            flat.append((key, str(item)))
+    return flat
+
+
+class AsyncHHClient:
+    """
+    Асинхронный аналог HHClient: keep-alive пул aiohttp, ограничение числа
+    одновременных запросов, таймауты по эндпоинтам и backoff с джиттером.
+    Retry-After выдерживается полностью, а если он длиннее retry_after_max —
+    повтора нет. Сессия привязана к event loop, в котором создана.
+    """
+
+    def __init__(self, max_concurrency=None, max_retries=3, backoff_base=0.5, backoff_max=8.0, retry_after_max=None):
+        self.max_concurrency = max_concurrency or hh.HH_MAX_CONCURRENCY
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.retry_after_max = hh.HH_RETRY_AFTER_MAX if retry_after_max is None else retry_after_max
+        self._session = None
+        self._semaphore = None
+
+    def _get_session(self):
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(limit=max(self.max_concurrency, 10), keepalive_timeout=30)
+            self._session = aiohttp.ClientSession(connector=connector, headers={"User-Agent": hh.USER_AGENT})
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        return self._session
+
+    def _retry_delay(self, attempt, headers=None):
+        """Как HHClient._retry_delay: Retry-After целиком или full jitter; None — не повторять."""
+        delay = hh.parse_retry_after(headers.get("Retry-After")) if headers else None
+        if delay is not None: return delay if delay <= self.retry_after_max else None
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+
+    async def get_json(self, path, endpoint="default", auth=True, params=None):
+        """
+        GET-запрос с повторами. Возвращает разобранный JSON, при ошибке
+        (сеть, таймаут, неуспешный статус) бросает HHAPIError.
+        """
+        session = self._get_session()
+        url = path if path.startswith("http") else f"{hh.HH_API_URL}{path}"
+        headers = {}
+        if auth:
+            headers = hh.get_client().auth_headers
+            if not headers: raise HHAPIError("Токен доступа ACCESS_TOKEN не найден.", url=url)
+        connect, read = hh.ENDPOINT_TIMEOUTS.get(endpoint, hh.ENDPOINT_TIMEOUTS["default"])
+        timeout = aiohttp.ClientTimeout(sock_connect=connect, sock_read=read)
+
+        for attempt in range(self.max_retries + 1):
+            try:
+                async with self._semaphore:
+                    async with session.get(url, params=_flatten_params(params), headers=headers, timeout=timeout) as response:
+                        if response.status == 200:
+                            return await response.json(content_type=None)
+                        status, response_headers = response.status, response.headers
+                        body = await response.text()
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                if attempt >= self.max_retries: raise HHAPIError(f"Ошибка запроса к {url}: {e}", url=url) from e
+                await asyncio.sleep(self._retry_delay(attempt))
+                continue
+            delay = self._retry_delay(attempt, response_headers) if status in hh.RETRY_STATUSES and attempt < self.max_retries else None
+            if delay is not None:
+                await asyncio.sleep(delay)
+                continue
+            raise HHAPIError(f"hh.ru вернул {status} для {url}: {body[:200]}", status=status, url=url)
+
+    async def close(self):
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+
+_clients = weakref.WeakKeyDictionary()
+
+def get_async_client():
+    """Возвращает общий AsyncHHClient для текущего event loop."""
+    loop = asyncio.get_running_loop()
+    client = _clients.get(loop)
+    if client is None:
+        client = _clients[loop] = AsyncHHClient()
+    return client
+
+
+async def _fetch_all_pages(list_requests, endpoint, per_page, client=None):
+    """Асинхронный аналог hh._fetch_all_pages: первые страницы, затем остальные — параллельно."""
+    client = client or get_async_client()
+
+    async def fetch(path, params, page):
+        return await client.get_json(path, endpoint=endpoint, params={**params, "page": page, "per_page": per_page})
+
+    first_pages = await asyncio.gather(*(fetch(path, params, 0) for path, params in list_requests))
+    rest_pages = await asyncio.gather(*(
+        fetch(path, params, page)
+        for (path, params), data in zip(list_requests, first_pages)
+        for page in range(1, data.get("pages", 1))))
+    items = []
+    for data in [*first_pages, *rest_pages]:
+        items.extend(data.get("items", []))
+    return items
+
+
+async def get_current_user_info(client=None):
+    client = client or get_async_client()
+    return await client.get_json("/me", endpoint="me")
+
+async def get_managers(employer_id="24761", client=None):
+    return await _fetch_all_pages([(f"/employers/{employer_id}/managers", {})], "managers", per_page=100, client=client)
+
+async def get_active_vacancies(manager_ids, employer_id="24761", client=None):
+    """Все активные вакансии всех менеджеров, без дубликатов по id."""
+    path = f"/employers/{employer_id}/vacancies/active"
+    items = await _fetch_all_pages([(path, {"manager_id": manager_id}) for manager_id in manager_ids],
+                                   "vacancies", per_page=50, client=client)
+    unique_vacancies = {}
+    for vacancy in items:
+        unique_vacancies.setdefault(vacancy["id"], vacancy)
+    return list(unique_vacancies.values())
+
+async def get_vacancy_details(vacancy_id, client=None):
+    client = client or get_async_client()
+    return await client.get_json(f"/vacancies/{vacancy_id}", endpoint="vacancies", auth=False)
+
+async def get_area_dictionary(client=None):
+    """Плоский словарь регионов Казахстана {название: id}; загружается только поддерево страны."""
+    client = client or get_async_client()
+    tree = await client.get_json(f"/areas/{COUNTRY_ID}", endpoint="areas", auth=False)
+    return AreaIndex.from_tree(tree).as_options()
+
+async def search_resumes(text_query, search_filters, page=0, client=None):
+    """Один запрос к /resumes. Возвращает сырой JSON ответа hh.ru."""
+    client = client or get_async_client()
+    params = {**search_filters, "page": page, "text": text_query}
+    return await client.get_json("/resumes", endpoint="resumes", params=params)
+
+async def advanced_search_resumes(search_params, search_filters, client=None, fallback=None):
+    """
+    Двухступенчатый поиск без Streamlit: "идеальный" запрос (must_have + optional),
+    а если на первой странице ничего не найдено — только по must_have.
+    На первой странице оба запроса выполняются одновременно, ненужный отменяется.
+    В результате `fallback` показывает, какой этап дал выдачу; для следующих
+    страниц его передают обратно аргументом `fallback`, как в hh.search_resumes.
+    Если он не передан, первая страница "идеального" запроса запрашивается заново.
+    """
+    filters = {k: v for k, v in search_filters.items() if k not in ("user_job_title", "bank_only")}
+    page_number = filters.pop("page", 0)
+    ideal_query = hh.build_query_text(search_params['must_have'], search_params['optional'])
+    main_query = hh.build_query_text(search_params['must_have'], [])
+    if not ideal_query: raise HHAPIError("Не заданы обязательные критерии для поиска.")
+
+    has_fallback = bool(main_query) and main_query != ideal_query
+    if page_number > 0:
+        # Листаем тот запрос, который дал выдачу на первой странице
+        if fallback is None:
+            fallback = has_fallback and (await search_resumes(ideal_query, filters, 0, client=client)).get("found", 0) == 0
+        fallback = has_fallback and fallback
+        results = await search_resumes(main_query if fallback else ideal_query, filters, page_number, client=client)
+        results["items"] = rank_resumes(results.get("items", []), search_params)
+        results["fallback"] = fallback
+        return results
+
+    fallback_task = None
+    if has_fallback:
+        fallback_task = asyncio.create_task(search_resumes(main_query, filters, page_number, client=client))
+    try:
+        results = await search_resumes(ideal_query, filters, page_number, client=client)
+    except BaseException:
+        if fallback_task: fallback_task.cancel()
+        raise
+
+    fallback = False
+    if fallback_task is not None:
+        if results.get("found", 0) == 0:
+            results = await fallback_task
+            fallback = True
+        else:
+            fallback_task.cancel()
+
+    results["items"] = rank_resumes(results.get("items", []), search_params)
+    results["fallback"] = fallback
+    return results
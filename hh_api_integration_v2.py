@@ -1,184 +1,413 @@
 import requests
+from requests.adapters import HTTPAdapter
 import streamlit as st
-from bs4 import BeautifulSoup
 import os
-import openai
 import json
+import hashlib
 from dotenv import load_dotenv
 import time
+import random
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
 from urllib.parse import urlencode, unquote_plus
 import re
+from hh_cache import get_vacancy_cache, get_keyword_store, get_search_cache, get_watermark_store, get_resume_cache
+from hh_areas import get_area_index
+import metrics
+from ranking import rank_resumes
+from query_compiler import compile_query, query_hash
 
 load_dotenv()
 
+# --- HTTP-клиент для api.hh.ru ---
+# Переопределяется для локальной заглушки (benchmarks/stub_server.py)
+HH_API_URL = os.getenv("HH_API_URL", "https://api.hh.ru")
+USER_AGENT = "ForteTalent/1.6"
+
+# Таймауты (connect, read) в секундах для каждого типа эндпоинта
+ENDPOINT_TIMEOUTS = {
+    "me": (3.05, 10),
+    "areas": (3.05, 20),
+    "managers": (3.05, 10),
+    "vacancies": (3.05, 10),
+    "resumes": (3.05, 15),
+    "default": (3.05, 10),
+}
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+# Retry-After дольше этого (сек) не ждём: запрос сразу завершается ответом сервера
+HH_RETRY_AFTER_MAX = float(os.getenv("HH_RETRY_AFTER_MAX", "30"))
+# Сколько запросов к hh.ru одновременно выполняется при параллельной выгрузке
+HH_MAX_CONCURRENCY = int(os.getenv("HH_MAX_CONCURRENCY", "8"))
+# Суточный лимит просмотров полных резюме (квота работодателя на hh.ru), 0 — без лимита
+RESUME_VIEW_DAILY_LIMIT = int(os.getenv("RESUME_VIEW_DAILY_LIMIT", "200"))
+# Ответы hh.ru, после которых дальнейшие просмотры резюме бессмысленны (квота исчерпана)
+QUOTA_STATUSES = {403, 429}
+
+
+class HHAPIError(Exception):
+    """Ошибка обращения к hh.ru для кода, работающего вне Streamlit."""
+
+    def __init__(self, message, status=None, url=None):
+        super().__init__(message)
+        self.status = status
+        self.url = url
+
+
+def parse_retry_after(value):
+    """Секунды из заголовка Retry-After (число или HTTP-дата); None, если заголовка нет или он некорректен."""
+    if not value: return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        return max(parsedate_to_datetime(value).timestamp() - time.time(), 0.0)
+    except (TypeError, ValueError):
+        return None
+
+
+class HHClient:
+    """
+    Общий клиент для всех запросов к hh.ru: пул keep-alive соединений,
+    таймауты по эндпоинтам и экспоненциальный backoff с джиттером. Заголовок
+    Retry-After при ответах 429/5xx выдерживается полностью; если он длиннее
+    retry_after_max, повтора нет и возвращается ответ сервера.
+    """
+
+    def __init__(self, max_retries=3, backoff_base=0.5, backoff_max=8.0, pool_size=20, retry_after_max=HH_RETRY_AFTER_MAX):
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.retry_after_max = retry_after_max
+        self.session = requests.Session()
+        # Повторы делаем сами, чтобы учитывать Retry-After и джиттер
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.session.headers["User-Agent"] = USER_AGENT
+        self._access_token = None
+        self._auth_headers = None
+        self._lock = threading.Lock()
+
+    def _load_auth(self):
+        """
+        Токен читается из окружения и кэшируется вместе с заголовками. Отсутствующий
+        токен не кэшируется: заданный позже ACCESS_TOKEN подхватится без перезапуска.
+        """
+        with self._lock:
+            if self._access_token is None:
+                token = os.getenv("ACCESS_TOKEN")
+                if not token: return "", {}
+                self._access_token = token
+                self._auth_headers = {"Authorization": f"Bearer {token}"}
+            return self._access_token, self._auth_headers
+
+    @property
+    def access_token(self):
+        if self._access_token is None: return self._load_auth()[0]
+        return self._access_token
+
+    @property
+    def auth_headers(self):
+        if self._auth_headers is None: return self._load_auth()[1]
+        return self._auth_headers
+
+    def reset_auth(self):
+        """Сбрасывает кэш токена (например, после его обновления в .env)."""
+        with self._lock:
+            self._access_token = None
+            self._auth_headers = None
+
+    def _retry_delay(self, attempt, response=None):
+        """
+        Задержка перед повтором: Retry-After целиком, если он есть, иначе full jitter.
+        None — сервер просит ждать дольше retry_after_max, повторять не нужно.
+        """
+        delay = parse_retry_after(response.headers.get("Retry-After")) if response is not None else None
+        if delay is not None: return delay if delay <= self.retry_after_max else None
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+
+    def request(self, method, path, endpoint="default", auth=True, params=None, headers=None, timeout=None):
+        """
+        Выполняет запрос с повторами. Возвращает последний `requests.Response`;
+        сетевые ошибки после исчерпания попыток пробрасываются как RequestException.
+        """
+        url = path if path.startswith("http") else f"{HH_API_URL}{path}"
+        request_headers = {**self.auth_headers} if auth else {}
+        if headers: request_headers.update(headers)
+        timeout = timeout or ENDPOINT_TIMEOUTS.get(endpoint, ENDPOINT_TIMEOUTS["default"])
+
+        for attempt in range(self.max_retries + 1):
+            started = time.perf_counter()
+            try:
+                response = self.session.request(method, url, params=params, headers=request_headers, timeout=timeout)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                metrics.inc("hh_request_errors_total", endpoint=endpoint, error=type(e).__name__)
+                if attempt >= self.max_retries: raise
+                metrics.inc("hh_request_retries_total", endpoint=endpoint, reason=type(e).__name__)
+                time.sleep(self._retry_delay(attempt))
+                continue
+            metrics.observe("hh_request_duration_seconds", time.perf_counter() - started, endpoint=endpoint)
+            metrics.inc("hh_requests_total", endpoint=endpoint, status=str(response.status_code))
+            if response.status_code in RETRY_STATUSES and attempt < self.max_retries:
+                delay = self._retry_delay(attempt, response)
+                if delay is not None:
+                    metrics.inc("hh_request_retries_total", endpoint=endpoint, reason=str(response.status_code))
+                    response.close()
+                    time.sleep(delay)
+                    continue
+            # Тело всё равно будет прочитано вызывающим кодом; при выключенных метриках не трогаем его
+            if metrics.ENABLED: metrics.inc("hh_response_bytes_total", len(response.content), endpoint=endpoint)
+            return response
+
+    def get(self, path, **kwargs):
+        return self.request("GET", path, **kwargs)
+
+
+_client = None
+_client_lock = threading.Lock()
+
+def get_client():
+    """Возвращает единственный на процесс экземпляр HHClient."""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = HHClient()
+    return _client
+
 # --- Эти функции можно оставить без изменений ---
 def get_access_token():
-    token = os.getenv("ACCESS_TOKEN")
+    token = get_client().access_token
     if not token:
         st.error("Токен доступа ACCESS_TOKEN не найден в .env файле.")
     return token
 
 def get_current_user_info():
-    access_token = get_access_token()
-    if not access_token: return None
-    headers = {"Authorization": f"Bearer {access_token}", "User-Agent": "ForteTalent/1.3"}
-    url = "https://api.hh.ru/me"
-    response = requests.get(url, headers=headers)
+    if not get_access_token(): return None
+    try:
+        response = get_client().get("/me", endpoint="me")
+    except requests.exceptions.RequestException:
+        return None
     if response.status_code == 200:
         return response.json()
     return None
 
 # hh_api_integration_v2.py
 
-@st.cache_data(show_spinner="Загрузка справочника регионов Казахстана...")
 def get_area_dictionary():
     """
-    Загружает и кэширует справочник регионов ТОЛЬКО для Казахстана.
-    Преобразует древовидную структуру в плоский словарь для selectbox.
+    Справочник регионов Казахстана {название: id} для selectbox. Берётся из
+    компактного снимка поддерева страны (hh_areas) без загрузки мирового
+    дерева /areas; устаревший снимок обновляется в фоне.
+    """
+    area_index = get_area_index()
+    if area_index is None:
+        st.error("Справочник регионов недоступен, используется базовый список.")
+        return {"Астана": "159", "Алматы": "160", "Казахстан": "40"}
+    return area_index.as_options()
+    
+def _get_page(path, endpoint, params, page, per_page, raise_errors=False, page_cache=None):
+    """
+    Загружает одну страницу списка. Возвращает JSON или None при ошибке
+    (с raise_errors=True вместо None бросает HHAPIError).
+    С `page_cache` ({ключ страницы: (ETag, JSON)}) страница перепроверяется
+    условным запросом: на 304 возвращается сохранённый JSON без тела ответа.
     """
+    url = f"{HH_API_URL}{path}"
+    request_params = {**params, "page": page, "per_page": per_page}
+    cache_key = (path, tuple(sorted(request_params.items())))
+    cached = page_cache.get(cache_key) if page_cache is not None else None
     try:
-        response = requests.get("https://api.hh.ru/areas", timeout=10)
-        response.raise_for_status()
-        all_countries = response.json()
-        
-        # 1. Находим объект "Казахстан" в общем списке
-        kazakhstan_node = next((country for country in all_countries if country['id'] == '40'), None)
-
-        if not kazakhstan_node:
-            st.error("Не удалось найти Казахстан в справочнике регионов HH.ru.")
-            return {"Астана": "160", "Алматы": "159"} # Fallback
-
-        area_dict = {}
-
-        def parse_kz_area_node(node):
-            """Рекурсивная функция для парсинга регионов внутри Казахстана."""
-            # Добавляем в словарь и города, и области
-            area_dict[node['name']] = node['id']
-            if 'areas' in node and node['areas']:
-                for sub_area in node['areas']:
-                    parse_kz_area_node(sub_area)
-
-        # 2. Запускаем рекурсивный парсинг только для дочерних регионов Казахстана
-        for region in kazakhstan_node['areas']:
-            parse_kz_area_node(region)
-            
-        # 3. Добавляем сам "Казахстан" как опцию для поиска по всей стране
-        area_dict[kazakhstan_node['name']] = kazakhstan_node['id']
+        response = get_client().get(path, endpoint=endpoint, params=request_params,
+                                    headers={"If-None-Match": cached[0]} if cached else None)
+    except requests.exceptions.RequestException as e:
+        if raise_errors: raise HHAPIError(str(e), url=url) from e
+        return None
+    if response.status_code == 304 and cached:
+        metrics.inc("cache_requests_total", cache=f"{endpoint}_pages", result="revalidated")
+        return cached[1]
+    if response.status_code != 200:
+        if raise_errors: raise HHAPIError(f"hh.ru вернул {response.status_code} для {url}", status=response.status_code, url=url)
+        return None
+    data = response.json()
+    if page_cache is not None:
+        metrics.inc("cache_requests_total", cache=f"{endpoint}_pages", result="miss")
+        if response.headers.get("ETag"): page_cache[cache_key] = (response.headers["ETag"], data)
+    return data
 
-        # Сортируем словарь по ключам (названиям) для удобства
-        return dict(sorted(area_dict.items()))
-    
+def _fetch_all_pages(list_requests, endpoint, per_page, max_workers=None, raise_errors=False, page_cache=None):
+    """
+    Выгружает все страницы для набора списковых запросов [(path, params), ...].
+    Сначала параллельно запрашиваются первые страницы (из них узнаем `pages`),
+    затем — все оставшиеся страницы всех запросов, тоже параллельно.
+    По умолчанию недоступные страницы пропускаются; raise_errors=True нужен,
+    когда неполная выгрузка недопустима (например, для расчёта разницы списков).
+    `page_cache` — см. _get_page: неизменившиеся страницы не перекачиваются.
+    """
+    if not list_requests: return []
+    max_workers = max_workers or HH_MAX_CONCURRENCY
+    get_page = lambda path, params, page: _get_page(path, endpoint, params, page, per_page, raise_errors, page_cache)
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        first_pages = list(pool.map(lambda req: get_page(req[0], req[1], 0), list_requests))
+        rest = [(path, params, page)
+                for (path, params), data in zip(list_requests, first_pages) if data
+                for page in range(1, data.get("pages", 1))]
+        rest_pages = list(pool.map(lambda req: get_page(*req), rest))
+
+    items = []
+    for data in first_pages + rest_pages:
+        if data: items.extend(data.get("items", []))
+    return items
+
+def get_managers(employer_id="24761", max_workers=None, raise_errors=False, page_cache=None):
+    if not get_access_token(): return []
+    return _fetch_all_pages([(f"/employers/{employer_id}/managers", {})], "managers", per_page=100,
+                            max_workers=max_workers, raise_errors=raise_errors, page_cache=page_cache)
+
+def get_active_vacancies(manager_ids, employer_id="24761", max_workers=None, raise_errors=False, page_cache=None):
+    """
+    Загружает все активные вакансии всех менеджеров (все страницы, параллельно
+    не более `max_workers` запросов). Дубликаты убираются по id вакансии.
+    """
+    if not get_access_token(): return []
+    path = f"/employers/{employer_id}/vacancies/active"
+    items = _fetch_all_pages([(path, {"manager_id": manager_id}) for manager_id in manager_ids],
+                             "vacancies", per_page=50, max_workers=max_workers, raise_errors=raise_errors,
+                             page_cache=page_cache)
+    unique_vacancies = {}
+    for vacancy in items:
+        unique_vacancies.setdefault(vacancy["id"], vacancy)
+    return list(unique_vacancies.values())
+
+def fetch_vacancy_details(vacancy_id):
+    """
+    Детали вакансии через персистентный кэш: свежая запись отдаётся без запроса,
+    устаревшая перепроверяется условным запросом (ETag / Last-Modified).
+    Не использует Streamlit: если данных нет ни в кэше, ни в ответе, бросает HHAPIError.
+    """
+    cache = get_vacancy_cache()
+    cached = cache.get(vacancy_id)
+    if cached and cached.fresh:
+        metrics.inc("cache_requests_total", cache="vacancies", result="hit")
+        return cached.data
+
+    headers = {}
+    if cached and cached.etag: headers["If-None-Match"] = cached.etag
+    if cached and cached.last_modified: headers["If-Modified-Since"] = cached.last_modified
+    try:
+        # Повторы с backoff выполняет HHClient
+        response = get_client().get(f"/vacancies/{vacancy_id}", endpoint="vacancies", auth=False, headers=headers)
+        if response.status_code == 304 and cached:
+            metrics.inc("cache_requests_total", cache="vacancies", result="revalidated")
+            cache.touch(vacancy_id)
+            return cached.data
+        response.raise_for_status()
+        data = response.json()
+        metrics.inc("cache_requests_total", cache="vacancies", result="miss")
+        cache.put(vacancy_id, data, response.headers.get("ETag"), response.headers.get("Last-Modified"))
+        return data
     except requests.exceptions.RequestException as e:
-        st.error(f"Не удалось загрузить список регионов: {e}")
-        # Возвращаем базовый словарь в случае ошибки
-        return {
-            "Астана": "160",
-            "Алматы": "159",
-            "Казахстан": "40"
-        }
-    
-def get_managers(employer_id="24761"):
-    access_token = get_access_token()
-    if not access_token: return []
-    headers = {"Authorization": f"Bearer {access_token}", "User-Agent": "ForteTalent/1.3"}
-    url = f"https://api.hh.ru/employers/{employer_id}/managers"
-    response = requests.get(url, headers=headers)
-    if response.status_code == 200:
-        return response.json().get('items', [])
-    return []
-
-def get_active_vacancies(manager_ids, employer_id="24761"):
-    access_token = get_access_token()
-    if not access_token: return []
-    headers = {"Authorization": f"Bearer {access_token}", "User-Agent": "ForteTalent/1.3"}
-    all_vacancies = []
-    for manager_id in manager_ids:
-        url = f"https://api.hh.ru/employers/{employer_id}/vacancies/active"
-        params = {"page": 0, "per_page": 50, "manager_id": manager_id}
-        response = requests.get(url, headers=headers, params=params)
-        if response.status_code == 200:
-            all_vacancies.extend(response.json().get('items', []))
-    return all_vacancies
+        # Если hh.ru недоступен, лучше показать устаревшую копию, чем ошибку
+        if cached:
+            metrics.inc("cache_requests_total", cache="vacancies", result="stale")
+            return cached.data
+        status = e.response.status_code if e.response is not None else None
+        raise HHAPIError(str(e), status=status, url=f"{HH_API_URL}/vacancies/{vacancy_id}") from e
 
 def get_vacancy_details(vacancy_id):
-    url = f"https://api.hh.ru/vacancies/{vacancy_id}"
-    headers = {"User-Agent": "ForteTalent/1.3"}
-    for attempt in range(3):
-        try:
-            response = requests.get(url, headers=headers, timeout=10)
-            response.raise_for_status()
-            return response.json()
-        except requests.exceptions.RequestException as e:
-            if attempt < 2: time.sleep(2)
-            else: st.error(f"Не удалось получить детали вакансии: {e}")
+    try:
+        return fetch_vacancy_details(vacancy_id)
+    except HHAPIError as e:
+        st.error(f"Не удалось получить детали вакансии: {e}")
     return None
 
+# --- Очистка описаний вакансий ---
+# Все шаблоны компилируются один раз при импорте модуля
+RUSSIAN_BLOCK_START = re.compile(r'\b(?:Обязанности|Требования)\b', re.IGNORECASE)
+KAZAKH_BLOCK_START = re.compile(r'\b(?:Міндеттері|Талаптар)\b', re.IGNORECASE)
+ABOUT_BLOCK = re.compile(r"(Что такое ForteBank\?).*?(?=(Обязанности|Требования))", re.DOTALL | re.IGNORECASE)
+PERKS_BLOCK = re.compile(r"(Став частью команды Forte).*$", re.DOTALL | re.IGNORECASE)
+EMPTY_LINES = re.compile(r'\n\s*\n')
+DESCRIPTION_HEADERS = ['Обязанности', 'Требования', 'Что мы предлагаем', 'Условия', 'Наш стэк']
+# Одна группа на заголовок: по номеру группы восстанавливаем каноническое написание
+DESCRIPTION_HEADER_PATTERN = re.compile('|'.join(f'({re.escape(header)})\\s*:' for header in DESCRIPTION_HEADERS), re.IGNORECASE)
+REPEATED_BR = re.compile(r'(<br>\s*){2,}')
+
+# Быстрый путь извлечения текста: только простые теги и именованные сущности.
+# Всё остальное (комментарии, CDATA, числовые ссылки, script/style и т.п.)
+# разбирает BeautifulSoup, чтобы результат совпадал с ним байт в байт.
+SIMPLE_MARKUP_TOKEN = re.compile(r'<(/?)([a-zA-Z][a-zA-Z0-9]*)(?:\s[^<>"\'&]*)?/?>|&([a-zA-Z][a-zA-Z0-9]*);|[<&]')
+SPECIAL_TEXT_TAGS = {'script', 'style', 'template', 'rt', 'rp', 'textarea', 'title', 'xmp', 'plaintext', 'noscript', 'iframe', 'noembed', 'noframes'}
+_entity_table = None
+
+def _html_to_text(html_description):
+    """
+    Аналог BeautifulSoup(html, 'html.parser').get_text(separator='\n', strip=True)
+    за один проход регулярным выражением без построения дерева.
+    """
+    global _entity_table
+    if _entity_table is None:
+        from bs4.dammit import EntitySubstitution
+        _entity_table = EntitySubstitution.HTML_ENTITY_TO_CHARACTER
+
+    pieces, current, pos = [], [], 0
+    for match in SIMPLE_MARKUP_TOKEN.finditer(html_description):
+        tag_name, entity = match.group(2), match.group(3)
+        if tag_name is None and entity is None: return None  # одиночный '<' или '&'
+        if tag_name is not None and tag_name.lower() in SPECIAL_TEXT_TAGS: return None
+        current.append(html_description[pos:match.start()])
+        pos = match.end()
+        if entity is not None:
+            character = _entity_table.get(entity)
+            if character is None: return None
+            current.append(character)
+        else:
+            # Граница тега завершает текстовый узел
+            text = ''.join(current).strip()
+            if text: pieces.append(text)
+            current = []
+    current.append(html_description[pos:])
+    text = ''.join(current).strip()
+    if text: pieces.append(text)
+    return '\n'.join(pieces)
+
+def _format_header(match):
+    return f'<br><strong>{DESCRIPTION_HEADERS[match.lastindex - 1]}:</strong>'
+
 def clean_vacancy_description(html_description):
     """
     Очищает описание: изолирует русский блок, удаляет шаблоны и форматирует.
     """
     if not html_description: return "", ""
-    soup = BeautifulSoup(html_description, 'html.parser')
-    text_content = soup.get_text(separator='\n', strip=True)
+    text_content = _html_to_text(html_description)
+    if text_content is None:
+        from bs4 import BeautifulSoup  # нужен только для редкой разметки, которую не разбирает _html_to_text
+        text_content = BeautifulSoup(html_description, 'html.parser').get_text(separator='\n', strip=True)
 
     # 1. Найти начало русского блока
-    russian_start_keywords = ['Обязанности', 'Требования']
-    start_pos = -1
-    for keyword in russian_start_keywords:
-        match = re.search(r'\b' + re.escape(keyword) + r'\b', text_content, re.IGNORECASE)
-        if match:
-            pos = match.start()
-            if start_pos == -1 or pos < start_pos: start_pos = pos
-    
-    if start_pos != -1: text_content = text_content[start_pos:]
+    match = RUSSIAN_BLOCK_START.search(text_content)
+    if match: text_content = text_content[match.start():]
 
     # 2. Найти конец русского блока (начало казахского дубля)
-    kazakh_start_keywords = ['Міндеттері', 'Талаптар']
-    end_pos = -1
-    for keyword in kazakh_start_keywords:
-        match = re.search(r'\b' + re.escape(keyword) + r'\b', text_content, re.IGNORECASE)
-        if match:
-            pos = match.start()
-            if end_pos == -1 or pos < end_pos: end_pos = pos
-
-    if end_pos != -1: text_content = text_content[:end_pos]
+    match = KAZAKH_BLOCK_START.search(text_content)
+    if match: text_content = text_content[:match.start()]
 
     # 3. Удалить рекламные блоки
-    pattern_about = re.compile(r"(Что такое ForteBank\?).*?(?=(Обязанности|Требования))", re.DOTALL | re.IGNORECASE)
-    pattern_perks = re.compile(r"(Став частью команды Forte).*$", re.DOTALL | re.IGNORECASE)
-    cleaned_text = re.sub(pattern_about, '', text_content)
-    cleaned_text = re.sub(pattern_perks, '', cleaned_text)
-    
-    cleaned_text = re.sub(r'\n\s*\n', '\n', cleaned_text).strip()
+    cleaned_text = ABOUT_BLOCK.sub('', text_content)
+    cleaned_text = PERKS_BLOCK.sub('', cleaned_text)
+    cleaned_text = EMPTY_LINES.sub('\n', cleaned_text).strip()
     
     # 4. Форматирование
-    html_version = cleaned_text
-    headers_to_format = ['Обязанности', 'Требования', 'Что мы предлагаем', 'Условия', 'Наш стэк']
-    for header in headers_to_format:
-        pattern = re.compile(f'({re.escape(header)})\s*:', re.IGNORECASE)
-        replacement = f'<br><strong>{header}:</strong>'
-        html_version = pattern.sub(replacement, html_version)
-
-    html_version = html_version.replace('\n', '<br>')
-    html_version = re.sub(r'(<br>\s*){2,}', '<br>', html_version)
+    html_version = DESCRIPTION_HEADER_PATTERN.sub(_format_header, cleaned_text)
+    html_version = REPEATED_BR.sub('<br>', html_version.replace('\n', '<br>'))
     
     return cleaned_text, html_version
 
-@st.cache_data(show_spinner="Анализ вакансии с помощью AI...")
-def generate_keywords_with_openai(vacancy_name, cleaned_vacancy_text):
-    """
-    Вызывает OpenAI ОДИН РАЗ на вакансию (благодаря кэшу Streamlit),
-    чтобы сгенерировать максимально полный набор ключевых слов.
-    Принимает только необходимые, неизменяемые части для кэширования.
-    """
-    openai.api_key = os.getenv("OPENAI_API_KEY")
-    if not openai.api_key:
-        st.error("Ключ OPENAI_API_KEY не найден.")
-        return None
-
-    full_text_for_ai = f"Название: {vacancy_name}\n\nОписание:\n{cleaned_vacancy_text}"
-    
-    system_prompt = """
+KEYWORDS_MODEL = "gpt-4.1-mini"
+KEYWORDS_SYSTEM_PROMPT = """
     Ты — эксперт-рекрутер. Проанализируй вакансию и верни JSON-объект.
     ЗАДАЧА: Максимально полно и точно заполни два поля: must_have и optional, фокусируясь ТОЛЬКО на профессиональных навыках и технологиях.
 
@@ -203,23 +432,65 @@ def generate_keywords_with_openai(vacancy_name, cleaned_vacancy_text):
 
     ВЕРНИ ТОЛЬКО JSON.
     """
+# Версия промпта входит в ключ кэша: любое изменение текста промпта инвалидирует старые результаты
+KEYWORDS_PROMPT_VERSION = hashlib.sha256(KEYWORDS_SYSTEM_PROMPT.encode("utf-8")).hexdigest()[:12]
+
+def extract_keywords(vacancy_name, cleaned_vacancy_text, cached_only=False):
+    """
+    Извлекает ключевые слова без Streamlit, сначала проверяя персистентное хранилище.
+    Возвращает (результат, usage); usage равен None, если результат взят из хранилища.
+    С cached_only=True LLM не вызывается: если в хранилище ничего нет, результат — None.
+    Ошибки OpenAI пробрасываются вызывающему коду.
+    """
+    store = get_keyword_store()
+    cache_key = store.make_key(vacancy_name, cleaned_vacancy_text, KEYWORDS_PROMPT_VERSION, KEYWORDS_MODEL)
+    cached = store.get(cache_key)
+    metrics.inc("cache_requests_total", cache="keywords", result="miss" if cached is None else "hit")
+    if cached is not None or cached_only: return cached, None
+
+    import openai  # SDK импортируется около секунды — только при первой генерации, а не при старте процесса
+    openai.api_key = os.getenv("OPENAI_API_KEY")
+    if not openai.api_key: raise RuntimeError("Ключ OPENAI_API_KEY не найден.")
+
+    full_text_for_ai = f"Название: {vacancy_name}\n\nОписание:\n{cleaned_vacancy_text}"
+    try:
+        with metrics.timer("openai_request_duration_seconds", model=KEYWORDS_MODEL):
+            response = openai.chat.completions.create(
+                model=KEYWORDS_MODEL,
+                messages=[
+                    {"role": "system", "content": KEYWORDS_SYSTEM_PROMPT},
+                    {"role": "user", "content": f"Вакансия:\n{full_text_for_ai}"}
+                ],
+                response_format={"type": "json_object"}, temperature=0.1)
+    except Exception as e:
+        metrics.inc("openai_requests_total", model=KEYWORDS_MODEL, status=type(e).__name__)
+        raise
+    metrics.inc("openai_requests_total", model=KEYWORDS_MODEL, status="ok")
+    if response.usage:
+        metrics.inc("openai_tokens_total", response.usage.prompt_tokens or 0, model=KEYWORDS_MODEL, kind="prompt")
+        metrics.inc("openai_tokens_total", response.usage.completion_tokens or 0, model=KEYWORDS_MODEL, kind="completion")
+    result = json.loads(response.choices[0].message.content)
+    store.put(cache_key, result, KEYWORDS_MODEL)
+    return result, response.usage
+
+@st.cache_data(show_spinner="Анализ вакансии с помощью AI...")
+def generate_keywords_with_openai(vacancy_name, cleaned_vacancy_text):
+    """
+    Вызывает OpenAI ОДИН РАЗ на вакансию: результат сохраняется в персистентное
+    хранилище (общее для процессов и перезапусков), а поверх него — в кэш Streamlit.
+    Принимает только необходимые, неизменяемые части для кэширования.
+    """
     try:
-        response = openai.chat.completions.create(
-            model="gpt-4.1-mini",
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": f"Вакансия:\n{full_text_for_ai}"}
-            ],
-            response_format={"type": "json_object"}, temperature=0.1)
-        return json.loads(response.choices[0].message.content)
+        result, _ = extract_keywords(vacancy_name, cleaned_vacancy_text)
+        return result
+    except RuntimeError as e:
+        st.error(str(e))
     except Exception as e:
         st.error(f"Ошибка при обращении к OpenAI API: {e}")
-        return None
+    return None
 
 def advanced_search_resumes_old(structured_keywords, search_filters, mode="Средний"):
-    access_token = get_access_token()
-    if not access_token: return None
-    headers = {"Authorization": f"Bearer {access_token}", "User-Agent": "ForteTalent/1.5"}
+    if not get_access_token(): return None
 
     def format_keyword(kw):
         kw = kw.strip()
@@ -280,7 +551,7 @@ def advanced_search_resumes_old(structured_keywords, search_filters, mode="Ср
         strategies.append({"name": f"Main Search ({mode})", "params": {"text": main_query_text}, "score": 10})
 
     found_resumes = {}
-    base_url = "https://api.hh.ru/resumes"
+    base_url = f"{HH_API_URL}/resumes"
     print("\n--- DEBUG: ГЕНЕРАЦИЯ ПОИСКОВЫХ ЗАПРОСОВ ---")
     with st.spinner(f"Выполняю поиск в режиме '{mode}'..."):
         for strategy in strategies:
@@ -291,7 +562,7 @@ def advanced_search_resumes_old(structured_keywords, search_filters, mode="Ср
             print(f"[*] Стратегия '{strategy['name']}':\n    {human_readable_url}\n")
             
             try:
-                response = requests.get(base_url, headers=headers, params=current_params, timeout=15)
+                response = get_client().get("/resumes", endpoint="resumes", params=current_params)
                 response.raise_for_status()
                 data = response.json()
                 for resume in data.get("items", []):
@@ -305,99 +576,279 @@ def advanced_search_resumes_old(structured_keywords, search_filters, mode="Ср
     if not found_resumes: return {"found": 0, "items": []}
     return {"found": len(found_resumes), "items": sorted(list(found_resumes.values()), key=lambda x: x["score"], reverse=True)}
 
-def advanced_search_resumes(search_params, search_filters):
+def build_query_text(must_have_list, should_have_list):
     """
-    Выполняет двухступенчатый поиск: сначала с обязательными и дополнительными
-    критериями, а в случае неудачи — только с обязательными.
+    Строит текстовую часть запроса: все обязательные AND хотя бы одно из
+    дополнительных. Текст канонический (см. query_compiler): регистр, порядок,
+    дубликаты и лишние запятые не меняют запрос и ключи кэша.
     """
-    access_token = get_access_token()
-    if not access_token:
-        st.error("Отсутствует токен доступа для поиска.")
-        return {"found": 0, "items": []}
-    
-    headers = {"Authorization": f"Bearer {access_token}", "User-Agent": "ForteTalent/1.6"}
-    base_url = "https://api.hh.ru/resumes"
+    return compile_query(must_have_list, should_have_list).text
 
-    def format_keyword(kw):
-        """Обрабатывает ключевое слово: убирает пробелы, оборачивает фразы в кавычки."""
-        kw = kw.strip()
-        if not kw: return None
-        if '/' in kw: return f"({' AND '.join(kw.split('/'))})"
-        if ' ' in kw: return f'"{kw}"'
-        return kw
+def search_signature(search_params, search_filters):
+    """Смысловой отпечаток поиска: хэши запросов обоих этапов и нормализованные фильтры."""
+    return (compile_query(search_params['must_have'], search_params['optional']).hash,
+            compile_query(search_params['must_have'], []).hash,
+            get_search_cache().query_key("", search_filters)[1])
 
-    def build_query_text(must_have_list, should_have_list):
-        """Строит текстовую часть запроса."""
-        query_parts = []
-        
-        # Обязательные критерии всегда соединяются через AND
-        must_parts = [formatted for kw in must_have_list if (formatted := format_keyword(kw))]
-        if must_parts:
-            query_parts.append(f"({' AND '.join(must_parts)})")
-
-        # Дополнительные критерии соединяются через OR
-        should_parts = [formatted for kw in should_have_list if (formatted := format_keyword(kw))]
-        if should_parts:
-            query_parts.append(f"({' OR '.join(should_parts)})")
-            
-        return " AND ".join(query_parts)
+# Общий пул для параллельных поисковых запросов (спекулятивный запасной поиск и т.п.)
+_search_pool = ThreadPoolExecutor(max_workers=HH_MAX_CONCURRENCY, thread_name_prefix="hh-search")
 
-    def execute_search(text_query, page_num=0):
-        """Выполняет один API-запрос и возвращает результат."""
-        if not text_query:
-            st.warning("Не заданы обязательные критерии для поиска.")
-            return None # Не делаем пустой запрос
+def fetch_resumes_page(text_query, search_filters, page_num=0):
+    """
+    Выполняет один запрос к /resumes без Streamlit и возвращает JSON ответа.
+    Безопасна для вызова из фоновых потоков; при ошибке бросает HHAPIError.
+    """
+    current_params = {**search_filters, "page": page_num, "text": text_query}
+    try:
+        response = get_client().get("/resumes", endpoint="resumes", params=current_params)
+        response.raise_for_status()
+        return response.json()
+    except requests.exceptions.RequestException as e:
+        status = e.response.status_code if e.response is not None else None
+        raise HHAPIError(str(e), status=status, url=f"{HH_API_URL}/resumes") from e
 
-        # Добавляем номер страницы в фильтры
-        current_filters = {**search_filters, "page": page_num}
-        current_params = {**current_filters, "text": text_query}
+def cached_fetch_resumes_page(text_query, search_filters, page_num=0):
+    """fetch_resumes_page через общий кэш страниц поиска."""
+    cache = get_search_cache()
+    key = cache.make_key(text_query, search_filters, page_num)
+    return cache.get_or_fetch(key, lambda: fetch_resumes_page(text_query, search_filters, page_num))
 
-        query_string = urlencode(current_params, doseq=True)
-        human_readable_url = unquote_plus(f"{base_url}?{query_string}")
-        print(f"[*] Выполняется запрос:\n    {human_readable_url}\n")
-        
-        try:
-            response = requests.get(base_url, headers=headers, params=current_params, timeout=15)
-            response.raise_for_status()
-            return response.json()
-        except requests.exceptions.RequestException as e:
-            st.warning(f"Ошибка при поиске: {e}")
-            return None
+def submit_search(text_query, search_filters, page_num=0):
+    """
+    Запускает cached_fetch_resumes_page в общем пуле поисковых запросов и
+    возвращает Future. Число одновременных запросов к hh.ru ограничено пулом.
+    """
+    return _search_pool.submit(cached_fetch_resumes_page, text_query, search_filters, page_num)
+
+def _prefetch_next_page(text_query, search_filters, results):
+    """Пока рекрутер смотрит страницу N, фоном загружаем в кэш страницу N+1."""
+    next_page = results.get("page", 0) + 1
+    if next_page >= results.get("pages", 0): return
+    if get_search_cache().make_key(text_query, search_filters, next_page) in get_search_cache(): return
+    submit_search(text_query, search_filters, next_page)
+
+def invalidate_search_cache(search_params, search_filters):
+    """Сбрасывает закэшированные страницы обоих этапов поиска для набора ключевых слов и фильтров."""
+    cache = get_search_cache()
+    cache.invalidate(build_query_text(search_params['must_have'], search_params['optional']), search_filters)
+    cache.invalidate(build_query_text(search_params['must_have'], []), search_filters)
+
+def _with_score(results, search_params):
+    """
+    Приводит выдачу к единому формату: резюме страницы переранжируются по BM25
+    (ranking.rank_resumes), у каждого — "score" и вклад ключевых слов "score_details".
+    """
+    # Копия: исходный ответ может лежать в кэше страниц
+    return {**results, "items": rank_resumes(results.get("items", []), search_params)}
 
-    # --- Шаг 1: "Идеальный" поиск (с дополнительными критериями) ---
-    st.info("Этап 1: Поиск по всем заданным критериям...")
+def search_resumes(search_params, search_filters, prefetch=True, fallback=None):
+    """
+    Двухступенчатый поиск без Streamlit: сначала с обязательными и дополнительными
+    критериями, а в случае неудачи — только с обязательными. На первой странице
+    оба запроса уходят одновременно; запасной используется, только если
+    "идеальный" ничего не нашёл, иначе отменяется или отбрасывается.
+    Страницы кэшируются, следующая страница предзагружается в фоне (prefetch).
+
+    Для страниц после первой `fallback` — used_fallback, полученный на первой
+    странице: листается тот же запрос. Если он не передан, первая страница
+    "идеального" запроса запрашивается заново (из кэша или с hh.ru).
+
+    Возвращает (выдача, used_fallback); ошибки hh.ru бросаются как HHAPIError.
+    """
     ideal_query = build_query_text(search_params['must_have'], search_params['optional'])
-    
+    main_query = build_query_text(search_params['must_have'], []) # Дополнительные поля пустые
+    if not ideal_query: raise HHAPIError("Не заданы обязательные критерии для поиска.")
+
     # Получаем номер страницы из фильтров. Если его нет, по умолчанию 0.
     page_number = search_filters.get('page', 0)
-    
-    results = execute_search(ideal_query, page_number)
+    has_fallback = bool(main_query) and main_query != ideal_query
+
+    if page_number > 0:
+        # Листаем тот запрос, который дал выдачу на первой странице
+        if fallback is None:
+            fallback = has_fallback and cached_fetch_resumes_page(ideal_query, search_filters, 0).get("found", 0) == 0
+        use_fallback = has_fallback and fallback
+        query = main_query if use_fallback else ideal_query
+        results = cached_fetch_resumes_page(query, search_filters, page_number)
+        if prefetch: _prefetch_next_page(query, search_filters, results)
+        return _with_score(results, search_params), use_fallback
+
+    # Запасной запрос нужен только если он отличается от основного
+    ideal_future = submit_search(ideal_query, search_filters, page_number)
+    fallback_future = None
+    if has_fallback:
+        fallback_future = submit_search(main_query, search_filters, page_number)
+
+    try:
+        results = ideal_future.result()
+    except HHAPIError:
+        if fallback_future: fallback_future.cancel()
+        raise
+
+    if results.get("found", 0) > 0 or fallback_future is None:
+        if fallback_future: fallback_future.cancel()
+        if prefetch: _prefetch_next_page(ideal_query, search_filters, results)
+        return _with_score(results, search_params), False
 
-    if results is None: # Если произошла ошибка или пустой запрос
+    # --- Шаг 2: "Запасной" (Fallback) поиск — его результат уже в пути ---
+    fallback_results = fallback_future.result()
+    if prefetch: _prefetch_next_page(main_query, search_filters, fallback_results)
+    return _with_score(fallback_results, search_params), True
+
+DELTA_MAX_PAGES = 5
+
+def search_new_resumes(vacancy_id, search_params, search_filters, max_pages=DELTA_MAX_PAGES):
+    """
+    Дельта-поиск "что нового" по вакансии без Streamlit: тот же двухступенчатый
+    поиск, но только по резюме, обновлённым после прошлого дельта-поиска
+    (date_from = водяной знак), и без уже показанных по вакансии id.
+    Водяной знак хранится в hh_cache.WatermarkStore; если ключевые слова или
+    фильтры изменились, date_from не ставится, но показанные id всё равно
+    отбрасываются. Просматривается не больше `max_pages` страниц (свежие
+    первыми). При ошибке hh.ru бросается HHAPIError, водяной знак не сдвигается.
+    """
+    store = get_watermark_store()
+    signature = query_hash(repr(search_signature(search_params, search_filters)))
+    watermark = store.get(vacancy_id)
+    since = watermark.searched_at if watermark and watermark.signature == signature else None
+    started_at = datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%S%z")
+
+    filters = {k: v for k, v in search_filters.items() if k != "page"}
+    filters["order_by"] = "publication_time"
+    if since: filters["date_from"] = since
+
+    new_resumes, updated, used_fallback = [], 0, None
+    for page in range(max_pages):
+        results, used_fallback = search_resumes(search_params, {**filters, "page": page}, prefetch=False, fallback=used_fallback)
+        updated = results.get("found", 0)
+        resumes = {item["data"]["id"]: item["data"] for item in results.get("items", [])}
+        new_resumes.extend(resumes[resume_id] for resume_id in store.unseen(vacancy_id, resumes))
+        if page + 1 >= results.get("pages", 0): break
+
+    store.mark_seen(vacancy_id, [resume["id"] for resume in new_resumes])
+    store.advance(vacancy_id, started_at, signature, len(new_resumes))
+    # Баллы BM25 сравнимы только внутри одной партии — ранжируем новые резюме вместе
+    items = rank_resumes(new_resumes, search_params)
+    return {"found": len(items), "pages": 1, "page": 0, "per_page": len(items), "items": items,
+            "source": "delta", "since": since, "updated": updated, "used_fallback": used_fallback}
+
+def advanced_search_resumes(search_params, search_filters, vacancy_id=None, delta=False, fallback=None):
+    """
+    search_resumes с сообщениями о ходе поиска в интерфейсе Streamlit.
+    Если указана вакансия, показанные резюме отмечаются как просмотренные по ней,
+    а с delta=True выполняется дельта-поиск (search_new_resumes). Для страниц
+    после первой `fallback` — "used_fallback" из выдачи первой страницы.
+    """
+    if not get_access_token():
+        st.error("Отсутствует токен доступа для поиска.")
         return {"found": 0, "items": []}
-    
-    # --- Шаг 2: Проверка и "Запасной" (Fallback) поиск ---
-    # Мы переходим ко второму этапу ТОЛЬКО если это первая страница и ничего не найдено
-    if results.get("found", 0) == 0 and page_number == 0:
-        st.warning("По всем критериям кандидаты не найдены. Выполняется поиск только по обязательным...")
-        time.sleep(1) # Небольшая пауза для UX
-        
-        main_query = build_query_text(search_params['must_have'], []) # Дополнительные поля пустые
-        fallback_results = execute_search(main_query, page_number)
-
-        if fallback_results:
-             if fallback_results.get("found", 0) > 0:
-                st.success(f"Найдено {fallback_results.get('found', 0)} кандидатов по обязательным критериям.")
-             else:
-                st.error("Кандидаты не найдены даже по обязательным критериям.")
-             return fallback_results
-        else: # Если и второй поиск вернул ошибку
-             return {"found": 0, "items": []}
+    if not build_query_text(search_params['must_have'], search_params['optional']):
+        st.warning("Не заданы обязательные критерии для поиска.")
+        return {"found": 0, "items": []} # Не делаем пустой запрос
+
+    if delta and vacancy_id:
+        try:
+            results = search_new_resumes(vacancy_id, search_params, search_filters)
+        except HHAPIError as e:
+            st.warning(f"Ошибка при поиске: {e}")
+            return {"found": 0, "items": []}
+        since = f" с {results['since'][:10]}" if results["since"] else " с прошлого поиска"
+        if results["found"]: st.success(f"Новых кандидатов{since}: {results['found']} (обновлено резюме: {results['updated']}).")
+        else: st.info(f"Новых кандидатов{since} нет.")
+        return results
+
+    st.info("Этап 1: Поиск по всем заданным критериям...")
+    try:
+        results, used_fallback = search_resumes(search_params, search_filters, fallback=fallback)
+    except HHAPIError as e:
+        st.warning(f"Ошибка при поиске: {e}")
+        return {"found": 0, "items": []}
+
+    found = results.get('found', 0)
+    if not used_fallback:
+        if found > 0: st.success(f"Найдено {found} кандидатов.")
+        else: st.error("Кандидаты не найдены.")
+    elif search_filters.get('page', 0) > 0:
+        st.success(f"Найдено {found} кандидатов.")
     else:
-        # Если найдены результаты на первой или любой другой странице, просто возвращаем их
-        st.success(f"Найдено {results.get('found', 0)} кандидатов.")
-        # Приводим к единому формату с "score", чтобы не ломать интерфейс
-        # (хотя скоринг теперь не используется, это для обратной совместимости)
-        items_with_score = [{"data": item, "score": 10} for item in results.get("items", [])]
-        results["items"] = items_with_score
-        return results
\ No newline at end of file
+        st.warning("По всем критериям кандидаты не найдены. Выполняется поиск только по обязательным...")
+        if found > 0: st.success(f"Найдено {found} кандидатов по обязательным критериям.")
+        else: st.error("Кандидаты не найдены даже по обязательным критериям.")
+    if vacancy_id: get_watermark_store().mark_seen(vacancy_id, [item["data"]["id"] for item in results.get("items", [])])
+    # Запоминается вызывающим кодом и передаётся при листании (fallback)
+    results["used_fallback"] = used_fallback
+    return results
+
+def fetch_resume(resume_id):
+    """Полное резюме /resumes/{id} без Streamlit — тратит просмотр из квоты. При ошибке бросает HHAPIError."""
+    url = f"{HH_API_URL}/resumes/{resume_id}"
+    try:
+        response = get_client().get(f"/resumes/{resume_id}", endpoint="resumes")
+        response.raise_for_status()
+        return response.json()
+    except requests.exceptions.RequestException as e:
+        status = e.response.status_code if e.response is not None else None
+        raise HHAPIError(str(e), status=status, url=url) from e
+    except ValueError as e:
+        raise HHAPIError(f"Некорректный ответ hh.ru: {e}", url=url) from e
+
+def enrich_resumes(resumes, max_views=None, max_workers=None, daily_limit=RESUME_VIEW_DAILY_LIMIT):
+    """
+    Полные записи для выбранных резюме выдачи (элементы с "id" и "updated_at").
+    Не изменившиеся резюме берутся из кэша (id + updated_at) без трат квоты,
+    остальные загружаются параллельно (не более `max_workers` запросов), но не
+    больше `max_views` за вызов и в пределах суточного лимита просмотров.
+    После 403/429 от hh.ru оставшиеся загрузки не выполняются. Без Streamlit.
+
+    Возвращает {"records": {id: резюме}, "cached": n, "fetched": n,
+    "over_budget": [id, ...], "errors": {id: текст ошибки}}.
+    """
+    cache = get_resume_cache()
+    result = {"records": {}, "cached": 0, "fetched": 0, "over_budget": [], "errors": {}}
+    missing, seen_ids = [], set()
+    for resume in resumes:
+        if resume["id"] in seen_ids: continue
+        seen_ids.add(resume["id"])
+        record = cache.get(resume["id"], resume.get("updated_at"))
+        if record is None:
+            missing.append(resume)
+            continue
+        result["records"][resume["id"]] = record
+        result["cached"] += 1
+
+    metrics.inc("cache_requests_total", result["cached"], cache="resumes", result="hit")
+    metrics.inc("cache_requests_total", len(missing), cache="resumes", result="miss")
+    wanted = missing if max_views is None else missing[:max_views]
+    granted = cache.reserve_views(len(wanted), daily_limit)
+    to_fetch = missing[:granted]
+    result["over_budget"] = [resume["id"] for resume in missing[granted:]]
+    if not to_fetch: return result
+
+    quota_exhausted = threading.Event()
+    def fetch(resume):
+        if quota_exhausted.is_set(): return None
+        try:
+            return fetch_resume(resume["id"])
+        except HHAPIError as e:
+            if e.status in QUOTA_STATUSES: quota_exhausted.set()
+            raise
+
+    with ThreadPoolExecutor(max_workers=min(max_workers or HH_MAX_CONCURRENCY, len(to_fetch)), thread_name_prefix="hh-resume") as pool:
+        futures = {pool.submit(fetch, resume): resume for resume in to_fetch}
+        for future in as_completed(futures):
+            resume = futures[future]
+            try:
+                record = future.result()
+            except HHAPIError as e:
+                result["errors"][resume["id"]] = str(e)
+                continue
+            if record is None:
+                result["over_budget"].append(resume["id"])
+                continue
+            # Ключ — updated_at из выдачи: по нему следующий поиск найдёт запись в кэше
+            cache.put(resume["id"], resume.get("updated_at") or record.get("updated_at"), record)
+            result["records"][resume["id"]] = record
+            result["fetched"] += 1
+    # Неудачные и пропущенные загрузки просмотр не расходуют
+    if granted > result["fetched"]: cache.release_views(granted - result["fetched"])
+    return result
@@ -0,0 +1,197 @@
+"""
+Компактный справочник регионов Казахстана.
+
+Вместо загрузки всего мирового дерева /areas при каждом старте процесса
+используется плоский снимок поддерева страны: строки [id, название, id родителя].
+Снимок поставляется с приложением (data/areas_kz.json), а свежая копия
+сохраняется в кэш-каталог и обновляется в фоне не чаще AREAS_MAX_AGE —
+запросом только поддерева страны /areas/{country_id}. Структура родитель/дети
+сохраняется, поэтому регион можно развернуть до городов без обращения к hh.ru.
+"""
+import json
+import logging
+import os
+import threading
+import time
+from datetime import datetime, timezone
+
+import requests
+
+from hh_cache import CACHE_DIR
+
+logger = logging.getLogger(__name__)
+
+AREAS_SCHEMA_VERSION = 1
+COUNTRY_ID = "40"
+BUNDLED_SNAPSHOT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "areas_kz.json")
+SNAPSHOT_FILENAME = "areas_kz.json"
+AREAS_MAX_AGE = int(os.getenv("AREAS_MAX_AGE", str(7 * 24 * 3600)))
+AREAS_RETRY_INTERVAL = 300  # пауза между неудачными попытками обновления, с
+
+
+class AreaIndex:
+    """Неизменяемый индекс регионов: id → (название, родитель), дети по id, варианты для фильтра."""
+
+    def __init__(self, rows, country_id=COUNTRY_ID, fetched_at=None):
+        self.country_id = country_id
+        self.fetched_at = fetched_at
+        self._areas = {area_id: (name, parent_id) for area_id, name, parent_id in rows}
+        children = {}
+        for area_id, (_, parent_id) in self._areas.items():
+            if parent_id is not None: children.setdefault(parent_id, []).append(area_id)
+        self._children = {area_id: tuple(ids) for area_id, ids in children.items()}
+        self._options = dict(sorted((name, area_id) for area_id, (name, _) in self._areas.items()))
+
+    @classmethod
+    def from_tree(cls, node, fetched_at=None):
+        """Строит индекс из ответа /areas/{id} (вложенные "areas")."""
+        rows, stack = [], [(node, None)]
+        while stack:
+            current, parent_id = stack.pop()
+            rows.append((current["id"], current["name"], parent_id))
+            stack.extend((child, current["id"]) for child in reversed(current.get("areas") or []))
+        return cls(rows, node["id"], fetched_at)
+
+    def to_snapshot(self):
+        return {"version": AREAS_SCHEMA_VERSION, "country_id": self.country_id, "fetched_at": self.fetched_at,
+                "areas": [[area_id, name, parent_id] for area_id, (name, parent_id) in self._areas.items()]}
+
+    def as_options(self):
+        """Плоский словарь {название: id}, отсортированный по названию (для multiselect)."""
+        return dict(self._options)
+
+    def name(self, area_id):
+        area = self._areas.get(str(area_id))
+        return area[0] if area else None
+
+    def __contains__(self, area_id):
+        return str(area_id) in self._areas
+
+    def children(self, area_id):
+        return self._children.get(str(area_id), ())
+
+    def descendants(self, area_id):
+        """Все вложенные регионы и города (без самого региона)."""
+        result, stack = [], list(self.children(area_id))
+        while stack:
+            area_id = stack.pop()
+            result.append(area_id)
+            stack.extend(self.children(area_id))
+        return result
+
+    def expand(self, area_ids):
+        """Регионы вместе со всеми вложенными городами, без дубликатов."""
+        expanded = set()
+        for area_id in area_ids:
+            expanded.add(str(area_id))
+            expanded.update(self.descendants(area_id))
+        return expanded
+
+
+def _snapshot_path():
+    return os.path.join(CACHE_DIR, SNAPSHOT_FILENAME)
+
+
+def _read_snapshot(path):
+    """Читает снимок; None, если файла нет, он повреждён или другой версии схемы."""
+    try:
+        with open(path, encoding="utf-8") as f:
+            snapshot = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if snapshot.get("version") != AREAS_SCHEMA_VERSION: return None
+    return AreaIndex(snapshot["areas"], snapshot.get("country_id", COUNTRY_ID), snapshot.get("fetched_at"))
+
+
+def load_area_index():
+    """Сохранённая копия из кэш-каталога, а если её нет — снимок из поставки."""
+    return _read_snapshot(_snapshot_path()) or _read_snapshot(BUNDLED_SNAPSHOT_PATH)
+
+
+def refresh_area_snapshot(country_id=COUNTRY_ID, path=None):
+    """
+    Загружает с hh.ru только поддерево страны и атомарно сохраняет снимок.
+    Возвращает новый AreaIndex; ошибки hh.ru пробрасываются как HHAPIError.
+    """
+    import hh_api_integration_v2 as hh  # hh импортирует этот модуль
+
+    try:
+        response = hh.get_client().get(f"/areas/{country_id}", endpoint="areas", auth=False)
+        response.raise_for_status()
+        tree = response.json()
+    except (requests.exceptions.RequestException, ValueError) as e:
+        raise hh.HHAPIError(f"Не удалось загрузить справочник регионов: {e}") from e
+    index = AreaIndex.from_tree(tree, datetime.now(timezone.utc).isoformat())
+
+    path = path or _snapshot_path()
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(index.to_snapshot(), f, ensure_ascii=False, separators=(",", ":"))
+    os.replace(tmp_path, path)
+    return index
+
+
+def _is_placeholder(index):
+    return index is None or not index.fetched_at
+
+
+def _is_stale(index):
+    if _is_placeholder(index): return True
+    return time.time() - datetime.fromisoformat(index.fetched_at).timestamp() > AREAS_MAX_AGE
+
+
+_index = None
+_index_lock = threading.Lock()
+_refreshing = threading.Event()
+_last_attempt = 0.0
+
+def _refresh_in_background():
+    global _index
+    try:
+        _index = refresh_area_snapshot()
+    except Exception as e:
+        logger.warning("Справочник регионов не обновлён, используется снимок: %s", e)
+    finally:
+        _refreshing.clear()
+
+def _load_placeholder_synchronously():
+    """
+    В поставке лежит только заготовка (fetched_at пустой, несколько регионов):
+    с ней фильтр по регионам бесполезен, поэтому справочник загружается сразу,
+    а при ошибке сети остаётся заготовка до следующей попытки.
+    """
+    global _index, _last_attempt
+    with _index_lock:
+        if not _is_placeholder(_index) or time.monotonic() - _last_attempt <= AREAS_RETRY_INTERVAL: return
+        _last_attempt = time.monotonic()
+        try:
+            _index = refresh_area_snapshot()
+        except Exception as e:
+            logger.warning("Справочник регионов не загружен, используется заготовка из поставки: %s", e)
+
+def get_area_index():
+    """
+    Индекс регионов без ожидания сети: сразу отдаётся снимок, а устаревший
+    снимок обновляется в фоновом потоке (один на процесс). Исключение —
+    заготовка без даты загрузки: её заменяет синхронная загрузка с hh.ru.
+    """
+    global _index, _last_attempt
+    if _index is None:
+        with _index_lock:
+            if _index is None: _index = load_area_index()
+    if _is_placeholder(_index) and time.monotonic() - _last_attempt > AREAS_RETRY_INTERVAL:
+        _load_placeholder_synchronously()
+    if _is_stale(_index) and not _refreshing.is_set() and time.monotonic() - _last_attempt > AREAS_RETRY_INTERVAL:
+        with _index_lock:
+            if _refreshing.is_set(): return _index
+            _refreshing.set()
+            _last_attempt = time.monotonic()
+        threading.Thread(target=_refresh_in_background, name="hh-areas-refresh", daemon=True).start()
+    return _index
+
+
+if __name__ == "__main__":
+    # Обновить снимок из поставки: python hh_areas.py
+    index = refresh_area_snapshot(path=BUNDLED_SNAPSHOT_PATH)
+    print(f"Сохранено регионов: {len(index.as_options())} → {BUNDLED_SNAPSHOT_PATH}")
@@ -0,0 +1,419 @@
+"""
+Персистентные кэши приложения на SQLite.
+
+Файлы кэша лежат в HH_CACHE_DIR (по умолчанию .cache рядом с приложением) и
+общие для всех сессий, процессов и перезапусков сервера.
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict, namedtuple
+from concurrent.futures import Future
+
+import metrics
+from query_compiler import canonical_query, query_hash
+
+CACHE_DIR = os.getenv("HH_CACHE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache"))
+
+
+class SQLiteStore:
+    """Базовый класс: одно соединение на экземпляр, WAL для работы из нескольких процессов."""
+
+    schema = ""
+
+    def __init__(self, filename):
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        self.path = filename if os.path.isabs(filename) else os.path.join(CACHE_DIR, filename)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(self.schema)
+
+    def _execute(self, sql, params=()):
+        with self._lock:
+            return self._conn.execute(sql, params).fetchall()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+CachedVacancy = namedtuple("CachedVacancy", ["data", "etag", "last_modified", "fresh"])
+
+
+class VacancyCache(SQLiteStore):
+    """
+    Кэш ответов /vacancies/{id} с TTL. Хранит ETag/Last-Modified, чтобы после
+    истечения TTL перепроверить вакансию условным запросом (304 — без тела).
+    Размер ограничен `max_entries`, вытесняются давно не читавшиеся записи.
+    """
+
+    schema = """
+        CREATE TABLE IF NOT EXISTS vacancies (
+            id TEXT PRIMARY KEY,
+            body TEXT NOT NULL,
+            etag TEXT,
+            last_modified TEXT,
+            fetched_at REAL NOT NULL,
+            accessed_at REAL NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS vacancies_accessed_at ON vacancies (accessed_at);
+    """
+
+    def __init__(self, filename="vacancies.sqlite3", ttl=3600, max_entries=5000):
+        super().__init__(filename)
+        self.ttl = ttl
+        self.max_entries = max_entries
+
+    def get(self, vacancy_id):
+        """Возвращает CachedVacancy (fresh=False, если TTL истёк) или None."""
+        rows = self._execute("SELECT body, etag, last_modified, fetched_at FROM vacancies WHERE id = ?", (str(vacancy_id),))
+        if not rows: return None
+        body, etag, last_modified, fetched_at = rows[0]
+        now = time.time()
+        self._execute("UPDATE vacancies SET accessed_at = ? WHERE id = ?", (now, str(vacancy_id)))
+        return CachedVacancy(json.loads(body), etag, last_modified, now - fetched_at < self.ttl)
+
+    def put(self, vacancy_id, data, etag=None, last_modified=None):
+        now = time.time()
+        self._execute(
+            "INSERT OR REPLACE INTO vacancies (id, body, etag, last_modified, fetched_at, accessed_at) VALUES (?, ?, ?, ?, ?, ?)",
+            (str(vacancy_id), json.dumps(data, ensure_ascii=False), etag, last_modified, now, now))
+        self._execute(
+            "DELETE FROM vacancies WHERE id IN (SELECT id FROM vacancies ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)",
+            (self.max_entries,))
+
+    def touch(self, vacancy_id):
+        """Продлевает TTL записи после ответа 304 Not Modified."""
+        now = time.time()
+        self._execute("UPDATE vacancies SET fetched_at = ?, accessed_at = ? WHERE id = ?", (now, now, str(vacancy_id)))
+
+
+class KeywordStore(SQLiteStore):
+    """
+    Контентно-адресуемое хранилище результатов извлечения ключевых слов LLM.
+    Ключ — хэш (название, очищенный текст, версия промпта, модель), поэтому
+    изменение любой части даёт новый ключ, а старые записи истекают по TTL.
+    Счётчики попаданий/промахов общие для всех процессов.
+    """
+
+    schema = """
+        CREATE TABLE IF NOT EXISTS keywords (
+            key TEXT PRIMARY KEY,
+            result TEXT NOT NULL,
+            model TEXT,
+            created_at REAL NOT NULL,
+            accessed_at REAL NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS keywords_accessed_at ON keywords (accessed_at);
+        CREATE TABLE IF NOT EXISTS counters (name TEXT PRIMARY KEY, value INTEGER NOT NULL);
+    """
+
+    def __init__(self, filename="keywords.sqlite3", ttl=30 * 24 * 3600, max_entries=20000):
+        super().__init__(filename)
+        self.ttl = ttl
+        self.max_entries = max_entries
+
+    @staticmethod
+    def make_key(vacancy_name, cleaned_text, prompt_version, model):
+        payload = json.dumps([vacancy_name, cleaned_text, prompt_version, model], ensure_ascii=False)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _count(self, name):
+        self._execute("INSERT INTO counters (name, value) VALUES (?, 1) ON CONFLICT(name) DO UPDATE SET value = value + 1", (name,))
+
+    def get(self, key):
+        """Возвращает сохранённый результат или None (отсутствует или истёк)."""
+        now = time.time()
+        rows = self._execute("SELECT result FROM keywords WHERE key = ? AND created_at > ?", (key, now - self.ttl))
+        if not rows:
+            self._count("miss")
+            return None
+        self._execute("UPDATE keywords SET accessed_at = ? WHERE key = ?", (now, key))
+        self._count("hit")
+        return json.loads(rows[0][0])
+
+    def put(self, key, result, model=None):
+        now = time.time()
+        self._execute(
+            "INSERT OR REPLACE INTO keywords (key, result, model, created_at, accessed_at) VALUES (?, ?, ?, ?, ?)",
+            (key, json.dumps(result, ensure_ascii=False), model, now, now))
+        self._execute("DELETE FROM keywords WHERE created_at <= ?", (now - self.ttl,))
+        self._execute(
+            "DELETE FROM keywords WHERE key IN (SELECT key FROM keywords ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)",
+            (self.max_entries,))
+
+    def stats(self):
+        """Счётчики hit/miss и текущее число записей."""
+        counters = dict(self._execute("SELECT name, value FROM counters"))
+        entries = self._execute("SELECT COUNT(*) FROM keywords")[0][0]
+        return {"hit": counters.get("hit", 0), "miss": counters.get("miss", 0), "entries": entries}
+
+
+Watermark = namedtuple("Watermark", ["searched_at", "signature", "new_count"])
+
+
+class WatermarkStore(SQLiteStore):
+    """
+    Водяные знаки дельта-поиска по вакансиям: время прошлого поиска (для
+    date_from), отпечаток запроса, при котором он выполнен, и id резюме, уже
+    показанных по вакансии. Отметки о просмотре старше `ttl` удаляются —
+    давно просмотренное и обновлённое резюме снова считается новым.
+    """
+
+    schema = """
+        CREATE TABLE IF NOT EXISTS watermarks (
+            vacancy_id TEXT PRIMARY KEY,
+            searched_at TEXT NOT NULL,
+            signature TEXT NOT NULL,
+            new_count INTEGER NOT NULL DEFAULT 0
+        );
+        CREATE TABLE IF NOT EXISTS seen_resumes (
+            vacancy_id TEXT NOT NULL,
+            resume_id TEXT NOT NULL,
+            seen_at REAL NOT NULL,
+            PRIMARY KEY (vacancy_id, resume_id)
+        ) WITHOUT ROWID;
+        CREATE INDEX IF NOT EXISTS seen_resumes_seen_at ON seen_resumes (seen_at);
+    """
+
+    def __init__(self, filename="watermarks.sqlite3", ttl=90 * 24 * 3600):
+        super().__init__(filename)
+        self.ttl = ttl
+
+    def get(self, vacancy_id):
+        rows = self._execute("SELECT searched_at, signature, new_count FROM watermarks WHERE vacancy_id = ?", (str(vacancy_id),))
+        return Watermark(*rows[0]) if rows else None
+
+    def all(self):
+        """Водяные знаки всех вакансий: {vacancy_id: Watermark} — сводка "что нового" одним запросом."""
+        return {vacancy_id: Watermark(*row) for vacancy_id, *row in
+                self._execute("SELECT vacancy_id, searched_at, signature, new_count FROM watermarks")}
+
+    def unseen(self, vacancy_id, resume_ids):
+        """Id из `resume_ids`, ещё не показанные по вакансии, в исходном порядке."""
+        resume_ids = [str(resume_id) for resume_id in resume_ids]
+        if not resume_ids: return []
+        placeholders = ",".join("?" * len(resume_ids))
+        seen = {resume_id for (resume_id,) in self._execute(
+            f"SELECT resume_id FROM seen_resumes WHERE vacancy_id = ? AND resume_id IN ({placeholders}) AND seen_at > ?",
+            (str(vacancy_id), *resume_ids, time.time() - self.ttl))}
+        return [resume_id for resume_id in resume_ids if resume_id not in seen]
+
+    def mark_seen(self, vacancy_id, resume_ids):
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO seen_resumes (vacancy_id, resume_id, seen_at) VALUES (?, ?, ?)",
+                    [(str(vacancy_id), str(resume_id), now) for resume_id in resume_ids])
+                self._conn.execute("DELETE FROM seen_resumes WHERE seen_at <= ?", (now - self.ttl,))
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def advance(self, vacancy_id, searched_at, signature, new_count):
+        """Сдвигает водяной знак после успешного дельта-поиска."""
+        self._execute("INSERT OR REPLACE INTO watermarks (vacancy_id, searched_at, signature, new_count) VALUES (?, ?, ?, ?)",
+                      (str(vacancy_id), searched_at, signature, new_count))
+
+
+class ResumeCache(SQLiteStore):
+    """
+    Полные резюме (/resumes/{id}) по ключу (id, updated_at): пока резюме не
+    обновлялось, повторное открытие не тратит просмотр из квоты hh.ru. Хранится
+    одна, последняя версия каждого резюме. Там же — суточный учёт просмотров,
+    общий для всех сессий и процессов.
+    """
+
+    schema = """
+        CREATE TABLE IF NOT EXISTS resumes (
+            id TEXT PRIMARY KEY,
+            updated_at TEXT NOT NULL,
+            body TEXT NOT NULL,
+            fetched_at REAL NOT NULL,
+            accessed_at REAL NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS resumes_accessed_at ON resumes (accessed_at);
+        CREATE TABLE IF NOT EXISTS resume_views (day TEXT PRIMARY KEY, used INTEGER NOT NULL);
+    """
+
+    def __init__(self, filename="resumes.sqlite3", max_entries=20000):
+        super().__init__(filename)
+        self.max_entries = max_entries
+
+    def get(self, resume_id, updated_at):
+        """Сохранённое резюме, если оно не обновлялось с момента загрузки, иначе None."""
+        rows = self._execute("SELECT body FROM resumes WHERE id = ? AND updated_at = ?", (str(resume_id), updated_at or ""))
+        if not rows: return None
+        self._execute("UPDATE resumes SET accessed_at = ? WHERE id = ?", (time.time(), str(resume_id)))
+        return json.loads(rows[0][0])
+
+    def put(self, resume_id, updated_at, data):
+        now = time.time()
+        self._execute(
+            "INSERT OR REPLACE INTO resumes (id, updated_at, body, fetched_at, accessed_at) VALUES (?, ?, ?, ?, ?)",
+            (str(resume_id), updated_at or "", json.dumps(data, ensure_ascii=False), now, now))
+        self._execute(
+            "DELETE FROM resumes WHERE id IN (SELECT id FROM resumes ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)",
+            (self.max_entries,))
+
+    def reserve_views(self, count, daily_limit):
+        """Резервирует до `count` просмотров в пределах суточного лимита (0 — без лимита); возвращает выделенное число."""
+        if count <= 0: return 0
+        day = time.strftime("%Y-%m-%d")
+        with self._lock:
+            # IMMEDIATE: другие процессы не прочитают счётчик, пока мы его не обновим
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute("SELECT used FROM resume_views WHERE day = ?", (day,)).fetchone()
+                used = row[0] if row else 0
+                granted = min(count, max(0, daily_limit - used)) if daily_limit else count
+                self._conn.execute("INSERT OR REPLACE INTO resume_views (day, used) VALUES (?, ?)", (day, used + granted))
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        return granted
+
+    def release_views(self, count):
+        """Возвращает в бюджет зарезервированные, но не потраченные просмотры."""
+        self._execute("UPDATE resume_views SET used = MAX(0, used - ?) WHERE day = ?", (count, time.strftime("%Y-%m-%d")))
+
+    def views_used(self):
+        rows = self._execute("SELECT used FROM resume_views WHERE day = ?", (time.strftime("%Y-%m-%d"),))
+        return rows[0][0] if rows else 0
+
+
+class SearchPageCache:
+    """
+    In-memory LRU/TTL кэш страниц поиска резюме, общий для всех сессий процесса.
+    Ключ — нормализованный текст запроса, фильтры и номер страницы. Одинаковые
+    запросы "в полёте" (например, предзагрузка следующей страницы и клик по ней)
+    объединяются в один обращение к hh.ru.
+    """
+
+    def __init__(self, max_entries=300, ttl=600):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._inflight = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def query_key(text_query, search_filters):
+        """
+        Нормализует запрос: текст приводится к каноническому виду (query_compiler)
+        и заменяется его хэшем, порядок фильтров и значений в списках не важен.
+        """
+        filters = []
+        for name, value in sorted(search_filters.items()):
+            if name == "page": continue
+            if isinstance(value, (list, tuple, set)): value = tuple(sorted(str(v) for v in value))
+            filters.append((name, value if isinstance(value, tuple) else str(value)))
+        return query_hash(canonical_query(text_query)), tuple(filters)
+
+    def make_key(self, text_query, search_filters, page):
+        return (*self.query_key(text_query, search_filters), int(page))
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None: return None
+            stored_at, data = entry
+            if time.monotonic() - stored_at > self.ttl:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return data
+
+    def __contains__(self, key):
+        return self.get(key) is not None or key in self._inflight
+
+    def put(self, key, data):
+        with self._lock:
+            self._entries[key] = (time.monotonic(), data)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def get_or_fetch(self, key, fetch):
+        """Возвращает страницу из кэша, дожидается запроса в полёте или выполняет `fetch()`."""
+        data = self.get(key)
+        if data is not None:
+            metrics.inc("cache_requests_total", cache="search", result="hit")
+            return data
+        with self._lock:
+            future = self._inflight.get(key)
+            owner = future is None
+            if owner: future = self._inflight[key] = Future()
+        metrics.inc("cache_requests_total", cache="search", result="miss" if owner else "coalesced")
+        if not owner: return future.result()
+        try:
+            data = fetch()
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            self.put(key, data)
+            future.set_result(data)
+            return data
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+
+    def invalidate(self, text_query, search_filters):
+        """Удаляет все закэшированные страницы указанного запроса."""
+        prefix = self.query_key(text_query, search_filters)
+        with self._lock:
+            for key in [key for key in self._entries if key[:2] == prefix]:
+                del self._entries[key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+def _get_store(name, factory):
+    if name not in _stores:
+        with _stores_lock:
+            if name not in _stores:
+                _stores[name] = factory()
+    return _stores[name]
+
+def get_vacancy_cache():
+    """Общий на процесс кэш деталей вакансий."""
+    return _get_store("vacancies", lambda: VacancyCache(
+        ttl=int(os.getenv("HH_VACANCY_CACHE_TTL", "3600")),
+        max_entries=int(os.getenv("HH_VACANCY_CACHE_SIZE", "5000"))))
+
+def get_keyword_store():
+    """Общее на процесс хранилище результатов LLM."""
+    return _get_store("keywords", lambda: KeywordStore(
+        ttl=int(os.getenv("KEYWORDS_CACHE_TTL", str(30 * 24 * 3600))),
+        max_entries=int(os.getenv("KEYWORDS_CACHE_SIZE", "20000"))))
+
+def get_watermark_store():
+    """Общее на процесс хранилище водяных знаков дельта-поиска."""
+    return _get_store("watermarks", lambda: WatermarkStore(
+        ttl=int(os.getenv("WATERMARK_SEEN_TTL", str(90 * 24 * 3600)))))
+
+def get_resume_cache():
+    """Общий на процесс кэш полных резюме и учёт просмотров."""
+    return _get_store("resumes", lambda: ResumeCache(
+        max_entries=int(os.getenv("RESUME_CACHE_SIZE", "20000"))))
+
+def get_search_cache():
+    """Общий на процесс кэш страниц поиска."""
+    return _get_store("search", lambda: SearchPageCache(
+        max_entries=int(os.getenv("SEARCH_CACHE_SIZE", "300")),
+        ttl=int(os.getenv("SEARCH_CACHE_TTL", "600"))))
@@ -0,0 +1,136 @@
+"""
+Потоковая выгрузка всех резюме по запросу.
+
+hh.ru не даёт листать выдачу одного запроса глубже RESUME_SEARCH_DEPTH
+резюме. Если `found` больше этого предела, запрос делится на шарды — по
+регионам, по опыту работы, затем по окнам даты обновления (рекурсивно
+пополам) — и результаты шардов объединяются без дубликатов по id резюме.
+
+    for resume in iter_all_resumes(hh.build_query_text(must_have, optional), filters):
+        ...
+
+Память не растёт с числом результатов: одновременно в памяти находится
+не больше `max_workers` страниц, а для дедупликации хранятся только id.
+"""
+import functools
+import logging
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+
+import requests
+
+import hh_api_integration_v2 as hh
+from hh_areas import get_area_index
+
+RESUME_SEARCH_DEPTH = 2000
+HARVEST_PER_PAGE = 100
+EXPERIENCE_BUCKETS = ["noExperience", "between1And3", "between3And6", "moreThan6"]
+HARVEST_START_DATE = datetime(2000, 1, 1, tzinfo=timezone.utc)
+MIN_DATE_WINDOW = timedelta(hours=1)
+SHARD_DIMENSIONS = ("area", "experience", "date")
+
+logger = logging.getLogger(__name__)
+
+
+@functools.lru_cache(maxsize=64)
+def get_child_area_ids(area_id):
+    """Прямые дочерние регионы (без вложенных городов), чтобы шарды не пересекались."""
+    area_index = get_area_index()
+    # Снимок регионов знает структуру страны — запрос к hh.ru не нужен
+    if area_index is not None and area_id in area_index and area_index.fetched_at:
+        return area_index.children(area_id)
+    try:
+        response = hh.get_client().get(f"/areas/{area_id}", endpoint="areas", auth=False)
+        response.raise_for_status()
+    except requests.exceptions.RequestException as e:
+        raise hh.HHAPIError(f"Не удалось загрузить регион {area_id}: {e}") from e
+    return tuple(area["id"] for area in response.json().get("areas", []))
+
+
+def _format_date(value):
+    return value.strftime("%Y-%m-%dT%H:%M:%S%z")
+
+
+def _parse_date(value, default):
+    if not value: return default
+    parsed = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    return parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)
+
+
+def _as_list(value):
+    if value is None: return []
+    return [value] if isinstance(value, str) else list(value)
+
+
+def split_shard(search_filters, dimension):
+    """
+    Делит фильтры на непересекающиеся шарды по одному измерению.
+    Возвращает список фильтров или None, если по этому измерению делить нечего.
+    """
+    if dimension == "area":
+        areas = _as_list(search_filters.get("area")) or ["40"]
+        if len(areas) == 1: areas = list(get_child_area_ids(areas[0]))
+        return [{**search_filters, "area": [area]} for area in areas] if len(areas) > 1 else None
+
+    if dimension == "experience":
+        buckets = _as_list(search_filters.get("experience")) or EXPERIENCE_BUCKETS
+        return [{**search_filters, "experience": [bucket]} for bucket in buckets] if len(buckets) > 1 else None
+
+    if dimension == "date":
+        date_from = _parse_date(search_filters.get("date_from"), HARVEST_START_DATE)
+        date_to = _parse_date(search_filters.get("date_to"), datetime.now(timezone.utc))
+        if date_to - date_from < MIN_DATE_WINDOW: return None
+        middle = date_from + (date_to - date_from) / 2
+        return [{**search_filters, "date_from": _format_date(date_from), "date_to": _format_date(middle)},
+                {**search_filters, "date_from": _format_date(middle), "date_to": _format_date(date_to)}]
+    raise ValueError(f"Неизвестное измерение шардирования: {dimension}")
+
+
+def _iter_shard(text_query, search_filters, dimensions, pool, max_workers, log):
+    first_page = hh.fetch_resumes_page(text_query, search_filters, 0)
+    found = first_page.get("found", 0)
+
+    if found > RESUME_SEARCH_DEPTH:
+        for index, dimension in enumerate(dimensions):
+            shards = split_shard(search_filters, dimension)
+            if not shards: continue
+            # Окно дат можно делить повторно, регионы и опыт — один раз
+            rest = dimensions[index:] if dimension == "date" else dimensions[index + 1:]
+            for shard_filters in shards:
+                yield from _iter_shard(text_query, shard_filters, rest, pool, max_workers, log)
+            return
+        log(f"Шард не делится дальше, доступно {RESUME_SEARCH_DEPTH} из {found}: {search_filters}")
+
+    yield from first_page.get("items", [])
+    pages = min(first_page.get("pages", 1), RESUME_SEARCH_DEPTH // HARVEST_PER_PAGE)
+    # Скользящее окно: в полёте не больше max_workers страниц, выдаём их по порядку
+    pending, next_page = deque(), 1
+    while next_page < pages or pending:
+        while next_page < pages and len(pending) < max_workers:
+            pending.append(pool.submit(hh.fetch_resumes_page, text_query, search_filters, next_page))
+            next_page += 1
+        yield from pending.popleft().result().get("items", [])
+
+
+def iter_all_resumes(text_query, search_filters, max_workers=None, dimensions=SHARD_DIMENSIONS, log=None):
+    """
+    Генератор всех резюме по запросу: per_page=100, страницы загружаются
+    параллельно (не более `max_workers`), запросы сверх предела глубины
+    автоматически делятся на шарды. Каждое резюме выдаётся один раз.
+    Ошибки hh.ru пробрасываются как HHAPIError.
+    Предупреждения о неполных шардах уходят в `log` (по умолчанию — logger модуля).
+    """
+    log = log or logger.warning
+    max_workers = max_workers or hh.HH_MAX_CONCURRENCY
+    filters = {k: v for k, v in search_filters.items() if k not in ("page", "user_job_title", "bank_only")}
+    filters["per_page"] = HARVEST_PER_PAGE
+    seen_ids = set()
+    pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="hh-harvest")
+    try:
+        for resume in _iter_shard(text_query, filters, tuple(dimensions), pool, max_workers, log):
+            if resume["id"] in seen_ids: continue
+            seen_ids.add(resume["id"])
+            yield resume
+    finally:
+        pool.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,142 @@
+"""
+Пакетное предварительное извлечение ключевых слов для всех активных вакансий.
+
+Загружает активные вакансии, параллельно получает их детали, очищает описания
+и вызывает LLM с ограниченным параллелизмом и лимитом запросов в минуту.
+Результаты попадают в персистентное хранилище (hh_cache.KeywordStore), поэтому
+страница вакансии потом открывается без ожидания LLM.
+
+    python keyword_batch.py --workers 4 --rpm 300
+    python keyword_batch.py --vacancies-file vacancies.json   # без обращения к списку hh.ru
+
+Проверка на локальной заглушке (benchmarks/stub_server.py):
+    OPENAI_BASE_URL=http://127.0.0.1:8010/v1 OPENAI_API_KEY=stub python keyword_batch.py ...
+"""
+import argparse
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import hh_api_integration_v2 as hh
+
+
+class RateLimiter:
+    """Равномерно распределяет запросы: не более `per_minute` в минуту на процесс."""
+
+    def __init__(self, per_minute):
+        self.interval = 60.0 / per_minute if per_minute else 0.0
+        self._next_at = 0.0
+        self._lock = threading.Lock()
+
+    def wait(self):
+        if not self.interval: return
+        with self._lock:
+            now = time.monotonic()
+            wait_for = max(0.0, self._next_at - now)
+            self._next_at = max(now, self._next_at) + self.interval
+        if wait_for: time.sleep(wait_for)
+
+    def pause(self, seconds):
+        """После 429 сдвигает следующий разрешённый запрос на `seconds`."""
+        with self._lock:
+            self._next_at = max(self._next_at, time.monotonic() + seconds)
+
+
+def _retry_after(error, default=5.0):
+    response = getattr(error, "response", None)
+    try:
+        return float(response.headers.get("retry-after", default))
+    except (AttributeError, TypeError, ValueError):
+        return default
+
+
+def extract_with_limits(vacancy_details, limiter, max_attempts=4):
+    """Очищает описание и извлекает ключевые слова, повторяя запрос при 429."""
+    import openai  # не нужен search_batch с --cached-keywords-only
+    cleaned_text, _ = hh.clean_vacancy_description(vacancy_details.get("description", ""))
+    name = vacancy_details.get("name", "")
+    for attempt in range(max_attempts):
+        limiter.wait()
+        try:
+            return hh.extract_keywords(name, cleaned_text)
+        except openai.RateLimitError as e:
+            if attempt == max_attempts - 1: raise
+            limiter.pause(_retry_after(e))
+
+
+def run_batch(vacancies, workers=4, rpm=300, hh_workers=None, log=print):
+    """
+    Обрабатывает список вакансий (формат ответа get_active_vacancies).
+    Возвращает словарь со статистикой: обработано, из кэша, ошибки, токены, скорость.
+    """
+    stats = {"total": len(vacancies), "generated": 0, "cached": 0, "failed": 0,
+             "prompt_tokens": 0, "completion_tokens": 0}
+    limiter = RateLimiter(rpm)
+    started = time.monotonic()
+
+    with ThreadPoolExecutor(max_workers=hh_workers or hh.HH_MAX_CONCURRENCY) as hh_pool, \
+         ThreadPoolExecutor(max_workers=workers) as llm_pool:
+        detail_futures = {hh_pool.submit(hh.fetch_vacancy_details, v["id"]): v for v in vacancies}
+        llm_futures = {}
+        for future in as_completed(detail_futures):
+            vacancy = detail_futures[future]
+            try:
+                details = future.result()
+            except hh.HHAPIError as e:
+                stats["failed"] += 1
+                log(f"[!] {vacancy['id']}: не удалось получить детали: {e}")
+                continue
+            llm_futures[llm_pool.submit(extract_with_limits, details, limiter)] = vacancy
+
+        for future in as_completed(llm_futures):
+            vacancy = llm_futures[future]
+            try:
+                _, usage = future.result()
+            except Exception as e:
+                stats["failed"] += 1
+                log(f"[!] {vacancy['id']}: ошибка извлечения ключевых слов: {e}")
+                continue
+            if usage is None:
+                stats["cached"] += 1
+            else:
+                stats["generated"] += 1
+                stats["prompt_tokens"] += usage.prompt_tokens or 0
+                stats["completion_tokens"] += usage.completion_tokens or 0
+
+    elapsed = time.monotonic() - started
+    stats["elapsed_sec"] = round(elapsed, 2)
+    stats["vacancies_per_min"] = round((stats["generated"] + stats["cached"]) / elapsed * 60, 1) if elapsed else 0.0
+    return stats
+
+
+def load_active_vacancies(employer_id):
+    managers = hh.get_managers(employer_id)
+    return hh.get_active_vacancies([m["id"] for m in managers], employer_id) if managers else []
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Предварительное извлечение ключевых слов для активных вакансий")
+    parser.add_argument("--employer-id", default="24761")
+    parser.add_argument("--vacancies-file", help="JSON со списком вакансий вместо загрузки с hh.ru")
+    parser.add_argument("--workers", type=int, default=4, help="Параллельных запросов к LLM")
+    parser.add_argument("--rpm", type=int, default=300, help="Лимит запросов к LLM в минуту (0 — без лимита)")
+    parser.add_argument("--hh-workers", type=int, default=None, help="Параллельных запросов к hh.ru")
+    args = parser.parse_args(argv)
+
+    if args.vacancies_file:
+        with open(args.vacancies_file, encoding="utf-8") as f:
+            vacancies = json.load(f)
+    else:
+        vacancies = load_active_vacancies(args.employer_id)
+    print(f"[*] Вакансий к обработке: {len(vacancies)}")
+
+    stats = run_batch(vacancies, args.workers, args.rpm, args.hh_workers)
+    print(f"[*] Сгенерировано: {stats['generated']}, из кэша: {stats['cached']}, ошибок: {stats['failed']}")
+    print(f"[*] Время: {stats['elapsed_sec']} с, скорость: {stats['vacancies_per_min']} вакансий/мин")
+    print(f"[*] Токены: prompt {stats['prompt_tokens']}, completion {stats['completion_tokens']}")
+    return 0 if not stats["failed"] else 1
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,201 @@
+"""
+Метрики исходящих вызовов (hh.ru, OpenAI), кэшей и отрисовки страниц.
+
+Включаются переменной HH_METRICS=1. В выключенном состоянии каждая точка
+замера — одна проверка флага, без блокировок и выделения памяти. Данные
+отдаются в текстовом формате Prometheus: render() или локальный HTTP-эндпоинт
+(start_http_server, по умолчанию 127.0.0.1:HH_METRICS_PORT/metrics).
+
+    metrics.inc("hh_requests_total", endpoint="resumes", status="200")
+    metrics.observe("hh_request_duration_seconds", 0.42, endpoint="resumes")
+    with metrics.timer("openai_request_duration_seconds", model="gpt-4.1-mini"): ...
+"""
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+ENABLED = os.getenv("HH_METRICS") == "1"
+METRICS_PORT = int(os.getenv("HH_METRICS_PORT", "9108"))
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+HELP = {
+    "hh_requests_total": ("counter", "Ответы hh.ru по эндпоинту и коду статуса"),
+    "hh_request_duration_seconds": ("histogram", "Время запроса к hh.ru (одна попытка)"),
+    "hh_request_retries_total": ("counter", "Повторы запросов к hh.ru по причине"),
+    "hh_request_errors_total": ("counter", "Сетевые ошибки запросов к hh.ru"),
+    "hh_response_bytes_total": ("counter", "Объём ответов hh.ru, байт"),
+    "openai_requests_total": ("counter", "Запросы к OpenAI по модели и результату"),
+    "openai_request_duration_seconds": ("histogram", "Время запроса к OpenAI"),
+    "openai_tokens_total": ("counter", "Токены OpenAI по модели и типу"),
+    "cache_requests_total": ("counter", "Обращения к кэшам: hit, miss, revalidated, stale"),
+    "render_duration_seconds": ("histogram", "Серверное время отрисовки секций страницы"),
+}
+
+
+class Histogram:
+    __slots__ = ("counts", "sum", "count")
+
+    def __init__(self):
+        self.counts = [0] * (len(LATENCY_BUCKETS) + 1)  # последний — +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(LATENCY_BUCKETS, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q):
+        """Оценка квантиля по границам корзин (верхняя граница корзины, как histogram_quantile)."""
+        if not self.count: return None
+        rank, cumulative = q * self.count, 0
+        for bound, count in zip(LATENCY_BUCKETS, self.counts):
+            cumulative += count
+            if cumulative >= rank: return bound
+        return float("inf")
+
+
+class Registry:
+    """Счётчики и гистограммы с метками; общий на процесс, потокобезопасный."""
+
+    def __init__(self):
+        self._counters = {}
+        self._histograms = {}
+        self._lock = threading.Lock()
+
+    def inc(self, name, value=1, labels=()):
+        key = (name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name, value, labels=()):
+        key = (name, labels)
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None: histogram = self._histograms[key] = Histogram()
+            histogram.observe(value)
+
+    def counters(self, name):
+        """{метки: значение} для одного счётчика (метки — кортеж пар)."""
+        with self._lock:
+            return {labels: value for (metric, labels), value in self._counters.items() if metric == name}
+
+    def histograms(self, name):
+        with self._lock:
+            return {labels: histogram for (metric, labels), histogram in self._histograms.items() if metric == name}
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+
+    def render(self):
+        """Все метрики в текстовом формате Prometheus 0.0.4."""
+        with self._lock:
+            counters = sorted(self._counters.items())
+            histograms = sorted((key, (list(h.counts), h.sum, h.count)) for key, h in self._histograms.items())
+        lines, described = [], set()
+
+        def describe(name):
+            if name in described: return
+            described.add(name)
+            kind, text = HELP.get(name, ("untyped", name))
+            lines.append(f"# HELP {name} {text}")
+            lines.append(f"# TYPE {name} {kind}")
+
+        for (name, labels), value in counters:
+            describe(name)
+            lines.append(f"{name}{_format_labels(labels)} {value}")
+        for (name, labels), (counts, total, count) in histograms:
+            describe(name)
+            cumulative = 0
+            for bound, bucket_count in zip((*LATENCY_BUCKETS, "+Inf"), counts):
+                cumulative += bucket_count
+                lines.append(f"{name}_bucket{_format_labels((*labels, ('le', str(bound))))} {cumulative}")
+            lines.append(f"{name}_sum{_format_labels(labels)} {total}")
+            lines.append(f"{name}_count{_format_labels(labels)} {count}")
+        return "\n".join(lines) + "\n"
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labels):
+    if not labels: return ""
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in labels) + "}"
+
+
+REGISTRY = Registry()
+
+
+def enable(flag=True):
+    """Включает или выключает сбор метрик в процессе (уже собранные данные сохраняются)."""
+    global ENABLED
+    ENABLED = flag
+
+
+def inc(name, value=1, **labels):
+    if not ENABLED: return
+    REGISTRY.inc(name, value, tuple(sorted(labels.items())))
+
+
+def observe(name, value, **labels):
+    if not ENABLED: return
+    REGISTRY.observe(name, value, tuple(sorted(labels.items())))
+
+
+@contextmanager
+def timer(name, **labels):
+    """Замеряет время блока в гистограмму `name`; при выключенных метриках ничего не делает."""
+    if not ENABLED:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(name, time.perf_counter() - started, **labels)
+
+
+def render():
+    return REGISTRY.render()
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] not in ("/metrics", "/"):
+            self.send_error(404)
+            return
+        body = render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+_server = None
+_server_lock = threading.Lock()
+
+def start_http_server(port=None, host="127.0.0.1"):
+    """Поднимает /metrics в фоновом потоке (один на процесс); повторный вызов возвращает тот же сервер."""
+    global _server
+    with _server_lock:
+        if _server is None:
+            try:
+                _server = ThreadingHTTPServer((host, METRICS_PORT if port is None else port), _MetricsHandler)
+            except OSError as e:
+                # Порт занят (например, вторым процессом) — приложение работает и без эндпоинта
+                print(f"[!] Эндпоинт метрик не запущен: {e}")
+                return None
+            _server.daemon_threads = True
+            threading.Thread(target=_server.serve_forever, name="hh-metrics", daemon=True).start()
+            print(f"[*] Метрики: http://{host}:{_server.server_port}/metrics")
+    return _server
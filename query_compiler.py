@@ -0,0 +1,188 @@
+"""
+Компилятор поисковых запросов hh.ru.
+
+Списки ключевых слов (включая синтаксис 'a/b' = a AND b и фразы через пробел)
+разбираются в небольшое булево дерево, которое упрощается: регистр, лишние
+пробелы и запятые, дубликаты, порядок слов и вложенные одинаковые операторы не
+влияют на результат, а поглощаемые условия (x AND (x OR y) = x) выбрасываются.
+Из дерева получается канонический текст запроса и стабильный хэш, поэтому
+кэши работают по смыслу запроса, а не по его написанию.
+
+    compiled = compile_query(["Python", "django "], ["SQL", "sql,"])
+    compiled.text   # 'django AND python AND sql'
+    compiled.hash   # одинаковый для любых эквивалентных списков
+"""
+import hashlib
+import re
+from collections import namedtuple
+
+Term = namedtuple("Term", "text phrase")
+And = namedtuple("And", "children")
+Or = namedtuple("Or", "children")
+Not = namedtuple("Not", "child")
+CompiledQuery = namedtuple("CompiledQuery", "node text hash")
+
+OPERATORS = {"AND", "OR", "NOT"}
+# Символы, которые не должны попадать в ключевое слово с краёв (хвосты запятых из полей ввода и т.п.)
+KEYWORD_EDGE_CHARS = " \t\r\n,;\"'«»"
+QUERY_TOKEN = re.compile(r'\(|\)|"[^"]*"|[^\s()"]+')
+
+
+class QueryParseError(ValueError):
+    pass
+
+
+def normalize_keyword(keyword):
+    """Каноническое написание одного слова или фразы: нижний регистр, одиночные пробелы."""
+    return " ".join(keyword.strip(KEYWORD_EDGE_CHARS).lower().split())
+
+
+def make_term(text, phrase=None):
+    text = normalize_keyword(text.replace('"', " "))
+    if not text: return None
+    return Term(text, " " in text if phrase is None else phrase or " " in text)
+
+
+def _sort_key(node):
+    return to_query_text(node)
+
+
+def _make_group(kind, children):
+    """Общая логика And/Or: выравнивание вложенных, дедупликация, поглощение, порядок."""
+    flat = []
+    for child in children:
+        if child is None: continue
+        flat.extend(child.children if type(child) is kind else [child])
+    unique = set(flat)
+    other = Or if kind is And else And
+    # Поглощение: x AND (x OR y) = x, x OR (x AND y) = x
+    unique = {child for child in unique
+              if not (type(child) is other and any(member in unique for member in child.children))}
+    if not unique: return None
+    if len(unique) == 1: return unique.pop()
+    return kind(tuple(sorted(unique, key=_sort_key)))
+
+
+def make_and(children):
+    return _make_group(And, children)
+
+
+def make_or(children):
+    return _make_group(Or, children)
+
+
+def parse_keyword(keyword):
+    """Одно ключевое слово из списка: 'a/b' — все части обязательны, 'a b' — фраза."""
+    if "/" in keyword:
+        return make_and(make_term(part) for part in keyword.split("/"))
+    return make_term(keyword)
+
+
+def keyword_list(keywords):
+    """
+    Нормализованные ключевые слова без дубликатов, в исходном порядке. Элементы
+    могут содержать несколько слов через запятую (как в полях ввода).
+    """
+    result = []
+    for item in keywords or []:
+        for keyword in item.split(","):
+            keyword = normalize_keyword(keyword)
+            if keyword and keyword not in result: result.append(keyword)
+    return result
+
+
+def parse_keywords(keywords):
+    """Список ключевых слов в список узлов (см. keyword_list)."""
+    nodes = []
+    for keyword in keyword_list(keywords):
+        node = parse_keyword(keyword)
+        if node is not None and node not in nodes: nodes.append(node)
+    return nodes
+
+
+def parse_query(text_query):
+    """
+    Разбирает готовый текст запроса (AND/OR/NOT, скобки, "фразы") в дерево.
+    Соседние слова без оператора соединяются через AND, как на hh.ru.
+    """
+    tokens = QUERY_TOKEN.findall(text_query)
+    position = 0
+
+    def peek():
+        return tokens[position] if position < len(tokens) else None
+
+    def take():
+        nonlocal position
+        position += 1
+        return tokens[position - 1]
+
+    def parse_or():
+        children = [parse_and()]
+        while peek() == "OR":
+            take()
+            children.append(parse_and())
+        return make_or(children)
+
+    def parse_and():
+        children = [parse_unary()]
+        while peek() not in (None, ")", "OR"):
+            if peek() == "AND": take()
+            children.append(parse_unary())
+        return make_and(children)
+
+    def parse_unary():
+        token = peek()
+        if token is None or token in (")", "AND", "OR"): raise QueryParseError(f"Неожиданный конец или оператор в запросе: {text_query!r}")
+        take()
+        if token == "NOT":
+            child = parse_unary()
+            return Not(child) if child is not None else None
+        if token == "(":
+            node = parse_or()
+            if peek() != ")": raise QueryParseError(f"Незакрытая скобка в запросе: {text_query!r}")
+            take()
+            return node
+        if token.startswith('"'): return make_term(token.strip('"'), phrase=True)
+        return make_term(token)
+
+    if not tokens: return None
+    node = parse_or()
+    if position != len(tokens): raise QueryParseError(f"Лишняя закрывающая скобка в запросе: {text_query!r}")
+    return node
+
+
+def to_query_text(node):
+    """Текст запроса для hh.ru. Скобки ставятся только там, где они нужны."""
+    if node is None: return ""
+    if type(node) is Term:
+        if node.phrase or node.text.upper() in OPERATORS or not QUERY_TOKEN.fullmatch(node.text):
+            return f'"{node.text}"'
+        return node.text
+    if type(node) is Not:
+        child = to_query_text(node.child)
+        return f"NOT {child}" if type(node.child) in (Term, Not) else f"NOT ({child})"
+    joiner = " AND " if type(node) is And else " OR "
+    return joiner.join(f"({to_query_text(child)})" if type(child) in (And, Or) else to_query_text(child)
+                       for child in node.children)
+
+
+def query_hash(text):
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()[:16]
+
+
+def compile_node(node):
+    text = to_query_text(node)
+    return CompiledQuery(node, text, query_hash(text))
+
+
+def compile_query(must_have, optional):
+    """must_have — все обязательны, optional — хотя бы одно из них."""
+    return compile_node(make_and([*parse_keywords(must_have), make_or(parse_keywords(optional))]))
+
+
+def canonical_query(text_query):
+    """Канонический вид произвольного текста запроса; если он не разбирается — только пробелы."""
+    try:
+        return to_query_text(parse_query(text_query))
+    except QueryParseError:
+        return " ".join(text_query.split())
@@ -0,0 +1,137 @@
+"""
+Локальное ранжирование резюме по структурированным ключевым словам (BM25).
+
+Резюме пакета представляются разреженной матрицей "документ × токен ключевого
+слова" (координаты собираются один раз, далее все вычисления — векторные
+операции NumPy), поэтому переранжирование тысяч резюме занимает миллисекунды.
+Поля взвешиваются: заголовок важнее должностей, должности — компаний и сниппетов.
+"""
+import re
+
+import numpy as np
+
+from query_compiler import KEYWORD_EDGE_CHARS, normalize_keyword
+
+TOKEN_PATTERN = re.compile(r"\w+")
+HIGHLIGHT_TAGS = re.compile(r"</?highlighttext>")
+FIELD_WEIGHTS = {"title": 3.0, "positions": 2.0, "companies": 1.0, "snippets": 1.0}
+MUST_HAVE_WEIGHT = 2.0
+OPTIONAL_WEIGHT = 1.0
+BM25_K1 = 1.2
+BM25_B = 0.75
+# Словоизменительные окончания (русские и английское -s); основа не короче MIN_STEM символов
+ENDINGS = ("иями", "ями", "ами", "ого", "его", "ому", "ему", "ыми", "ими", "иях", "ях", "ах", "ых", "их", "ым", "им", "ую", "юю", "ов", "ев", "ей", "ой",
+           "ий", "ый", "ая", "яя", "ое", "ее", "ые", "ие", "ом", "ем", "ам", "ям", "ию", "ия", "ью",
+           "а", "я", "ы", "и", "у", "ю", "е", "о", "ь", "s")
+MIN_STEM = 4
+STEM_PATTERN = re.compile(rf"^(\w{{{MIN_STEM},}}?)(?:{'|'.join(ENDINGS)})$")
+
+
+def _stem(token):
+    """
+    Отбрасывает одно окончание (самое длинное из ENDINGS). Применяется и к ключевым
+    словам, и к токенам резюме; совпадение — равенство целых токенов или основ, а не
+    префикс: 'разработчика' совпадает с 'разработчик', но 'java' не совпадает с
+    'javascript', а 'анализ' — с 'аналитик'.
+    """
+    match = STEM_PATTERN.match(token)
+    return match.group(1) if match else token
+
+
+def _keyword_terms(keyword):
+    """
+    Токены ключевого слова. 'a/b' (AND) и фразы — несколько токенов, и все
+    должны встретиться: частота такого слова — минимум частот его токенов.
+    """
+    return TOKEN_PATTERN.findall(keyword.lower())
+
+
+def _resume_fields(resume):
+    experience = resume.get("experience") or []
+    snippet = resume.get("snippet") or {}
+    return {
+        "title": resume.get("title") or "",
+        "positions": " ".join(job.get("position") or "" for job in experience),
+        "companies": " ".join(job.get("company") or "" for job in experience),
+        "snippets": HIGHLIGHT_TAGS.sub("", " ".join(filter(None, (snippet.get("requirement"), snippet.get("responsibility"))))),
+    }
+
+
+def rank_resumes(items, structured_keywords, k1=BM25_K1, b=BM25_B):
+    """
+    Оценивает пакет резюме и возвращает новый список, отсортированный по убыванию
+    балла. Принимает элементы выдачи ({"data": resume, ...}) или сами резюме.
+    У каждого элемента: "score" — итоговый балл, "score_details" — вклад каждого
+    ключевого слова (только ненулевые).
+    """
+    resumes = [item["data"] if "data" in item else item for item in items]
+    keywords, seen = [], set()
+    for group, weight in (("must_have", MUST_HAVE_WEIGHT), ("optional", OPTIONAL_WEIGHT)):
+        for keyword in structured_keywords.get(group, []):
+            keyword = keyword.strip(KEYWORD_EDGE_CHARS)
+            # Дубликаты с другим регистром или пробелами считаются один раз
+            if not keyword or normalize_keyword(keyword) in seen: continue
+            seen.add(normalize_keyword(keyword))
+            keywords.append((keyword, weight))
+    if not resumes:
+        return []
+    if not keywords:
+        return [{"data": resume, "score": 0.0, "score_details": {}} for resume in resumes]
+
+    # Столбец на каждую основу токенов ключевых слов; искать его можно и по основе,
+    # и по самому токену (основа слова и его формы не всегда совпадают: 'систем' → 'сист')
+    columns, lookup, keyword_columns = {}, {}, []
+    for keyword, _ in keywords:
+        keyword_columns.append([])
+        for term in _keyword_terms(keyword):
+            column = columns.setdefault(_stem(term), len(columns))
+            lookup.setdefault(_stem(term), column)
+            lookup.setdefault(term, column)
+            keyword_columns[-1].append(column)
+
+    # Все токены пакета одним потоком: номер документа и вес поля для каждого вхождения
+    all_tokens, lengths, field_weights = [], [], []
+    for resume in resumes:
+        for field, text in _resume_fields(resume).items():
+            tokens = TOKEN_PATTERN.findall(text.lower())
+            all_tokens.extend(tokens)
+            lengths.append(len(tokens))
+            field_weights.append(FIELD_WEIGHTS[field])
+    n_docs, n_fields = len(resumes), len(FIELD_WEIGHTS)
+    lengths = np.array(lengths, dtype=np.intp)
+    occurrence_doc = np.repeat(np.repeat(np.arange(n_docs), n_fields), lengths)
+    occurrence_weight = np.repeat(np.array(field_weights), lengths)
+    doc_lengths = np.bincount(occurrence_doc, weights=occurrence_weight, minlength=n_docs)
+
+    # Отображение "уникальный токен → столбец ключевого слова" (-1 — не ключевое слово);
+    # основа считается один раз на уникальный токен пакета
+    token_index = {}
+    occurrence_token = np.fromiter((token_index.setdefault(t, len(token_index)) for t in all_tokens),
+                                   dtype=np.intp, count=len(all_tokens))
+    token_columns = np.fromiter((lookup.get(_stem(token), lookup.get(token, -1)) for token in token_index),
+                                dtype=np.intp, count=len(token_index))
+
+    term_freq = np.zeros((n_docs, len(columns)))
+    occurrence_columns = token_columns[occurrence_token]
+    for column in range(len(columns)):
+        hit = occurrence_columns == column
+        term_freq[:, column] = np.bincount(occurrence_doc[hit], weights=occurrence_weight[hit], minlength=n_docs)
+
+    # Частота ключевого слова — минимум по его токенам (все токены должны встретиться)
+    keyword_freq = np.column_stack([
+        term_freq[:, cols_].min(axis=1) if cols_ else np.zeros(len(resumes)) for cols_ in keyword_columns])
+
+    doc_freq = (keyword_freq > 0).sum(axis=0)
+    idf = np.log1p((n_docs - doc_freq + 0.5) / (doc_freq + 0.5))
+    avg_length = doc_lengths.mean() or 1.0
+    norm = k1 * (1 - b + b * doc_lengths / avg_length)
+    bm25 = idf * keyword_freq * (k1 + 1) / (keyword_freq + norm[:, None])
+    contributions = bm25 * np.array([weight for _, weight in keywords])
+    scores = contributions.sum(axis=1)
+
+    names = [keyword for keyword, _ in keywords]
+    order = np.argsort(-scores, kind="stable")
+    rounded = np.round(contributions[order], 2).tolist()
+    return [{"data": resumes[row], "score": score,
+             "score_details": {name: value for name, value in zip(names, values) if value}}
+            for row, score, values in zip(order.tolist(), np.round(scores[order], 1).tolist(), rounded)]
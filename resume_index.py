@@ -0,0 +1,298 @@
+"""
+Локальный полнотекстовый индекс резюме (SQLite FTS5).
+
+Выгруженные с hh.ru резюме (заголовок, компании и должности из опыта,
+сниппеты, возраст, регион, дата обновления) хранятся локально, и булев
+запрос из build_query_text вычисляется по индексу за миллисекунды.
+Индекс неполнотекстовый: в нём только поля из списка резюме, тогда как
+hh.ru ищет по полному тексту, поэтому локальная выдача может быть меньше —
+в интерфейсе локальный поиск включается явно, а его выдача помечается.
+
+Индекс наполняется по "охватам" (scope): набор фильтров без текста плюс
+словарь ключевых слов, по которым выгружено OR всех слов. Любой запрос,
+где хотя бы одно обязательное слово из словаря (или все дополнительные,
+если обязательных нет), — подмножество выгруженного, поэтому его можно
+вычислить локально. Обновление инкрементальное: уже известные слова
+догружаются только по резюме, обновлённым после прошлого обновления.
+"""
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+import time
+from concurrent.futures import Future
+from datetime import datetime, timezone
+
+import hh_api_integration_v2 as hh
+from hh_cache import SQLiteStore
+from hh_harvest import iter_all_resumes
+from query_compiler import QUERY_TOKEN, keyword_list
+from ranking import rank_resumes
+
+# Фильтры, которые не влияют на множество найденных резюме
+NON_SCOPE_FILTERS = {"page", "per_page", "text", "user_job_title", "bank_only"}
+# Сколько резюме выгружается за одно наполнение охвата (кнопка в интерфейсе)
+RESUME_INDEX_MAX_RESUMES = int(os.getenv("RESUME_INDEX_MAX_RESUMES", "20000"))
+
+logger = logging.getLogger(__name__)
+
+
+def scope_key(search_filters):
+    filters = {k: v for k, v in search_filters.items() if k not in NON_SCOPE_FILTERS}
+    _, normalized = hh.get_search_cache().query_key("", filters)
+    return hashlib.sha1(json.dumps(normalized, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+
+def to_fts_query(text_query):
+    """
+    Переводит запрос в синтаксисе hh.ru (AND/OR/NOT, скобки, "фразы") в FTS5 MATCH.
+    Слова берутся в кавычки, а длинные — с префиксным поиском, что приближает
+    морфологию hh.ru (python → python's, разработчик → разработчика).
+    """
+    parts = []
+    for token in QUERY_TOKEN.findall(text_query):
+        if token in ("(", ")", "AND", "OR", "NOT"):
+            parts.append(token)
+        elif token.startswith('"'):
+            phrase = token.strip('"').replace('"', "")
+            if phrase: parts.append(f'"{phrase}"')
+        else:
+            word = token.replace('"', "")
+            parts.append(f'"{word}"*' if len(word) >= 4 else f'"{word}"')
+    return " ".join(parts)
+
+
+def _resume_fields(resume):
+    experience = resume.get("experience") or []
+    snippet = resume.get("snippet") or {}
+    snippets = " ".join(filter(None, (snippet.get("requirement"), snippet.get("responsibility"))))
+    return (
+        resume.get("title") or "",
+        " ".join(job.get("position") or "" for job in experience),
+        " ".join(job.get("company") or "" for job in experience),
+        re.sub(r"</?highlighttext>", "", snippets),
+    )
+
+
+class ResumeIndex(SQLiteStore):
+    schema = """
+        CREATE TABLE IF NOT EXISTS resumes (
+            id TEXT PRIMARY KEY,
+            updated_at TEXT,
+            data TEXT NOT NULL
+        );
+        CREATE VIRTUAL TABLE IF NOT EXISTS resumes_fts USING fts5(
+            id UNINDEXED, title, positions, companies, snippets,
+            tokenize = 'unicode61 remove_diacritics 2'
+        );
+        CREATE TABLE IF NOT EXISTS scopes (
+            scope_key TEXT PRIMARY KEY,
+            filters TEXT NOT NULL,
+            vocabulary TEXT NOT NULL,
+            refreshed_at TEXT
+        );
+        CREATE TABLE IF NOT EXISTS scope_members (
+            scope_key TEXT NOT NULL,
+            resume_id TEXT NOT NULL,
+            PRIMARY KEY (scope_key, resume_id)
+        );
+    """
+
+    def __init__(self, filename="resume_index.sqlite3", max_age=24 * 3600):
+        super().__init__(filename)
+        self.max_age = max_age
+        self._refresh_lock = threading.Lock()
+
+    def upsert(self, resumes, scope=None, batch_size=500):
+        """
+        Добавляет/обновляет резюме; переиндексируются только изменившиеся по updated_at.
+        Пишет пачками, чтобы не держать блокировку, пока идёт выгрузка с hh.ru.
+        """
+        changed, batch = 0, []
+        for resume in resumes:
+            batch.append(resume)
+            if len(batch) >= batch_size:
+                changed += self._upsert_batch(batch, scope)
+                batch = []
+        if batch: changed += self._upsert_batch(batch, scope)
+        return changed
+
+    def _upsert_batch(self, resumes, scope):
+        changed = 0
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                for resume in resumes:
+                    resume_id, updated_at = resume["id"], resume.get("updated_at")
+                    row = self._conn.execute("SELECT updated_at FROM resumes WHERE id = ?", (resume_id,)).fetchone()
+                    if row is None or row[0] != updated_at:
+                        self._conn.execute("INSERT OR REPLACE INTO resumes (id, updated_at, data) VALUES (?, ?, ?)",
+                                           (resume_id, updated_at, json.dumps(resume, ensure_ascii=False)))
+                        self._conn.execute("DELETE FROM resumes_fts WHERE id = ?", (resume_id,))
+                        self._conn.execute("INSERT INTO resumes_fts (id, title, positions, companies, snippets) VALUES (?, ?, ?, ?, ?)",
+                                           (resume_id, *_resume_fields(resume)))
+                        changed += 1
+                    if scope:
+                        self._conn.execute("INSERT OR IGNORE INTO scope_members (scope_key, resume_id) VALUES (?, ?)", (scope, resume_id))
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        return changed
+
+    def _get_scope(self, key):
+        rows = self._execute("SELECT vocabulary, refreshed_at FROM scopes WHERE scope_key = ?", (key,))
+        if not rows: return None
+        return set(json.loads(rows[0][0])), rows[0][1]
+
+    def _expired(self, refreshed_at):
+        return time.time() - datetime.fromisoformat(refreshed_at).timestamp() > self.max_age
+
+    def _drop_scope(self, key):
+        """Сбрасывает состав охвата и удаляет резюме, которые больше не входят ни в один охват."""
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                self._conn.execute("DELETE FROM scope_members WHERE scope_key = ?", (key,))
+                orphans = "SELECT id FROM resumes WHERE id NOT IN (SELECT resume_id FROM scope_members)"
+                self._conn.execute(f"DELETE FROM resumes_fts WHERE id IN ({orphans})")
+                self._conn.execute(f"DELETE FROM resumes WHERE id IN ({orphans})")
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def covers(self, search_params, search_filters):
+        """Можно ли вычислить поиск локально: охват свежий и словарь покрывает запрос."""
+        scope = self._get_scope(scope_key(search_filters))
+        if scope is None or scope[1] is None: return False
+        vocabulary, refreshed_at = scope
+        if self._expired(refreshed_at): return False
+        must_have = keyword_list(search_params.get("must_have"))
+        optional = keyword_list(search_params.get("optional"))
+        if must_have: return any(term in vocabulary for term in must_have)
+        return bool(optional) and all(term in vocabulary for term in optional)
+
+    def search(self, text_query, search_filters, page=0, per_page=20):
+        """Вычисляет запрос по индексу в пределах охвата фильтров. Формат ответа как у /resumes."""
+        key = scope_key(search_filters)
+        match = to_fts_query(text_query)
+        base_sql = ("FROM resumes_fts JOIN scope_members m ON m.resume_id = resumes_fts.id AND m.scope_key = ? "
+                    "JOIN resumes r ON r.id = resumes_fts.id WHERE resumes_fts MATCH ?")
+        found = self._execute(f"SELECT COUNT(*) {base_sql}", (key, match))[0][0]
+        rows = self._execute(f"SELECT r.data {base_sql} ORDER BY r.updated_at DESC LIMIT ? OFFSET ?",
+                             (key, match, per_page, page * per_page))
+        return {"found": found, "pages": -(-found // per_page), "page": page, "per_page": per_page,
+                "items": [json.loads(data) for (data,) in rows], "source": "local"}
+
+    def refresh(self, search_params, search_filters, max_workers=None, log=None, max_resumes=None):
+        """
+        Наполняет/обновляет охват фильтров: новые слова выгружаются полностью,
+        известные — только резюме, обновлённые после прошлого обновления.
+        Охват старше max_age собирается заново: догрузка по дате не замечает
+        резюме, которые скрыли или которые перестали подходить под фильтры.
+        Не больше `max_resumes` резюме за вызов: если предел достигнут, охват не
+        помечается обновлённым (локально такой запрос вычислять нельзя).
+        Возвращает число добавленных или изменённых резюме.
+        """
+        key = scope_key(search_filters)
+        filters = {k: v for k, v in search_filters.items() if k not in NON_SCOPE_FILTERS}
+        terms = keyword_list([*search_params.get("must_have", []), *search_params.get("optional", [])])
+        budget = [max_resumes]
+
+        def capped(resumes):
+            try:
+                for resume in resumes:
+                    if budget[0] is not None:
+                        if budget[0] == 0: return
+                        budget[0] -= 1
+                    yield resume
+            finally:
+                resumes.close()
+
+        with self._refresh_lock:
+            vocabulary, refreshed_at = self._get_scope(key) or (set(), None)
+            if refreshed_at and self._expired(refreshed_at):
+                self._drop_scope(key)
+                terms = keyword_list([*terms, *sorted(vocabulary)])
+                vocabulary, refreshed_at = set(), None
+            started_at = datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%S%z")
+            changed = 0
+            new_terms = [term for term in terms if term not in vocabulary]
+            if new_terms:
+                changed += self.upsert(capped(iter_all_resumes(hh.build_query_text([], new_terms), filters, max_workers, log=log)), key)
+            if vocabulary and refreshed_at:
+                known_query = hh.build_query_text([], sorted(vocabulary))
+                changed += self.upsert(capped(iter_all_resumes(known_query, {**filters, "date_from": refreshed_at}, max_workers, log=log)), key)
+            if budget[0] == 0:
+                logger.warning("Охват %s не наполнен полностью: выгружено %d резюме (предел)", key[:8], max_resumes)
+                return changed
+            vocabulary |= set(terms)
+            self._execute("INSERT OR REPLACE INTO scopes (scope_key, filters, vocabulary, refreshed_at) VALUES (?, ?, ?, ?)",
+                          (key, json.dumps(filters, ensure_ascii=False), json.dumps(sorted(vocabulary), ensure_ascii=False), started_at))
+        return changed
+
+
+_index = None
+_index_lock = threading.Lock()
+
+def get_resume_index():
+    global _index
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                _index = ResumeIndex(max_age=int(os.getenv("RESUME_INDEX_MAX_AGE", str(24 * 3600))))
+    return _index
+
+
+_refresh_jobs = {}
+_refresh_jobs_lock = threading.Lock()
+
+def start_refresh(search_params, search_filters, max_resumes=RESUME_INDEX_MAX_RESUMES):
+    """
+    Наполняет охват в фоновом потоке, не дольше одного наполнения на охват.
+    Возвращает Future с числом изменённых резюме; повторный вызов, пока идёт
+    выгрузка, отдаёт тот же Future.
+    """
+    key = scope_key(search_filters)
+    with _refresh_jobs_lock:
+        job = _refresh_jobs.get(key)
+        if job is not None and not job.done(): return job
+        job = _refresh_jobs[key] = Future()
+
+    def run():
+        try:
+            job.set_result(get_resume_index().refresh(search_params, search_filters, max_resumes=max_resumes))
+        except Exception as e:
+            logger.warning("Локальный индекс не обновлён: %s", e)
+            job.set_exception(e)
+
+    threading.Thread(target=run, name="hh-resume-index", daemon=True).start()
+    return job
+
+def refresh_job(search_filters):
+    """Последнее фоновое наполнение охвата этих фильтров или None."""
+    return _refresh_jobs.get(scope_key(search_filters))
+
+
+def local_search(search_params, search_filters):
+    """
+    Двухступенчатый поиск по локальному индексу (та же логика, что в
+    advanced_search_resumes). Возвращает None, если индекс не покрывает запрос.
+    Ответ помечен source="local": совпадения ищутся только в полях списка резюме.
+    """
+    index = get_resume_index()
+    if not index.covers(search_params, search_filters): return None
+    page = search_filters.get("page", 0)
+    per_page = search_filters.get("per_page", 20)
+    ideal_query = hh.build_query_text(search_params["must_have"], search_params["optional"])
+    main_query = hh.build_query_text(search_params["must_have"], [])
+    if not ideal_query: return None
+    results = index.search(ideal_query, search_filters, page, per_page)
+    if results["found"] == 0 and main_query and main_query != ideal_query:
+        results = index.search(main_query, search_filters, page, per_page)
+    # Тот же формат, что у advanced_search_resumes
+    results["items"] = rank_resumes(results["items"], search_params)
+    return results
@@ -0,0 +1,240 @@
+"""
+Пакетный поиск кандидатов по всем активным вакансиям без Streamlit.
+
+Для каждой вакансии: детали с hh.ru → ключевые слова (из хранилища
+hh_cache.KeywordStore или через LLM) → тот же двухступенчатый поиск, что и на
+странице вакансии (hh.search_resumes), с фильтрами по умолчанию из вакансии.
+Вакансии обрабатываются параллельно, а в обработке одновременно находится не
+больше нескольких вакансий на поток, поэтому память не растёт с их числом:
+строки результатов пишутся в JSONL/CSV по мере готовности и сразу отпускаются.
+
+    python search_batch.py --output candidates.jsonl
+    python search_batch.py --vacancies-file vacancies.json --output candidates.csv --pages 2
+    python search_batch.py --cached-keywords-only --output -   # без LLM, в stdout
+    python search_batch.py --delta --output new.jsonl          # только новые с прошлого запуска
+"""
+import argparse
+import csv
+import json
+import sys
+import time
+from collections import Counter
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import hh_api_integration_v2 as hh
+from keyword_batch import RateLimiter, extract_with_limits, load_active_vacancies
+
+RESULT_FIELDS = ["vacancy_id", "vacancy_name", "page", "rank", "resume_id", "title", "score",
+                 "used_fallback", "area", "age", "alternate_url", "score_details"]
+# Значения по умолчанию — как в фильтрах на странице вакансии
+DEFAULT_EDUCATION_LEVELS = ["higher", "bachelor", "master", "candidate", "doctor"]
+DEFAULT_LANGUAGES = ["rus", "kaz"]
+DEFAULT_JOB_SEARCH_STATUS = ["active_search", "looking_for_offers"]
+EXPERIENCE_OPTIONS = {"noExperience", "between1And3", "between3And6", "moreThan6"}
+
+
+class SkipVacancy(Exception):
+    """Вакансия пропущена не из-за ошибки (например, нет сохранённых ключевых слов)."""
+
+
+class StageError(Exception):
+    """Ошибка обработки вакансии с указанием этапа: "details", "keywords" или "search"."""
+
+    def __init__(self, stage, error):
+        super().__init__(f"{stage}: {error}")
+        self.stage = stage
+        self.error = error
+
+
+def vacancy_filters(vacancy_details, per_page=20):
+    """Фильтры поиска, которые страница вакансии подставляет по умолчанию."""
+    area_id = (vacancy_details.get("area") or {}).get("id")
+    experience_id = (vacancy_details.get("experience") or {}).get("id")
+    return {
+        "area": [area_id] if area_id else [], "employment": ["full"],
+        "experience": [experience_id] if experience_id in EXPERIENCE_OPTIONS else [],
+        "host": "hh.kz", "job_search_status": DEFAULT_JOB_SEARCH_STATUS,
+        "education_levels": DEFAULT_EDUCATION_LEVELS, "language": DEFAULT_LANGUAGES,
+        "per_page": per_page,
+    }
+
+
+def vacancy_keywords(vacancy_details, limiter, cached_only=False):
+    if cached_only:
+        cleaned_text, _ = hh.clean_vacancy_description(vacancy_details.get("description", ""))
+        keywords, _ = hh.extract_keywords(vacancy_details.get("name", ""), cleaned_text, cached_only=True)
+    else:
+        keywords, _ = extract_with_limits(vacancy_details, limiter)
+    if not keywords: raise SkipVacancy("нет сохранённых ключевых слов")
+    search_params = {"must_have": keywords.get("must_have") or [], "optional": keywords.get("optional") or []}
+    if not hh.build_query_text(search_params["must_have"], search_params["optional"]):
+        raise SkipVacancy("пустой набор ключевых слов")
+    return search_params
+
+
+def _result_rows(vacancy, details, results, used_fallback, page, first_rank=1):
+    rows = []
+    for rank, item in enumerate(results.get("items", []), start=first_rank):
+        resume = item.get("data", {})
+        rows.append({
+            "vacancy_id": vacancy["id"], "vacancy_name": details.get("name", ""), "page": page, "rank": rank,
+            "resume_id": resume.get("id"), "title": resume.get("title"), "score": item.get("score", 0),
+            "used_fallback": used_fallback, "area": (resume.get("area") or {}).get("name"),
+            "age": resume.get("age"), "alternate_url": resume.get("alternate_url"),
+            "score_details": item.get("score_details", {}), "resume": resume,
+        })
+    return rows
+
+
+def search_vacancy(vacancy, limiter, pages=1, per_page=20, cached_only=False, delta=False):
+    """
+    Полный поиск по одной вакансии. Возвращает (строки результатов, число поисков);
+    ошибки бросаются как StageError. С delta=True — только новые кандидаты с прошлого
+    дельта-поиска (hh.search_new_resumes), просматривается до `pages` страниц.
+    """
+    try:
+        details = hh.fetch_vacancy_details(vacancy["id"])
+    except hh.HHAPIError as e:
+        raise StageError("details", e) from e
+    try:
+        search_params = vacancy_keywords(details, limiter, cached_only)
+    except SkipVacancy:
+        raise
+    except Exception as e:
+        raise StageError("keywords", e) from e
+
+    filters = vacancy_filters(details, per_page)
+    if delta:
+        try:
+            results = hh.search_new_resumes(vacancy["id"], search_params, filters, max_pages=pages)
+        except hh.HHAPIError as e:
+            raise StageError("search", e) from e
+        return _result_rows(vacancy, details, results, results["used_fallback"], 0), 1
+
+    rows, searches, used_fallback = [], 0, None
+    for page in range(pages):
+        try:
+            results, used_fallback = hh.search_resumes(search_params, {**filters, "page": page}, prefetch=False, fallback=used_fallback)
+        except hh.HHAPIError as e:
+            raise StageError("search", e) from e
+        searches += 1
+        rows.extend(_result_rows(vacancy, details, results, used_fallback, page, page * per_page + 1))
+        if page + 1 >= results.get("pages", 0): break
+    return rows, searches
+
+
+class JsonlWriter:
+    def __init__(self, stream, include_resume=False):
+        self.stream = stream
+        self.include_resume = include_resume
+
+    def write(self, row):
+        if not self.include_resume: row = {k: v for k, v in row.items() if k != "resume"}
+        self.stream.write(json.dumps(row, ensure_ascii=False) + "\n")
+
+
+class CsvWriter:
+    def __init__(self, stream, include_resume=False):
+        self.writer = csv.DictWriter(stream, fieldnames=RESULT_FIELDS, extrasaction="ignore")
+        self.writer.writeheader()
+
+    def write(self, row):
+        self.writer.writerow({**row, "score_details": json.dumps(row["score_details"], ensure_ascii=False)})
+
+
+def run_batch(vacancies, writer, workers=4, rpm=300, pages=1, per_page=20, cached_only=False, delta=False, log=print):
+    """
+    Ищет кандидатов по всем вакансиям и передаёт строки в writer по мере готовности.
+    Возвращает словарь со статистикой: вакансии, резюме, запросы, ошибки по этапам, скорость.
+    """
+    stats = {"total": len(vacancies), "searched": 0, "skipped": 0, "failed": 0, "resumes": 0,
+             "searches": 0, "errors": Counter()}
+    limiter = RateLimiter(rpm)
+    started = time.monotonic()
+    pending_vacancies = iter(vacancies)
+    max_in_flight = workers * 2
+
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="search-batch") as pool:
+        futures = {}
+
+        def submit_next():
+            vacancy = next(pending_vacancies, None)
+            if vacancy is not None:
+                futures[pool.submit(search_vacancy, vacancy, limiter, pages, per_page, cached_only, delta)] = vacancy
+
+        for _ in range(max_in_flight): submit_next()
+        while futures:
+            done, _ = wait(futures, return_when=FIRST_COMPLETED)
+            for future in done:
+                vacancy = futures.pop(future)
+                submit_next()
+                try:
+                    rows, searches = future.result()
+                except SkipVacancy as e:
+                    stats["skipped"] += 1
+                    log(f"[*] {vacancy['id']}: пропущена — {e}")
+                    continue
+                except StageError as e:
+                    stats["failed"] += 1
+                    status = getattr(e.error, "status", None)
+                    stats["errors"][f"{e.stage}:{status}" if status else e.stage] += 1
+                    log(f"[!] {vacancy['id']}: ошибка на этапе {e}")
+                    continue
+                for row in rows: writer.write(row)
+                stats["searched"] += 1
+                stats["searches"] += searches
+                stats["resumes"] += len(rows)
+
+    elapsed = time.monotonic() - started
+    stats["elapsed_sec"] = round(elapsed, 2)
+    stats["vacancies_per_min"] = round(stats["searched"] / elapsed * 60, 1) if elapsed else 0.0
+    stats["resumes_per_sec"] = round(stats["resumes"] / elapsed, 1) if elapsed else 0.0
+    return stats
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Пакетный поиск кандидатов по активным вакансиям")
+    parser.add_argument("--employer-id", default="24761")
+    parser.add_argument("--vacancies-file", help="JSON со списком вакансий вместо загрузки с hh.ru")
+    parser.add_argument("--output", default="-", help="Файл .jsonl или .csv ('-' — stdout)")
+    parser.add_argument("--format", choices=["jsonl", "csv"], help="Формат вывода (по умолчанию — по расширению файла)")
+    parser.add_argument("--include-resume", action="store_true", help="Добавить в JSONL полный объект резюме")
+    parser.add_argument("--workers", type=int, default=4, help="Вакансий, обрабатываемых параллельно")
+    parser.add_argument("--rpm", type=int, default=300, help="Лимит запросов к LLM в минуту (0 — без лимита)")
+    parser.add_argument("--pages", type=int, default=1, help="Страниц выдачи на вакансию")
+    parser.add_argument("--per-page", type=int, default=20, help="Резюме на странице (до 100)")
+    parser.add_argument("--delta", action="store_true", help="Только новые кандидаты с прошлого запуска (водяные знаки по вакансиям)")
+    parser.add_argument("--cached-keywords-only", action="store_true", help="Не вызывать LLM: только сохранённые ключевые слова")
+    args = parser.parse_args(argv)
+
+    if not hh.get_client().access_token:
+        print("[!] Токен доступа ACCESS_TOKEN не найден.", file=sys.stderr)
+        return 2
+    if args.vacancies_file:
+        with open(args.vacancies_file, encoding="utf-8") as f:
+            vacancies = json.load(f)
+    else:
+        vacancies = load_active_vacancies(args.employer_id)
+    # Журнал — в stderr, чтобы не смешиваться с результатами при --output -
+    log = lambda message: print(message, file=sys.stderr)
+    log(f"[*] Вакансий к обработке: {len(vacancies)}")
+
+    output_format = args.format or ("csv" if args.output.endswith(".csv") else "jsonl")
+    stream = sys.stdout if args.output == "-" else open(args.output, "w", encoding="utf-8", newline="")
+    try:
+        writer = (CsvWriter if output_format == "csv" else JsonlWriter)(stream, args.include_resume)
+        stats = run_batch(vacancies, writer, args.workers, args.rpm, args.pages, args.per_page,
+                          args.cached_keywords_only, args.delta, log)
+    finally:
+        if stream is not sys.stdout: stream.close()
+
+    log(f"[*] Обработано вакансий: {stats['searched']} из {stats['total']}, пропущено: {stats['skipped']}, ошибок: {stats['failed']}")
+    log(f"[*] Резюме записано: {stats['resumes']}, запросов поиска: {stats['searches']}")
+    log(f"[*] Время: {stats['elapsed_sec']} с, скорость: {stats['vacancies_per_min']} вакансий/мин, {stats['resumes_per_sec']} резюме/с")
+    if stats["errors"]:
+        log("[!] Ошибки по этапам: " + ", ".join(f"{stage}: {count}" for stage, count in stats["errors"].most_common()))
+    return 0 if not stats["failed"] else 1
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,121 @@
+"""
+Поиск резюме по нескольким стратегиям одновременно.
+
+Из одного набора ключевых слов планировщик строит несколько запросов к hh.ru:
+строгий (must_have AND одно из optional), только обязательные, расширенный
+(OR всех слов), только по названию должности и вариант с опытом в банке.
+Запросы выполняются параллельно в общем пуле поиска, поэтому общий ответ
+приходит примерно за время самого медленного запроса, а не за их сумму.
+Выдачи объединяются взвешенным Reciprocal Rank Fusion по id резюме.
+
+    plan = plan_queries(keywords, user_job_title="Java-разработчик")
+    results = multi_strategy_search(keywords, search_filters)
+"""
+from collections import namedtuple
+from concurrent.futures import wait
+
+import hh_api_integration_v2 as hh
+from query_compiler import make_and, make_or, make_term, parse_keyword, parse_keywords, to_query_text
+
+RRF_K = 60
+BANK_CLAUSE = "банк"
+# Поля, которые влияют на текст запроса, а не передаются в hh.ru как есть
+PLANNER_FILTERS = ("user_job_title", "bank_only")
+
+QueryStrategy = namedtuple("QueryStrategy", "name label text weight params")
+
+
+def plan_queries(search_params, user_job_title=None, bank_only=False):
+    """
+    Список стратегий поиска для набора ключевых слов. Запросы собираются через
+    query_compiler, поэтому эквивалентные стратегии не дублируются. При bank_only
+    условие "банк" добавляется ко всем стратегиям, иначе отдельная стратегия
+    поднимает кандидатов из банков.
+    """
+    must_have = parse_keywords(search_params.get("must_have"))
+    optional = parse_keywords(search_params.get("optional"))
+    bank = make_term(BANK_CLAUSE)
+    core = make_and(must_have)
+
+    candidates = [
+        QueryStrategy("strict", "Все критерии", make_and([*must_have, make_or(optional)]), 1.0, {}),
+        QueryStrategy("core", "Только обязательные", core, 0.8, {}),
+        QueryStrategy("relaxed", "Любое из ключевых слов", make_or([*must_have, *optional]), 0.4, {}),
+    ]
+    if user_job_title:
+        # Условие "банк" не может искаться только в названии резюме — тогда ищем название везде
+        title_params = {} if bank_only else {"text.field": "title"}
+        candidates.append(QueryStrategy("title", "Название должности", parse_keyword(user_job_title), 0.8, title_params))
+    if not bank_only and core is not None:
+        candidates.append(QueryStrategy("bank", "Опыт в банке", make_and([core, bank]), 0.5, {}))
+
+    strategies, seen = [], set()
+    for strategy in candidates:
+        if strategy.text is None: continue
+        text = to_query_text(make_and([strategy.text, bank]) if bank_only else strategy.text)
+        key = (text, tuple(sorted(strategy.params.items())))
+        if key in seen: continue
+        seen.add(key)
+        strategies.append(strategy._replace(text=text))
+    return strategies
+
+
+def fuse_results(ranked_lists, k=RRF_K):
+    """
+    Взвешенный Reciprocal Rank Fusion: резюме получает weight / (k + позиция)
+    от каждой стратегии, где оно найдено. Балл нормирован к 0–100 (100 — первое
+    место во всех стратегиях), "score_details" — вклад каждой стратегии.
+    """
+    fused = {}
+    for strategy, items in ranked_lists:
+        for rank, resume in enumerate(items, start=1):
+            entry = fused.setdefault(resume["id"], {"data": resume, "score": 0.0, "score_details": {}})
+            contribution = strategy.weight / (k + rank)
+            entry["score"] += contribution
+            entry["score_details"][strategy.label] = contribution
+
+    best_possible = sum(strategy.weight for strategy, _ in ranked_lists) / (k + 1) or 1.0
+    ranked = sorted(fused.values(), key=lambda entry: entry["score"], reverse=True)
+    for entry in ranked:
+        entry["score"] = round(100 * entry["score"] / best_possible, 1)
+        entry["score_details"] = {label: round(100 * value / best_possible, 1) for label, value in entry["score_details"].items()}
+    return ranked
+
+
+def multi_strategy_search(search_params, search_filters, strategies=None, timeout=None):
+    """
+    Выполняет все стратегии плана параллельно и объединяет выдачи.
+    Ошибка отдельной стратегии не прерывает поиск — она попадает в
+    "strategies" ответа; HHAPIError бросается, только если упали все.
+    "found" — максимум по стратегиям (нижняя оценка объединения).
+    """
+    filters = {k: v for k, v in search_filters.items() if k not in PLANNER_FILTERS}
+    page = filters.pop("page", 0)
+    if strategies is None:
+        strategies = plan_queries(search_params, search_filters.get("user_job_title"), search_filters.get("bank_only", False))
+    if not strategies: raise hh.HHAPIError("Не заданы критерии для поиска.")
+
+    futures = {hh.submit_search(strategy.text, {**filters, **strategy.params}, page): strategy
+               for strategy in strategies}
+    wait(futures, timeout=timeout)
+
+    ranked_lists, report, errors = [], [], []
+    for future, strategy in futures.items():
+        if not future.done():
+            future.cancel()
+            error = hh.HHAPIError(f"Стратегия '{strategy.label}' не уложилась в {timeout} с")
+        else:
+            error = future.exception()
+        if error is not None:
+            errors.append(error)
+            report.append({"name": strategy.name, "label": strategy.label, "found": 0, "error": str(error)})
+            continue
+        results = future.result()
+        ranked_lists.append((strategy, results.get("items", [])))
+        report.append({"name": strategy.name, "label": strategy.label, "found": results.get("found", 0), "error": None})
+    if not ranked_lists: raise errors[0]
+
+    found = max(entry["found"] for entry in report)
+    per_page = filters.get("per_page", 20)
+    return {"found": found, "pages": -(-found // per_page), "page": page, "per_page": per_page,
+            "items": fuse_results(ranked_lists), "strategies": report, "source": "planner"}
@@ -0,0 +1,102 @@
+import threading
+import time
+
+import pytest
+
+import hh_api_integration_v2 as hh
+from hh_cache import ResumeCache, SearchPageCache
+
+
+def test_search_cache_key_ignores_query_spelling_and_filter_order():
+    cache = SearchPageCache()
+    first = cache.make_key("django AND (python OR sql)", {"area": ["40", "159"], "per_page": 20}, 0)
+    second = cache.make_key("(sql OR python)  AND django", {"per_page": 20, "area": ["159", "40"]}, 0)
+    assert first == second
+
+
+def test_search_cache_evicts_least_recently_used():
+    cache = SearchPageCache(max_entries=2)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    assert cache.get("a") == 1
+    cache.put("c", 3)
+    assert cache.get("b") is None
+    assert cache.get("a") == 1 and cache.get("c") == 3
+
+
+def test_search_cache_expires_entries():
+    cache = SearchPageCache(ttl=-1)
+    cache.put("a", 1)
+    assert cache.get("a") is None
+
+
+def test_search_cache_coalesces_inflight_requests():
+    cache = SearchPageCache()
+    started, release, calls, results = threading.Event(), threading.Event(), [], []
+
+    def fetch():
+        calls.append(1)
+        started.set()
+        release.wait(5)
+        return {"items": []}
+
+    owner = threading.Thread(target=lambda: results.append(cache.get_or_fetch("key", fetch)))
+    owner.start()
+    started.wait(5)
+    waiter = threading.Thread(target=lambda: results.append(cache.get_or_fetch("key", fetch)))
+    waiter.start()
+    time.sleep(0.05)
+    assert "key" in cache
+    release.set()
+    owner.join(5)
+    waiter.join(5)
+    assert len(calls) == 1
+    assert results == [{"items": []}, {"items": []}]
+
+
+def test_search_cache_does_not_store_failures():
+    cache = SearchPageCache()
+
+    def fail():
+        raise hh.HHAPIError("boom")
+
+    with pytest.raises(hh.HHAPIError):
+        cache.get_or_fetch("key", fail)
+    assert "key" not in cache
+    assert cache.get_or_fetch("key", lambda: 1) == 1
+
+
+def test_resume_views_respect_daily_limit(tmp_path):
+    cache = ResumeCache(str(tmp_path / "resumes.sqlite3"))
+    assert cache.reserve_views(3, daily_limit=5) == 3
+    assert cache.reserve_views(3, daily_limit=5) == 2
+    cache.release_views(4)
+    assert cache.views_used() == 1
+
+
+def test_failed_resume_fetches_release_quota(tmp_path, monkeypatch):
+    cache = ResumeCache(str(tmp_path / "resumes.sqlite3"))
+    monkeypatch.setattr(hh, "get_resume_cache", lambda: cache)
+
+    def fetch_resume(resume_id):
+        if resume_id == "bad": raise hh.HHAPIError("hh.ru вернул 500", status=500)
+        return {"id": resume_id}
+
+    monkeypatch.setattr(hh, "fetch_resume", fetch_resume)
+    result = hh.enrich_resumes([{"id": "ok", "updated_at": "1"}, {"id": "bad", "updated_at": "1"}], daily_limit=10)
+    assert result["fetched"] == 1 and set(result["errors"]) == {"bad"}
+    assert cache.views_used() == 1
+
+
+def test_quota_error_stops_fetches_and_releases_unused_views(tmp_path, monkeypatch):
+    cache = ResumeCache(str(tmp_path / "resumes.sqlite3"))
+    monkeypatch.setattr(hh, "get_resume_cache", lambda: cache)
+
+    def fetch_resume(resume_id):
+        raise hh.HHAPIError("hh.ru вернул 429", status=429)
+
+    monkeypatch.setattr(hh, "fetch_resume", fetch_resume)
+    resumes = [{"id": str(i), "updated_at": "1"} for i in range(5)]
+    result = hh.enrich_resumes(resumes, max_workers=1, daily_limit=10)
+    assert result["fetched"] == 0
+    assert cache.views_used() == 0
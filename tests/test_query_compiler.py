@@ -0,0 +1,42 @@
+import pytest
+
+from query_compiler import canonical_query, compile_query, parse_query, to_query_text
+
+
+@pytest.mark.parametrize("must_have, optional", [
+    (["Python", "django "], ["SQL", "sql,"]),
+    (["java/spring"], ["kafka", '"data science"']),
+    ([], ["a b", "c"]),
+    (["NOT"], ["c++", "1С"]),
+])
+def test_canonical_text_round_trips(must_have, optional):
+    compiled = compile_query(must_have, optional)
+    assert canonical_query(compiled.text) == compiled.text
+    assert to_query_text(parse_query(compiled.text)) == compiled.text
+
+
+def test_equivalent_lists_share_text_and_hash():
+    first = compile_query(["Python", "django "], ["SQL", "sql,"])
+    second = compile_query(["DJANGO", "python", "python"], ["sql"])
+    assert first.text == second.text == "django AND python AND sql"
+    assert first.hash == second.hash
+
+
+def test_term_order_does_not_matter():
+    assert canonical_query("(sql OR python) AND django") == canonical_query("django AND (python OR sql)")
+
+
+def test_absorption():
+    # x AND (x OR y) = x, x OR (x AND y) = x
+    assert compile_query(["python"], ["python", "sql"]).text == "python"
+    assert canonical_query("x AND (x OR y)") == "x"
+    assert canonical_query("x OR (x AND y)") == "x"
+
+
+def test_phrases_keep_quotes():
+    assert compile_query([], ["data science"]).text == '"data science"'
+    assert compile_query(["and"], []).text == '"and"'
+
+
+def test_unparsable_text_is_only_whitespace_normalized():
+    assert canonical_query("a  AND (b") == "a AND (b"
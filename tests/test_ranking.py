@@ -0,0 +1,55 @@
+from ranking import rank_resumes
+
+
+def resume(resume_id, title="", position="", company="", requirement=""):
+    return {"id": resume_id, "title": title,
+            "experience": [{"position": position, "company": company}],
+            "snippet": {"requirement": requirement}}
+
+
+def ids(ranked):
+    return [item["data"]["id"] for item in ranked]
+
+
+def test_title_match_outranks_snippet_match():
+    ranked = rank_resumes([resume("snippet", requirement="Python"), resume("title", title="Python"),
+                           resume("other", title="Бухгалтер")], {"must_have": ["python"]})
+    assert ids(ranked) == ["title", "snippet", "other"]
+    assert ranked[0]["score"] > ranked[1]["score"] > 0
+
+
+def test_must_have_outweighs_optional():
+    ranked = rank_resumes([resume("optional", title="SQL"), resume("must", title="Python")],
+                          {"must_have": ["python"], "optional": ["sql"]})
+    assert ids(ranked) == ["must", "optional"]
+
+
+def test_no_match_scores_zero_and_keeps_items():
+    ranked = rank_resumes([resume("a", title="Бухгалтер"), resume("b", title="Python")], {"must_have": ["python"]})
+    assert ids(ranked) == ["b", "a"]
+    assert ranked[1]["score"] == 0 and ranked[1]["score_details"] == {}
+
+
+def test_whole_tokens_not_prefixes():
+    ranked = rank_resumes([resume("js", title="JavaScript developer"), resume("java", title="Java developer")],
+                          {"must_have": ["java"]})
+    assert ids(ranked) == ["java", "js"]
+    assert ranked[1]["score"] == 0
+
+
+def test_word_forms_match():
+    ranked = rank_resumes([resume("a", title="Ведущий разработчика систем")], {"must_have": ["разработчик", "системы"]})
+    assert set(ranked[0]["score_details"]) == {"разработчик", "системы"}
+
+
+def test_and_keyword_needs_every_part():
+    ranked = rank_resumes([resume("both", title="Java Spring"), resume("one", title="Java")],
+                          {"must_have": ["java/spring"]})
+    assert ids(ranked) == ["both", "one"]
+    assert ranked[1]["score"] == 0
+
+
+def test_accepts_search_items_and_empty_input():
+    assert rank_resumes([], {"must_have": ["python"]}) == []
+    ranked = rank_resumes([{"data": resume("a", title="Python")}], {"must_have": ["python"]})
+    assert ids(ranked) == ["a"] and ranked[0]["score"] > 0
@@ -0,0 +1,112 @@
+"""
+Неизменяемый индекс активных вакансий для главной страницы.
+
+Строится один раз на каждое обновление списка вакансий: нормализованные
+названия с триграммным индексом для строки поиска, корзины по городам и
+менеджерам, заранее отсортированные порядки (дата, название, отклики,
+непрочитанные отклики). Фильтрация и сортировка на каждом перезапуске
+скрипта — пересечения и маски над готовыми массивами позиций, без
+повторного прохода по всем вакансиям и без изменения исходного списка.
+"""
+import numpy as np
+
+SORT_KEYS = {
+    "published_at": (lambda v: v.get('published_at', ''), True),
+    "name": (lambda v: v.get('name', ''), False),
+    "responses": (lambda v: (v.get('counters') or {}).get('responses', 0), True),
+    "unread_responses": (lambda v: (v.get('counters') or {}).get('unread_responses', 0), True),
+}
+NGRAM = 3
+
+
+def normalize_name(name):
+    return " ".join((name or "").lower().replace("ё", "е").split())
+
+
+def _frozen(positions):
+    array = np.asarray(positions, dtype=np.intp)
+    array.flags.writeable = False
+    return array
+
+
+class VacancyIndex:
+    """
+    Все методы возвращают позиции (массивы индексов в исходном списке) или
+    вакансии по позициям; сам индекс и исходный список не изменяются.
+    """
+
+    def __init__(self, vacancies):
+        self._source = vacancies
+        self._vacancies = tuple(vacancies)
+        self._names = [normalize_name(v.get('name')) for v in self._vacancies]
+
+        ngrams = {}
+        for position, name in enumerate(self._names):
+            for ngram in {name[i:i + NGRAM] for i in range(len(name) - NGRAM + 1)}:
+                ngrams.setdefault(ngram, []).append(position)
+        self._ngrams = {ngram: _frozen(positions) for ngram, positions in ngrams.items()}
+
+        cities, managers = {}, {}
+        for position, vacancy in enumerate(self._vacancies):
+            city = (vacancy.get('area') or {}).get('name')
+            if city: cities.setdefault(city, []).append(position)
+            managers.setdefault((vacancy.get('manager') or {}).get('id'), []).append(position)
+        self._cities = {city: _frozen(positions) for city, positions in cities.items()}
+        self._managers = {manager_id: _frozen(positions) for manager_id, positions in managers.items()}
+        self.cities = tuple(sorted(self._cities))
+
+        # Устойчивая сортировка: при равных ключах сохраняется порядок загрузки
+        self._orders = {name: _frozen(sorted(range(len(self._vacancies)), key=lambda i: key(self._vacancies[i]), reverse=reverse))
+                        for name, (key, reverse) in SORT_KEYS.items()}
+        self.all = _frozen(np.arange(len(self._vacancies)))
+
+    def __len__(self):
+        return len(self._vacancies)
+
+    def built_from(self, vacancies):
+        """Построен ли индекс по этому же списку (список заменяется при обновлении)."""
+        return self._source is vacancies and len(vacancies) == len(self._vacancies)
+
+    def search(self, query):
+        """Позиции вакансий, в названии которых есть подстрока `query` (без учёта регистра)."""
+        query = normalize_name(query)
+        if not query: return self.all
+        if len(query) < NGRAM:
+            candidates = self.all
+        else:
+            postings = []
+            for i in range(len(query) - NGRAM + 1):
+                posting = self._ngrams.get(query[i:i + NGRAM])
+                if posting is None: return _frozen([])
+                postings.append(posting)
+            postings.sort(key=len)
+            candidates = postings[0]
+            for posting in postings[1:]:
+                candidates = np.intersect1d(candidates, posting, assume_unique=True)
+                if not len(candidates): break
+        # Триграммы дают кандидатов, подстроку проверяем точно
+        return _frozen([position for position in candidates.tolist() if query in self._names[position]])
+
+    def filter(self, query="", cities=()):
+        """Пересечение условий: подстрока в названии и (если заданы) города."""
+        positions = self.search(query)
+        if cities:
+            in_cities = np.concatenate([self._cities.get(city, _frozen([])) for city in cities])
+            positions = np.intersect1d(positions, in_cities)
+        return positions
+
+    def split_by_manager(self, positions, manager_id):
+        """Делит позиции на вакансии менеджера и остальные, сохраняя порядок."""
+        if manager_id is None: return positions[:0], positions
+        mine = np.isin(positions, self._managers.get(manager_id, _frozen([])))
+        return positions[mine], positions[~mine]
+
+    def sort(self, positions, sort_key):
+        """Позиции в порядке предрасчитанной сортировки `sort_key` (см. SORT_KEYS)."""
+        order = self._orders[sort_key]
+        keep = np.zeros(len(self._vacancies), dtype=bool)
+        keep[positions] = True
+        return order[keep[order]]
+
+    def vacancies(self, positions):
+        return [self._vacancies[position] for position in np.asarray(positions).tolist()]
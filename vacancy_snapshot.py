@@ -0,0 +1,152 @@
+"""
+Общий на сервер снимок активных вакансий работодателя.
+
+Один фоновый поток (VacancyRefresher) раз в VACANCY_REFRESH_INTERVAL секунд
+выгружает менеджеров и их активные вакансии (со счётчиками откликов) и
+применяет к текущему снимку разницу: новые, изменившиеся и закрытые вакансии.
+Страницы списков перепроверяются по ETag, так что неизменившиеся страницы
+hh.ru отдаёт ответом 304 без тела.
+Сессии только читают готовый снимок, поэтому нагрузка на hh.ru и время
+открытия главной страницы не зависят от числа рекрутеров.
+
+Снимки неизменяемы и версионированы: версия растёт только при реальных
+изменениях, неизменившиеся вакансии переиспользуются (те же объекты), а
+индекс для главной страницы (VacancyIndex) строится один раз на версию.
+"""
+import logging
+import os
+import threading
+from collections import namedtuple
+from datetime import datetime, timezone
+
+import hh_api_integration_v2 as hh
+from vacancy_index import VacancyIndex
+
+VACANCY_REFRESH_INTERVAL = int(os.getenv("VACANCY_REFRESH_INTERVAL", "300"))
+
+logger = logging.getLogger(__name__)
+
+VacancyDiff = namedtuple("VacancyDiff", ["added", "updated", "removed"])
+
+
+class VacancySnapshot:
+    """Неизменяемая версия списка вакансий и разница с предыдущей версией."""
+
+    def __init__(self, version=0, vacancies=(), fetched_at=None, diff=VacancyDiff((), (), ())):
+        self.version = version
+        self.vacancies = tuple(vacancies)
+        self.fetched_at = fetched_at
+        self.diff = diff
+        self._index = None
+        self._index_lock = threading.Lock()
+
+    @property
+    def index(self):
+        """VacancyIndex по этому снимку, общий для всех сессий."""
+        if self._index is None:
+            with self._index_lock:
+                if self._index is None: self._index = VacancyIndex(self.vacancies)
+        return self._index
+
+    def refreshed(self, fetched_at):
+        """Тот же список (и индекс) с новой отметкой времени — изменений не было."""
+        snapshot = VacancySnapshot(self.version, self.vacancies, fetched_at)
+        snapshot._index = self._index
+        return snapshot
+
+
+def diff_vacancies(previous, current):
+    """Разница между списками вакансий по id: добавленные, изменившиеся, удалённые."""
+    before = {v["id"]: v for v in previous}
+    after = {v["id"]: v for v in current}
+    return VacancyDiff(
+        added=tuple(vid for vid in after if vid not in before),
+        updated=tuple(vid for vid in after if vid in before and after[vid] != before[vid]),
+        removed=tuple(vid for vid in before if vid not in after))
+
+
+def apply_diff(snapshot, current, fetched_at):
+    """Новая версия снимка; если ничего не изменилось, версия и объекты вакансий сохраняются."""
+    diff = diff_vacancies(snapshot.vacancies, current)
+    if not any(diff): return snapshot.refreshed(fetched_at)
+    previous = {v["id"]: v for v in snapshot.vacancies}
+    changed = set(diff.added) | set(diff.updated)
+    vacancies = [v if v["id"] in changed else previous[v["id"]] for v in current]
+    return VacancySnapshot(snapshot.version + 1, vacancies, fetched_at, diff)
+
+
+def fetch_active_vacancies(employer_id="24761", page_cache=None):
+    """
+    Полная выгрузка активных вакансий; при любой ошибке бросает HHAPIError, а не отдаёт неполный список.
+    С `page_cache` страницы списков запрашиваются условно (If-None-Match) и на 304 берутся из него.
+    """
+    if not hh.get_client().access_token: raise hh.HHAPIError("Токен доступа ACCESS_TOKEN не найден.")
+    managers = hh.get_managers(employer_id, raise_errors=True, page_cache=page_cache)
+    return hh.get_active_vacancies([m['id'] for m in managers], employer_id, raise_errors=True, page_cache=page_cache)
+
+
+class VacancyRefresher:
+    """
+    Фоновое обновление снимка. Одновременные вызовы refresh() объединяются:
+    пока идёт выгрузка, остальные ждут её результат, а не запускают свою.
+    """
+
+    def __init__(self, employer_id="24761", interval=VACANCY_REFRESH_INTERVAL, fetch=None):
+        self.employer_id = employer_id
+        self.interval = interval
+        # ETag и JSON страниц списков между обновлениями: повторная выгрузка почти целиком из 304
+        self._page_cache = {}
+        self.fetch = fetch or (lambda employer_id: fetch_active_vacancies(employer_id, page_cache=self._page_cache))
+        self.last_error = None
+        self._snapshot = VacancySnapshot()
+        self._refresh_lock = threading.Lock()
+        self._ready = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+
+    @property
+    def snapshot(self):
+        return self._snapshot
+
+    def refresh(self):
+        """Обновляет снимок сейчас и возвращает его. Ошибка сохраняется в last_error, снимок остаётся прежним."""
+        fetched_before = self._snapshot.fetched_at
+        try:
+            with self._refresh_lock:
+                # Пока ждали блокировку, снимок мог обновить другой поток
+                if self._snapshot.fetched_at != fetched_before: return self._snapshot
+                try:
+                    current = self.fetch(self.employer_id)
+                except hh.HHAPIError as e:
+                    self.last_error = e
+                    logger.warning("Снимок вакансий не обновлён: %s", e)
+                    return self._snapshot
+                self.last_error = None
+                self._snapshot = apply_diff(self._snapshot, current, datetime.now(timezone.utc))
+                diff = self._snapshot.diff
+                if any(diff):
+                    logger.info("Снимок вакансий v%s: +%d ~%d -%d", self._snapshot.version,
+                                len(diff.added), len(diff.updated), len(diff.removed))
+                return self._snapshot
+        finally:
+            self._ready.set()
+
+    def wait_ready(self, timeout=None):
+        """Дожидается первой попытки выгрузки и возвращает текущий снимок."""
+        self._ready.wait(timeout)
+        return self._snapshot
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.refresh()
+            self._stop.wait(self.interval)
+
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="hh-vacancy-refresher", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()